@@ -0,0 +1,373 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from scripts.canonical import canonical_key
+from scripts.incremental import is_empty
+from scripts.llm import chat_completion
+from scripts.tracing import NULL_TRACER
+
+# Endpoint every request line targets (OpenAI Batch API input format)
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+POLL_INTERVAL = 60
+
+# Batch states after which no more results will arrive
+FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+class BulkPlan:
+    """
+    What one stage needs to fill its column in bulk mode: values known without
+    the AI (keyword rules, empty descriptions) and one request per distinct item
+    for the rest. parse(text) turns an answer into the column value and
+    failed(error) gives the value for items whose request failed.
+    """
+
+    def __init__(self, stage, column, parse, failed):
+        self.stage = stage
+        self.column = column
+        self.parse = parse
+        self.failed = failed
+        self.values = {}     # row label -> value
+        self.requests = {}   # custom_id -> request body
+        self.rows = {}       # row label -> custom_id
+
+    def add_request(self, row, key, body):
+        """Ask body for row; rows with the same key share one request"""
+        custom_id = f"{self.stage}-{hashlib.sha256(str(key).encode('utf-8')).hexdigest()[:24]}"
+        self.requests.setdefault(custom_id, body)
+        self.rows[row] = custom_id
+
+    def apply(self, df, results):
+        """
+        Write the known values and the parsed results ({custom_id: (text, error)},
+        see read_results) to df. Returns counts of requests, answered and failed.
+        """
+        answers = {}
+        failed = 0
+        for custom_id in self.requests:
+            text, error = results.get(custom_id, (None, "no result for this request"))
+            if text is None:
+                failed += 1
+                answers[custom_id] = self.failed(error)
+            else:
+                answers[custom_id] = self.parse(text)
+
+        values = dict(self.values)
+        values.update({row: answers[custom_id] for row, custom_id in self.rows.items()})
+        if self.column not in df.columns:
+            df[self.column] = ""
+        df[self.column] = df[self.column].astype(object)
+        if values:
+            df.loc[list(values), self.column] = list(values.values())
+        return {"requests": len(self.requests), "answered": len(self.requests) - failed, "failed": failed,
+                "rows": len(values)}
+
+
+def _column(df, name):
+    return df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+def _pending(df, skip_rows):
+    return df[~df.index.isin(skip_rows if skip_rows is not None else [])]
+
+
+def _needs_review(error):
+    return "Needs Review"
+
+
+def plan_categories(categorizer, df, skip_rows=None, preserve_existing=True):
+    """Categorization plan; items are grouped like categorize_item's answer reuse"""
+    plan = BulkPlan("categorization", "Product Category",
+                    lambda text: categorizer.parse_category(text.strip()) or "Needs Review", _needs_review)
+    rows = _pending(df, skip_rows)
+    if preserve_existing and plan.column in df.columns:
+        rows = rows[is_empty(rows[plan.column]).to_numpy()]
+
+    descriptions, vendors, subcategories = (_column(rows, name) for name in ("DESCRIPTION", "VENDOR_NAME", "SUBCATEGORY"))
+    rules = categorizer.match_keywords_vectorized(descriptions, subcategories)
+    for row, description, vendor, subcategory, rule in zip(rows.index, descriptions, vendors, subcategories, rules):
+        if rule is not None and not pd.isna(rule):
+            plan.values[row] = rule
+            continue
+        plan.add_request(row, canonical_key(description, vendor, subcategory), {
+            "model": categorizer.cascade.models[0],
+            "messages": categorizer.build_messages(description, vendor, subcategory),
+            "temperature": 0.0,
+            "max_tokens": 30,
+        })
+    return plan
+
+
+def plan_facility(classifier, df, skip_rows=None, category_col="Product Category"):
+    """Facility suitability plan; prompts include the categories already in df"""
+    plan = BulkPlan("facility", "Facility Suitability",
+                    lambda text: classifier.parse_facility_type(text.strip()) or "Needs Review", _needs_review)
+    rows = _pending(df, skip_rows)
+
+    descriptions, vendors, categories = (_column(rows, name) for name in ("DESCRIPTION", "VENDOR_NAME", category_col))
+    rules = classifier.match_keywords_vectorized(descriptions)
+    for row, description, vendor, category, rule in zip(rows.index, descriptions, vendors, categories, rules):
+        if rule is not None and not pd.isna(rule):
+            plan.values[row] = rule
+            continue
+        plan.add_request(row, canonical_key(description, vendor, category), {
+            "model": classifier.cascade.models[0],
+            "messages": classifier.build_messages(description, category, vendor),
+            "temperature": 0.1,
+            "max_tokens": 30,
+        })
+    return plan
+
+
+def _yes_no(text):
+    """Yes or No; anything unclear counts as No, like ask_electricity_usage"""
+    return "Yes" if text.strip().lower() == "yes" else "No"
+
+
+def plan_electricity(classifier, df, skip_rows=None, category_col="Product Category"):
+    """Electricity plan; identical prompts share one request"""
+    plan = BulkPlan("electricity", "Requires Electricity", _yes_no, _needs_review)
+    rows = _pending(df, skip_rows)
+
+    descriptions, categories = _column(rows, "DESCRIPTION"), _column(rows, category_col)
+    rules = classifier.match_electricity_keywords_vectorized(descriptions)
+    for row, description, category, rule in zip(rows.index, descriptions, categories, rules):
+        if rule is not None and not pd.isna(rule):
+            plan.values[row] = rule
+            continue
+        body = {
+            "model": classifier.electricity_model,
+            "messages": classifier.electricity_messages(description, category),
+            "temperature": 0.1,
+            "max_tokens": 10,
+        }
+        plan.add_request(row, json.dumps(body, sort_keys=True, default=str), body)
+    return plan
+
+
+def plan_descriptions(generator, df, skip_rows=None, limit=None):
+    """Simple description plan; rows past limit are left empty, as in describe_dataframe"""
+    plan = BulkPlan("descriptions", "SIMPLE_DESCRIPTION",
+                    lambda text: text.strip().strip('"\''),
+                    lambda error: f"Error generating description: {error}")
+    rows = _pending(df, skip_rows)
+    if limit is not None and limit < len(rows):
+        plan.values.update({row: "" for row in rows.index[limit:]})
+        rows = rows.iloc[:limit]
+
+    for row, item_data in zip(rows.index, rows.to_dict("records")):
+        description = item_data.get("DESCRIPTION", "")
+        if pd.isna(description) or description == "":
+            plan.values[row] = "No description available"
+            continue
+        body = {
+            "model": generator.model,
+            "messages": generator.build_messages(item_data),
+            "temperature": 0.3,
+            "max_tokens": 60,
+        }
+        plan.add_request(row, json.dumps(body, sort_keys=True, default=str), body)
+    return plan
+
+
+def request_lines(plans):
+    """The plans' requests as Batch API input lines"""
+    return [json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}) + "\n"
+            for plan in plans for custom_id, body in plan.requests.items()]
+
+
+def write_requests(path, plans):
+    """
+    Write the plans' requests as a Batch API input file. Returns False if the
+    file already held exactly these requests (its results still apply).
+    """
+    content = "".join(request_lines(plans))
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == content:
+                return False
+    with open(path, "w") as f:
+        f.write(content)
+    return True
+
+
+def read_results(path):
+    """
+    Answers from a Batch API output (or error) file as {custom_id: (text, None)},
+    or {custom_id: (None, error message)} for failed requests
+    """
+    results = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            body = response.get("body") or {}
+            error = record.get("error")
+            if error is None and response.get("status_code", 200) != 200:
+                error = body.get("error") or f"status {response.get('status_code')}"
+            if error is None:
+                try:
+                    results[record["custom_id"]] = (body["choices"][0]["message"]["content"], None)
+                    continue
+                except (KeyError, IndexError, TypeError):
+                    error = "no answer in the response"
+            message = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+            results[record["custom_id"]] = (None, message)
+    return results
+
+
+class LocalBatchRunner:
+    """
+    Runs a request file with ordinary chat completion calls and writes the
+    answers in the Batch API output format. A stand-in for the Batch API in
+    tests and for small jobs.
+    """
+
+    def __init__(self, client, tracer=None, max_workers=4):
+        self.client = client
+        self.tracer = tracer or NULL_TRACER
+        self.max_workers = max_workers
+
+    def _send(self, request):
+        custom_id = request["custom_id"]
+        try:
+            response = chat_completion(self.client, self.tracer, **request["body"])
+        except Exception as e:
+            return {"id": f"local-{custom_id}", "custom_id": custom_id, "response": None,
+                    "error": {"code": type(e).__name__, "message": str(e)}}
+        usage = getattr(response, "usage", None)
+        body = {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": response.choices[0].message.content}}],
+            "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens,
+                      "total_tokens": usage.total_tokens} if usage is not None else None,
+        }
+        return {"id": f"local-{custom_id}", "custom_id": custom_id,
+                "response": {"status_code": 200, "body": body}, "error": None}
+
+    def run(self, requests_path, results_path):
+        with open(requests_path) as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        print(f"   Running {len(requests)} requests from {requests_path} locally...")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            records = list(pool.map(self._send, requests))
+        with open(results_path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        return results_path
+
+
+class OpenAIBatchRunner:
+    """
+    Submits a request file to the OpenAI Batch API, waits for it to finish and
+    downloads the results (answers and errors) to results_path
+    """
+
+    def __init__(self, client, poll_interval=POLL_INTERVAL, completion_window=COMPLETION_WINDOW):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    def run(self, requests_path, results_path):
+        with open(requests_path, "rb") as f:
+            upload = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=upload.id, endpoint=BATCH_ENDPOINT,
+                                           completion_window=self.completion_window)
+        print(f"   Submitted batch {batch.id} for {requests_path}")
+        while batch.status not in FINAL_STATES:
+            time.sleep(self.poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+            counts = batch.request_counts
+            if counts is not None:
+                print(f"   Batch {batch.id}: {batch.status}, {counts.completed}/{counts.total} done, {counts.failed} failed")
+
+        # Expired and cancelled batches still return the requests that finished
+        files = [file_id for file_id in (batch.output_file_id, batch.error_file_id) if file_id]
+        if not files:
+            raise RuntimeError(f"Batch {batch.id} {batch.status} without results")
+        with open(results_path, "w") as f:
+            for file_id in files:
+                text = self.client.files.content(file_id).text
+                f.write(text if text.endswith("\n") else text + "\n")
+        return results_path
+
+
+# Ways to get a results file for a request file; "manual" leaves submission to the user
+BATCH_RUNNERS = {"local": LocalBatchRunner, "openai": OpenAIBatchRunner}
+
+
+def get_runner(name, client, tracer=None):
+    """Runner for a name in BATCH_RUNNERS, or None for "manual" """
+    if name == "manual":
+        return None
+    if name not in BATCH_RUNNERS:
+        raise ValueError(f"Unknown batch runner: {name} (use manual, {', '.join(BATCH_RUNNERS)})")
+    if name == "local":
+        return LocalBatchRunner(client, tracer=tracer)
+    return OpenAIBatchRunner(client)
+
+
+def run_bulk(df, categorizer, classifier=None, electricity_classifier=None, description_generator=None,
+             reused=None, settings=None, runner=None, work_dir=".", name="bulk"):
+    """
+    Fill the enabled stages from request and result files instead of one call
+    per item. Categorization and descriptions go in round 1; facility and
+    electricity, whose prompts include the category, in round 2. Each round
+    writes <work_dir>/<name>_round<N>_requests.jsonl and reads
+    <name>_round<N>_results.jsonl: an existing results file is used as it is
+    (so a manual or interrupted run resumes), otherwise runner produces it.
+    Without a runner the run stops at the first round that has no results yet.
+
+    Returns (df, report) with report["status"] "completed" or "waiting" (then
+    report["pending"] is the request file to submit) and per stage counts.
+    """
+    reused = reused or {}
+    settings = settings or {}
+
+    def option(stage, key, default):
+        return settings.get(stage, {}).get(key, default)
+
+    rounds = [
+        lambda: [plan_categories(categorizer, df, reused.get("Product Category"),
+                                 option("categorization", "preserve_existing", True))]
+                + ([plan_descriptions(description_generator, df, reused.get("SIMPLE_DESCRIPTION"),
+                                      option("descriptions", "limit", None))] if description_generator else []),
+        lambda: ([plan_facility(classifier, df, reused.get("Facility Suitability"))] if classifier else [])
+                + ([plan_electricity(electricity_classifier, df, reused.get("Requires Electricity"))]
+                   if electricity_classifier else []),
+    ]
+
+    os.makedirs(work_dir, exist_ok=True)
+    report = {"status": "completed", "stages": {}, "requests": 0}
+    for number, build in enumerate(rounds, start=1):
+        plans = build()
+        if not plans:
+            continue
+        results = {}
+        if any(plan.requests for plan in plans):
+            requests_path = os.path.join(work_dir, f"{name}_round{number}_requests.jsonl")
+            results_path = os.path.join(work_dir, f"{name}_round{number}_results.jsonl")
+            changed = write_requests(requests_path, plans)
+            if changed and os.path.exists(results_path):
+                # Results of a different input or different options
+                os.replace(results_path, results_path + ".stale")
+                print(f"   Requests changed; previous results moved to {results_path}.stale")
+            count = sum(len(plan.requests) for plan in plans)
+            report["requests"] += count
+            print(f"   Round {number} ({', '.join(plan.stage for plan in plans)}): {count} requests in {requests_path}")
+            if not os.path.exists(results_path):
+                if runner is None:
+                    report.update(status="waiting", pending=requests_path, results=results_path)
+                    return df, report
+                runner.run(requests_path, results_path)
+            results = read_results(results_path)
+        for plan in plans:
+            report["stages"][plan.stage] = plan.apply(df, results)
+    return df, report
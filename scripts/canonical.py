@@ -0,0 +1,116 @@
+import re
+
+import pandas as pd
+
+# Unit spellings and their canonical abbreviation
+UNIT_ALIASES = {
+    "ml": "ml", "mls": "ml", "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml", "cc": "ml",
+    "l": "l", "ltr": "l", "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "mcg": "mcg", "ug": "mcg", "microgram": "mcg", "micrograms": "mcg",
+    "mg": "mg", "milligram": "mg", "milligrams": "mg",
+    "g": "g", "gm": "g", "gms": "g", "gr": "g", "gram": "g", "grams": "g",
+    "kg": "kg", "kilogram": "kg", "kilograms": "kg",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "mm": "mm", "cm": "cm",
+    "in": "in", "inch": "in", "inches": "in",
+    "ft": "ft", "feet": "ft", "foot": "ft",
+    "fr": "fr", "french": "fr",
+    "ga": "ga", "gauge": "ga",
+    "ct": "ct", "count": "ct",
+    "ea": "ea", "each": "ea",
+}
+
+# Pack containers and their canonical abbreviation
+PACK_ALIASES = {
+    "bx": "bx", "box": "bx", "boxes": "bx",
+    "cs": "cs", "case": "cs", "cases": "cs",
+    "pk": "pk", "pack": "pk", "packs": "pk", "pkg": "pk", "package": "pk",
+    "bg": "bg", "bag": "bg", "bags": "bg",
+    "rl": "rl", "roll": "rl", "rolls": "rl",
+    "dz": "dz", "dozen": "dz",
+    "tray": "tray", "trays": "tray",
+}
+
+# Corporate suffixes dropped from vendor names
+VENDOR_SUFFIXES = {"inc", "incorporated", "llc", "corp", "corporation", "co", "company", "ltd", "limited", "lp", "plc"}
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_UNIT_RE = re.compile(rf"{_NUMBER}\s*({'|'.join(sorted(UNIT_ALIASES, key=len, reverse=True))})\b")
+# A separate "in" followed by these is the word, as in "3 in 1" or "12 in a box"
+_IN_WORD_RE = re.compile(r"\s+(?:1|a|an|one|each)\b")
+_PACKS = "|".join(sorted(PACK_ALIASES, key=len, reverse=True))
+_PACK_FIRST_RE = re.compile(rf"\b({_PACKS})\s*(?:/|of)\s*(\d+)\b")
+_PACK_LAST_RE = re.compile(rf"\b(\d+)\s*(?:/|per)\s*({_PACKS})\b")
+_DIMENSION_RE = re.compile(r"(\d)\s*x\s*(?=\d)")
+_LEADING_POINT_RE = re.compile(r"(?<!\d)\.(\d)")
+_PUNCTUATION_RE = re.compile(r"[^\w\s/.%]|_|(?<!\d)\.|\.(?!\d)")
+_SLASH_RE = re.compile(r"\s*/\s*")
+
+
+def _number(text):
+    """"10.0" -> "10", "0.50" -> "0.5" """
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return text
+
+
+def _unit(match):
+    """A number and unit in canonical form; "in" that is the word, not inches, is kept"""
+    number, unit = match.group(1), match.group(2)
+    if unit == "in" and match.group(0) != number + unit and _IN_WORD_RE.match(match.string, match.end()):
+        return match.group(0)
+    return _number(number) + UNIT_ALIASES[unit]
+
+
+def canonical_text(text):
+    """
+    Canonical form of a description: lower case, punctuation removed, units and
+    pack sizes spelled one way ("10 ML" and "10ml" -> "10ml", "BX/100" and
+    "100 per box" -> "100/bx") and single spaces. Missing values become "".
+    """
+    if text is None or pd.isna(text):
+        return ""
+    text = str(text).lower()
+    text = _LEADING_POINT_RE.sub(r"0.\1", text)
+    text = _PUNCTUATION_RE.sub(" ", text)
+    text = _SLASH_RE.sub("/", text)
+    text = _DIMENSION_RE.sub(r"\1x", text)
+    text = _UNIT_RE.sub(_unit, text)
+    text = _PACK_FIRST_RE.sub(lambda m: f"{m.group(2)}/{PACK_ALIASES[m.group(1)]}", text)
+    text = _PACK_LAST_RE.sub(lambda m: f"{m.group(1)}/{PACK_ALIASES[m.group(2)]}", text)
+    return " ".join(text.split())
+
+
+def canonical_texts(series):
+    """canonical_text for a whole column; each distinct value is converted once"""
+    codes, uniques = pd.factorize(series)
+    canonical = pd.Series([canonical_text(value) for value in uniques] + [""], dtype=object)
+    # Missing values have code -1, which picks the trailing ""
+    return pd.Series(canonical.to_numpy()[codes], index=series.index, dtype=object)
+
+
+def canonical_vendor(name):
+    """Canonical vendor name: canonical text without corporate suffixes ("Acme, Inc." -> "acme")"""
+    words = canonical_text(name).replace("/", " ").split()
+    while len(words) > 1 and words[-1] in VENDOR_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def canonical_key(description, vendor_name=None, *extra):
+    """
+    Key under which two items count as the same product: the canonical description
+    and vendor, plus any extra context (e.g. subcategory) in canonical form
+    """
+    parts = [canonical_text(description), canonical_vendor(vendor_name)]
+    parts.extend(canonical_text(value) for value in extra)
+    return "|".join(parts)
+
+
+def canonical_keys(df, description_col="DESCRIPTION", vendor_col="VENDOR_NAME"):
+    """canonical_key for every row of df as a Series"""
+    descriptions = df[description_col] if description_col in df.columns else pd.Series("", index=df.index)
+    vendors = df[vendor_col] if vendor_col in df.columns else pd.Series("", index=df.index)
+    return pd.Series([canonical_key(description, vendor) for description, vendor in zip(descriptions, vendors)],
+                     index=df.index, dtype=object)
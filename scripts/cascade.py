@@ -0,0 +1,110 @@
+import math
+import threading
+
+from scripts.llm import chat_completion, CircuitOpenError
+from scripts.tracing import NULL_TRACER
+
+# Models tried per stage, cheapest first. A single-model list disables escalation.
+DEFAULT_STAGE_MODELS = {
+    "categorization": ["gpt-3.5-turbo"],
+    "facility": ["gpt-3.5-turbo", "gpt-4"],
+}
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.8
+
+
+def answer_confidence(response):
+    """
+    Probability the model assigned to the answer it produced, computed from the
+    token logprobs (exp of their sum). Returns None when logprobs are unavailable.
+    """
+    try:
+        tokens = response.choices[0].logprobs.content
+    except (AttributeError, IndexError):
+        return None
+    if not tokens:
+        return None
+    return math.exp(sum(token.logprob for token in tokens))
+
+
+class ModelCascade:
+    """
+    Asks a list of models from cheapest to strongest and stops at the first answer
+    that passes validation with enough confidence. The last model's validated
+    answer is always accepted.
+    """
+
+    def __init__(self, models, confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD, escalate_on=("Needs Review",)):
+        if not models:
+            raise ValueError("A model cascade needs at least one model.")
+        self.models = list(models)
+        self.confidence_threshold = confidence_threshold
+        self.escalate_on = set(escalate_on)
+
+        # Per-model counters so runs can report how often the cheap model was enough;
+        # stage and worker threads share one cascade
+        self.answered = {model: 0 for model in self.models}
+        self.escalated = {model: 0 for model in self.models}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_stage(cls, stage, use_cascade=True, confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD):
+        """Default cascade for a stage, or just its strongest model if use_cascade is False"""
+        models = DEFAULT_STAGE_MODELS[stage]
+        if not use_cascade:
+            models = models[-1:]
+        return cls(models, confidence_threshold=confidence_threshold)
+
+    @classmethod
+    def from_string(cls, models, confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD):
+        """Build a cascade from a comma-separated model list, e.g. "gpt-3.5-turbo,gpt-4" """
+        return cls([model.strip() for model in models.split(",") if model.strip()],
+                   confidence_threshold=confidence_threshold)
+
+    def run(self, client, messages, validate, tracer=None, **params):
+        """
+        Send the messages to each model in turn. validate(text) must return the
+        cleaned answer, or None if the response is not a valid label.
+        Returns the accepted answer, or None if even the last model's answer was invalid.
+        """
+        tracer = tracer or NULL_TRACER
+        for level, model in enumerate(self.models):
+            last = level == len(self.models) - 1
+            with tracer.span("cascade_step", category="llm", model=model, level=level) as attrs:
+                request = dict(params, model=model, messages=messages)
+                if not last:
+                    request["logprobs"] = True
+                try:
+                    response = chat_completion(client, tracer, **request)
+                except Exception as e:
+                    # A stronger model cannot help while requests are not being sent at all
+                    if last or isinstance(e, CircuitOpenError):
+                        raise
+                    print(f"Model {model} failed ({e}), escalating")
+                    attrs["accepted"] = False
+                    self._count(self.escalated, model)
+                    continue
+
+                answer = validate(response.choices[0].message.content.strip())
+                confidence = answer_confidence(response)
+                attrs["confidence"] = confidence
+
+                # Unknown confidence (no logprobs returned) is not treated as low confidence
+                confident = confidence is None or confidence >= self.confidence_threshold
+                accepted = last or (answer is not None and answer not in self.escalate_on and confident)
+                attrs["accepted"] = accepted
+                if accepted:
+                    self._count(self.answered, model)
+                    return answer
+                self._count(self.escalated, model)
+        return None
+
+    def _count(self, counter, model):
+        with self._lock:
+            counter[model] += 1
+
+    def stats(self):
+        """Answers accepted and escalations per model"""
+        with self._lock:
+            return {model: {"answered": self.answered[model], "escalated": self.escalated[model]}
+                    for model in self.models}
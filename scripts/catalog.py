@@ -0,0 +1,176 @@
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.incremental import OUTPUT_COLUMNS, normalized_text, item_keys, content_hash, fill_matches, is_empty
+
+DEFAULT_CATALOG_PATH = os.getenv("ITEM_CATALOG_PATH", "item_catalog.db")
+
+# Catalog table column for each pipeline output column
+CATALOG_COLUMNS = {
+    "Product Category": "product_category",
+    "Facility Suitability": "facility_suitability",
+    "Requires Electricity": "requires_electricity",
+    "SIMPLE_DESCRIPTION": "simple_description",
+}
+
+# Answers that mean "not decided yet" and are not worth remembering
+UNSETTLED_VALUES = {"Needs Review", "Invalid item data", "Failed to generate description after multiple attempts"}
+UNSETTLED_PREFIX = "Error generating description"
+
+
+class ItemCatalog:
+    """
+    Persistent SQLite store of the latest results for every item any job has
+    processed, shared across jobs and users. Items are matched by ITEM_NO (or
+    VEND_CAT_NUM when ITEM_NO is missing) plus the same content hash used for
+    baseline reuse, so an item whose description or vendor changed is
+    classified again. A read-only catalog opens an existing database without
+    creating or changing anything.
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self._write_lock = threading.Lock()
+        if read_only:
+            return
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = ", ".join(f"{name} TEXT" for name in CATALOG_COLUMNS.values())
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS items (
+                    item_no TEXT NOT NULL,
+                    vend_cat_num TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    {columns},
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (item_no, vend_cat_num, content_hash)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_items_item_no ON items (item_no)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_items_vend_cat_num ON items (vend_cat_num)")
+
+    def _connect(self):
+        # One short-lived connection per call keeps the catalog safe to share between job threads
+        if self.read_only:
+            uri = f"file:{urllib.parse.quote(os.path.abspath(self.path))}?mode=ro"
+            return sqlite3.connect(uri, uri=True, timeout=30)
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _keys(self, df):
+        """Lookup keys for every row of df"""
+        vend_cat_num = normalized_text(df["VEND_CAT_NUM"]) if "VEND_CAT_NUM" in df.columns else pd.Series("", index=df.index)
+        return pd.DataFrame({
+            "item_no": item_keys(df),
+            "vend_cat_num": vend_cat_num,
+            "content_hash": content_hash(df).astype(str),
+        }, index=df.index)
+
+    def lookup(self, df, output_columns=OUTPUT_COLUMNS):
+        """
+        Fill empty output cells of df from the catalog with one bulk query.
+        Returns {output column: Index of rows filled}, in the same form as apply_baseline.
+        """
+        columns = [column for column in output_columns if column in CATALOG_COLUMNS]
+        if not columns or df.empty:
+            return {}
+
+        keys = self._keys(df)
+        keys = keys[(keys["item_no"] != "") | (keys["vend_cat_num"] != "")]
+        selected = ", ".join(f"i.{CATALOG_COLUMNS[column]} AS \"{column}\"" for column in columns)
+
+        with self._connect() as conn:
+            conn.execute("CREATE TEMP TABLE lookup (row_id INTEGER, item_no TEXT, vend_cat_num TEXT, content_hash TEXT)")
+            conn.executemany(
+                "INSERT INTO lookup VALUES (?, ?, ?, ?)",
+                zip(range(len(keys)), keys["item_no"], keys["vend_cat_num"], keys["content_hash"])
+            )
+            # Match on ITEM_NO where present, otherwise on VEND_CAT_NUM; both use their index
+            matched = pd.read_sql_query(f"""
+                SELECT l.row_id, i.updated_at, {selected}
+                FROM lookup l JOIN items i ON i.item_no = l.item_no AND i.content_hash = l.content_hash
+                WHERE l.item_no != ''
+                UNION ALL
+                SELECT l.row_id, i.updated_at, {selected}
+                FROM lookup l JOIN items i ON i.vend_cat_num = l.vend_cat_num AND i.content_hash = l.content_hash
+                WHERE l.item_no = '' AND l.vend_cat_num != ''
+                ORDER BY updated_at
+            """, conn)
+            conn.execute("DROP TABLE lookup")
+
+        # Latest entry wins when several catalog rows match the same item
+        matched = matched.drop_duplicates(subset="row_id", keep="last")
+        matched.index = keys.index[matched["row_id"].to_numpy()]
+        return fill_matches(df, matched, columns)
+
+    def record(self, df, output_columns=OUTPUT_COLUMNS):
+        """
+        Store the results in df as the latest values for its items. Empty and
+        undecided values never replace a value already in the catalog.
+        Returns the number of rows written.
+        """
+        columns = [column for column in output_columns if column in df.columns and column in CATALOG_COLUMNS]
+        if not columns or df.empty or "ITEM_NO" not in df.columns:
+            return 0
+
+        keys = self._keys(df)
+        values = {}
+        for column in columns:
+            series = df[column].astype(object)
+            settled = (~is_empty(series) & ~series.isin(UNSETTLED_VALUES)
+                       & ~series.astype(str).str.startswith(UNSETTLED_PREFIX))
+            values[column] = series.where(settled, None)
+        values = pd.DataFrame(values, index=df.index)
+
+        keep = ((keys["item_no"] != "") | (keys["vend_cat_num"] != "")) & values.notna().any(axis=1)
+        keys, values = keys[keep], values[keep]
+        if keys.empty:
+            return 0
+
+        names = [CATALOG_COLUMNS[column] for column in columns]
+        updates = ", ".join(f"{name} = COALESCE(excluded.{name}, {name})" for name in names)
+        now = time.time()
+        rows = [
+            (*key, *[None if pd.isna(v) else str(v) for v in row], now)
+            for key, row in zip(keys.itertuples(index=False, name=None), values.itertuples(index=False, name=None))
+        ]
+        with self._write_lock, self._connect() as conn:
+            conn.executemany(f"""
+                INSERT INTO items (item_no, vend_cat_num, content_hash, {", ".join(names)}, updated_at)
+                VALUES ({", ".join("?" * (len(names) + 4))})
+                ON CONFLICT (item_no, vend_cat_num, content_hash)
+                DO UPDATE SET {updates}, updated_at = excluded.updated_at
+            """, rows)
+        return len(rows)
+
+    def import_csv(self, path):
+        """Seed the catalog from a processed CSV file"""
+        return self.record(pd.read_csv(path))
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the shared item catalog from processed CSV files")
+    parser.add_argument("files", nargs="+", help="Processed CSV files (outputs of earlier runs)")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH, help="Catalog database (default: %(default)s)")
+    args = parser.parse_args()
+
+    catalog = ItemCatalog(args.catalog)
+    for path in args.files:
+        print(f"Importing {path}: {catalog.import_csv(path)} items")
+    print(f"Catalog {args.catalog} now holds {catalog.count()} items")
+
+
+if __name__ == "__main__":
+    main()
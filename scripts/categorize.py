@@ -1,21 +1,23 @@
 import pandas as pd
 import os 
-from openai import OpenAI
+import sys
 import time
-from dotenv import load_dotenv
 
-#load env variables 
-load_dotenv() 
-
-#get openai api key from env variable
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.canonical import canonical_text, canonical_texts, canonical_key
+from scripts.cascade import ModelCascade
+from scripts.clients import get_client
+from scripts.tracing import NULL_TRACER
 
 class MedicalInventoryCategorizer:
-    def __init__(self, client = None): 
+    def __init__(self, client = None, tracer = None, cascade = None): 
         """Intialize the categorizer with OpenAI client"""
-        self.client = client or globals().gt('client')
-        if not self.client:
-            raise ValueError("OpenAI client is not initialized. Please provide a valid client.")
+        #shared pooled client unless one is given, created on first AI call
+        self._client = client
+        self.tracer = tracer or NULL_TRACER
+
+        #models to ask, cheapest first (see scripts/cascade.py)
+        self.cascade = cascade or ModelCascade.for_stage("categorization")
         
         #define medical product categories
         self.categories = [
@@ -84,43 +86,74 @@ class MedicalInventoryCategorizer:
             "reagent": "Diagnostics & Lab Use",
             "diagnostic": "Diagnostics & Lab Use"
         }
-    def categorize_item(self, description, vendor_name = None, subcategory = None):
+
+        #keywords in canonical form, matched against canonical descriptions
+        self.canonical_mapping = {canonical_text(keyword): category for keyword, category in self.category_mapping.items()}
+
+        #AI answers by canonical item key, so descriptions that differ only in spelling are asked once
+        self.answers = {}
+        self.reused_answers = 0
+
+    def match_keywords(self, description, subcategory = None):
         """
-        Determine category based on item description and other metadata 
-        First tries direct keyword matching, then falls back to OpenAI API
+        Keyword rules only: returns a category, or None if no rule matches
+        and the item needs an AI classification
         """
 
         if pd.isna(description) or description == "":
             return "Uncategorized" 
         
-        # convert to lowercase
-        desc_lower = description.lower() 
+        # canonical form: lowercase, no punctuation, units spelled one way
+        desc_lower = canonical_text(description)
 
         # Check for direct keyword mapping
-        for keyword, category in self.category_mapping.items():
+        for keyword, category in self.canonical_mapping.items():
             if keyword in desc_lower:
                 return category 
         
         #if subcategory is provided, use it as a hint
         if subcategory and not pd.isna(subcategory):
-            sub_lower = subcategory.lower()
-            for keyword, category in self.category_mapping.items():
+            sub_lower = canonical_text(subcategory)
+            for keyword, category in self.canonical_mapping.items():
                 if keyword in sub_lower:
                     return category
-        
-        # if not match found, use OpenAI to categorize 
-        try:
-            #combine description and vendor info 
-            context = f"Description: {description}"
-            if vendor_name and not pd.isna(vendor_name):
-                context += f", Vendor: {vendor_name}"
-            if subcategory and not pd.isna(subcategory):
-                context += f", Subcategory: {subcategory}"
-
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages = [
-                    {"role": "system", "content": f"""You are a helpful assistant that categorizes medical inventory items. 
+        return None
+
+    def match_keywords_vectorized(self, descriptions, subcategories = None):
+        """
+        Keyword rules for a whole DESCRIPTION column at once (see match_keywords).
+        Returns a Series of categories, with None where an AI answer is needed.
+        """
+        result = self._first_keyword(canonical_texts(descriptions))
+        if subcategories is not None:
+            #subcategory is only a hint for descriptions without a keyword
+            hints = self._first_keyword(canonical_texts(subcategories))
+            result = result.where(result.notna(), hints)
+        result[descriptions.isna() | (descriptions.astype(str) == "")] = "Uncategorized"
+        return result
+
+    def _first_keyword(self, texts):
+        """Category of the first keyword (in mapping order) found in each canonical text, or None"""
+        #each distinct text is matched once
+        codes, uniques = pd.factorize(texts)
+        uniques = pd.Series(uniques, dtype=object)
+        found = pd.Series(None, index=uniques.index, dtype=object)
+        #later keywords are overwritten by earlier ones
+        for keyword, category in reversed(list(self.canonical_mapping.items())):
+            found[uniques.str.contains(keyword, regex=False)] = category
+        return pd.Series(found.to_numpy()[codes], index=texts.index, dtype=object)
+
+    def build_messages(self, description, vendor_name = None, subcategory = None):
+        """Chat messages asking the AI for the category of one item"""
+        #combine description and vendor info 
+        context = f"Description: {description}"
+        if vendor_name and not pd.isna(vendor_name):
+            context += f", Vendor: {vendor_name}"
+        if subcategory and not pd.isna(subcategory):
+            context += f", Subcategory: {subcategory}"
+
+        return [
+            {"role": "system", "content": f"""You are a helpful assistant that categorizes medical inventory items. 
                      Respond with a single category name that best fits the item.
                      Choose ONLY from these categories:
                      1. Medical Equipment & Furniture – Durable items such as exam tables, surgical lights, and patient chairs.
@@ -130,96 +163,157 @@ class MedicalInventoryCategorizer:
                      5. Diagnostics & Lab Use – Items used for monitoring, testing, or sample handling.
                      
                      Respond ONLY with the category name, nothing else."""},
-                     {"role": "user", "content": context}
-                ],
+            {"role": "user", "content": context}
+        ]
+
+    def categorize_item(self, description, vendor_name = None, subcategory = None):
+        """
+        Determine category based on item description and other metadata 
+        First tries direct keyword matching, then falls back to OpenAI API
+        """
+
+        category = self.match_keywords(description, subcategory)
+        if category:
+            return category
+
+        #reuse the answer for an item with the same canonical description
+        key = canonical_key(description, vendor_name, subcategory)
+        if key in self.answers:
+            self.reused_answers += 1
+            return self.answers[key]
+        
+        # if not match found, use OpenAI to categorize 
+        try:
+            category = self.cascade.run(
+                self.client,
+                messages = self.build_messages(description, vendor_name, subcategory),
+                validate = self.parse_category,
+                tracer = self.tracer,
                 max_tokens = 30, 
                 temperature = 0.0,                 
                      
             )
-            category = response.choices[0].message.content.strip()
-
-            #clean up response 
-            if ":" in category:
-                category = category.split(":")[1].strip()
-
-            # validate response is one of our categories
-            if category not in self.categories:
-                #find closest match
-                for valid_category in self.categories:
-                    if valid_category.lower() in category.lower():
-                        return valid_category
-                #if still no match, return "needs review"
-                return "Needs Review"
 
+            #if still no match, return "needs review"
+            category = category or "Needs Review"
+            self.answers[key] = category
             return category
         
         except Exception as e:
             print(f"Error categorizing item: {e}")
             return "Needs Review"
+
+    def parse_category(self, category):
+        """Clean up a model response, returning one of self.categories or None if it isn't one"""
+        #clean up response 
+        if ":" in category:
+            category = category.split(":")[1].strip()
+
+        # validate response is one of our categories
+        if category not in self.categories:
+            #find closest match
+            for valid_category in self.categories:
+                if valid_category.lower() in category.lower():
+                    return valid_category
+            return None
+
+        return category
     
-    def process_csv(self, input_file, output_file = None, batch_size = 50, preserve_existing = True):
+    @property
+    def client(self):
+        """OpenAI client; keyword-only work such as a dry run needs no API key"""
+        return self._client or get_client()
+
+    def categorize_dataframe(self, df, batch_size = 50, preserve_existing = True, pause = 10, progress_callback = None,
+                             skip_rows = None, row_callback = None):
         """
-        Process the CSV file, categorize items, and save results
+        Categorize the items of an in-memory DataFrame, adding or filling the
+        "Product Category" column. Items are processed in batches of batch_size with a
+        pause of `pause` seconds between batches to avoid rate limiting.
+        progress_callback(count, total) is called after every categorized item, and
+        row_callback(index) with the row it categorized.
+        Rows listed in skip_rows (e.g. reused from a previous run) are left untouched.
         """
+        category_col = "Product Category"
+        skip = df.index.isin(skip_rows if skip_rows is not None else [])
 
-        try:
-            if not output_file:
-                base_name = os.path.splittext(input_file)[0]
-                output_file = f"{base_name}_categorized.csv"
-            
-            #read csv file
-            print(f"Reading file: {input_file}")
-            df = pd.read_csv(input_file)
-            print(f"DataFrame shape: {df.shape}")
-
+        with self.tracer.span("stage", stage="categorization", rows=len(df)) as stage_attrs:
             #check if product category exists
-            category_col = "Product Category"
-            has_category = category_col in df.columns
-
-            if not has_category:
+            if category_col not in df.columns:
                 df[category_col] = ""
             elif preserve_existing:
                 #fill only empty categories if preserve_existing is True
                 print(f"Preserving {df[category_col].notna().sum()} existing categories")
-            else:
+            df[category_col] = df[category_col].astype(object)
+            if not preserve_existing:
                 #clear all categories if preserve_existing is False
-                df[category_col] = ""
-            
-            #count items that need categorization
-            items_to_categorize = df[df[category_col].isna() | (df[category_col] == "")].shape[0]
+                df.loc[~skip, category_col] = ""
+
+            #find items that need categorization
+            pending = df.index[~skip & (df[category_col].isna() | (df[category_col] == ""))].tolist()
+            items_to_categorize = len(pending)
+            stage_attrs["items"] = items_to_categorize
             print(f"Items to categorize: {items_to_categorize}")
 
             #process data in batches to avoid rate limiting
-            count = 0 
-            for i in range(0, len(df)):
-                #skip if category exists and we're preserving existing values
-                if preserve_existing and df.loc[i, category_col] and not pd.isna(df.loc[i, category_col]):
-                    continue
+            count = 0
+            for batch_start in range(0, items_to_categorize, batch_size):
+                batch = pending[batch_start:batch_start + batch_size]
+                with self.tracer.span("batch", stage="categorization", batch=batch_start // batch_size, rows=len(batch)):
+                    for i in batch:
+                        self.tracer.set_context(row=i)
 
-                # get item description and other relevent fields
-                description = df.loc[i, "DESCRIPTION"] if "DESCRIPTION" in df.columns else ""
-                vendor_name = df.loc[i, "VENDOR_NAME"] if "VENDOR_NAME" in df.columns else None
-                subcategory = df.loc[i, "SUBCATEGORY"] if "SUBCATEGORY" in df.columns else None
+                        # get item description and other relevent fields
+                        description = df.loc[i, "DESCRIPTION"] if "DESCRIPTION" in df.columns else ""
+                        vendor_name = df.loc[i, "VENDOR_NAME"] if "VENDOR_NAME" in df.columns else None
+                        subcategory = df.loc[i, "SUBCATEGORY"] if "SUBCATEGORY" in df.columns else None
 
-                #categorize the item
-                category = self.categorize_item(description, vendor_name, subcategory)
-                df.loc[i, category_col] = category
+                        #categorize the item
+                        category = self.categorize_item(description, vendor_name, subcategory)
+                        df.loc[i, category_col] = category
 
-                count += 1 
-                if count % 10 == 0:
-                    print(f"Processed {count}/{items_to_categorize} items")
+                        count += 1
+                        if progress_callback:
+                            progress_callback(count, items_to_categorize)
+                        if row_callback:
+                            row_callback(i)
+                        if count % 10 == 0:
+                            print(f"Processed {count}/{items_to_categorize} items")
+                    self.tracer.clear_context("row")
 
-                if count % batch_size == 0 and count < items_to_categorize:
-                    print(f"Pausing for 10 seconds to avoid rate limiting...")
-                    time.sleep(10)
+                if pause and count < items_to_categorize:
+                    print(f"Pausing for {pause} seconds to avoid rate limiting...")
+                    with self.tracer.span("rate_limit_sleep", stage="categorization", seconds=pause):
+                        time.sleep(pause)
+
+        return df
+
+    def process_csv(self, input_file, output_file = None, batch_size = 50, preserve_existing = True):
+        """
+        Process the CSV file, categorize items, and save results
+        """
+
+        try:
+            if not output_file:
+                base_name = os.path.splitext(input_file)[0]
+                output_file = f"{base_name}_categorized.csv"
+            
+            #read csv file
+            print(f"Reading file: {input_file}")
+            with self.tracer.span("read", path=input_file):
+                df = pd.read_csv(input_file)
+            print(f"DataFrame shape: {df.shape}")
+
+            df = self.categorize_dataframe(df, batch_size=batch_size, preserve_existing=preserve_existing)
 
             #save results
             print(f"Saving results to {output_file}")
-            df.to_csv(output_file, index = False)
+            with self.tracer.span("write", path=output_file):
+                df.to_csv(output_file, index = False)
             print(f"CSV processing completed successfully.")
 
             #print category distribution
-            category_counts = df[category_col].value_counts()
+            category_counts = df["Product Category"].value_counts()
             print("\nProduct Category Distribution:")
             for category, count in category_counts.items():
                 print(f"{category}: {count}")
@@ -236,8 +330,9 @@ def main():
     output_file = "inventory/Quarterly DC cleanout Dec 3 2024_categorized.csv"
 
     #check api key is set 
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    try:
+        client = get_client()
+    except ValueError:
         print("OPENAI_API_KEY is not set. Please set it in the .env file.")
         return
 
@@ -0,0 +1,61 @@
+import os
+import threading
+
+# HTTP connection pool shared by every classifier and job in a process
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 64))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 32))
+KEEPALIVE_EXPIRY = 120  # seconds an idle connection is kept open
+REQUEST_TIMEOUT = 60
+CONNECT_TIMEOUT = 10
+MAX_RETRIES = 2
+
+_lock = threading.Lock()
+_clients = {}
+_env_loaded = False
+
+
+def _load_env():
+    """Read .env once, the first time a client is needed"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_client(api_key=None):
+    """
+    The process-wide OpenAI client for api_key (default: OPENAI_API_KEY from the
+    environment or .env), created on first use. Reusing one client keeps its
+    pooled keep-alive connections, so jobs do not repeat TLS handshakes. Clients
+    are per process, so forked batch workers create their own.
+    """
+    _load_env()
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY in your .env file.")
+
+    key = (os.getpid(), api_key)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # openai (and its HTTP stack) is slow to import, so it is only loaded here
+            from openai import OpenAI
+            client = _clients[key] = OpenAI(api_key=api_key, max_retries=MAX_RETRIES, http_client=_http_client())
+    return client
+
+
+def _http_client():
+    """HTTP client with the tuned connection pool, or None for the openai default"""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+    )
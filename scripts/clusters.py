@@ -0,0 +1,195 @@
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from scripts.canonical import canonical_text
+from scripts.incremental import is_empty
+
+# Label columns a cluster representative's answer is copied to; descriptions stay per item
+CLUSTER_COLUMNS = ["Product Category", "Facility Suitability", "Requires Electricity"]
+
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 64
+BANDS = 16
+SHINGLE_SIZE = 3
+CHUNK_SIZE = 5000
+
+# Size and colour words left out of the comparison, so variants of a product look alike.
+# Words are compared after canonical_text, which splits "X-LARGE" into "x" and "large".
+VARIANT_WORDS = {
+    "xxs", "xs", "s", "sm", "small", "m", "med", "medium", "l", "lg", "large", "xl", "xxl", "xxxl",
+    "x", "petite", "regular", "adult", "pediatric", "peds", "infant", "neonatal", "child",
+    "black", "blue", "brown", "clear", "gold", "gray", "grey", "green", "orange", "pink",
+    "purple", "red", "tan", "violet", "white", "yellow", "beige", "natural",
+}
+
+_PRIME = (1 << 31) - 1
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def variant_free_text(text):
+    """Canonical form with numbers masked and size and colour words removed"""
+    words = _DIGITS_RE.sub("0", canonical_text(text)).split()
+    return " ".join(word for word in words if word not in VARIANT_WORDS)
+
+
+def shingles(text, size=SHINGLE_SIZE, prepared=False):
+    """
+    Hashed character shingles of a description with its size and colour
+    details removed (see variant_free_text)
+    """
+    if not prepared:
+        text = variant_free_text(text)
+    if not text:
+        return np.empty(0, dtype=np.uint64)
+    padded = f" {text} "
+    grams = {padded[i:i + size] for i in range(max(1, len(padded) - size + 1))}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) % _PRIME for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM, seed=1, prepared=False):
+    """
+    MinHash signature (num_perm values) per text, as an array of shape
+    (len(texts), num_perm). Texts without shingles get a row of -1.
+    prepared means the texts already went through variant_free_text.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)[:, None]
+    b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)[:, None]
+
+    signatures = np.full((len(texts), num_perm), -1, dtype=np.int64)
+    for start in range(0, len(texts), CHUNK_SIZE):
+        hashed = [shingles(text, prepared=prepared) for text in texts[start:start + CHUNK_SIZE]]
+        rows = [position for position, values in enumerate(hashed) if len(values)]
+        if not rows:
+            continue
+        values = np.concatenate([hashed[position] for position in rows])
+        offsets = np.cumsum([0] + [len(hashed[position]) for position in rows[:-1]])
+        # Universal hash of every shingle under every permutation, minimum per text
+        permuted = (a * values[None, :] + b) % _PRIME
+        signatures[start + np.array(rows)] = np.minimum.reduceat(permuted, offsets, axis=1).T.astype(np.int64)
+    return signatures
+
+
+def cluster_representatives(texts, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, bands=BANDS):
+    """
+    Group near-identical texts with MinHash and LSH banding. Returns an array
+    mapping each position to the position of its cluster's representative
+    (itself for representatives and texts without a match). Every member's
+    estimated Jaccard similarity to its representative is at least threshold;
+    the earliest unassigned text becomes the next representative.
+    """
+    count = len(texts)
+    representative = np.arange(count)
+    if count < 2:
+        return representative
+
+    # Texts that are identical after removing variant details are hashed once
+    keys = [variant_free_text(text) for text in texts]
+    codes, uniques = pd.factorize(pd.Series(keys))
+    _, first_positions = np.unique(codes, return_index=True)
+    unique_representative = first_positions[_cluster_signatures(
+        minhash_signatures(list(uniques), num_perm, prepared=True), threshold, bands)]
+
+    representative = unique_representative[codes]
+    # Texts without any words are never grouped
+    empty = np.array([not key for key in keys])
+    representative[empty] = np.flatnonzero(empty)
+    return representative
+
+
+def _cluster_signatures(signatures, threshold, bands):
+    """cluster_representatives over precomputed signatures"""
+    count, num_perm = signatures.shape
+    representative = np.arange(count)
+    if count < 2:
+        return representative
+
+    rows_per_band = num_perm // bands
+    valid = signatures[:, 0] >= 0
+
+    # Bucket ids per band: texts with equal band values share a bucket
+    band_buckets = []
+    for band in range(bands):
+        values = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        _, bucket = np.unique(values.view(np.dtype((np.void, values.dtype.itemsize * rows_per_band))).ravel(),
+                              return_inverse=True)
+        order = np.argsort(bucket, kind="stable")
+        starts = np.searchsorted(bucket[order], np.arange(bucket.max() + 2))
+        band_buckets.append((bucket, order, starts))
+
+    # Texts alone in every band bucket have no candidates
+    has_neighbour = np.zeros(count, dtype=bool)
+    for bucket, _, starts in band_buckets:
+        has_neighbour |= np.diff(starts)[bucket] > 1
+
+    assigned = ~valid | ~has_neighbour
+    for position in np.flatnonzero(~assigned):
+        if assigned[position]:
+            continue
+        assigned[position] = True
+        candidates = np.unique(np.concatenate([
+            order[starts[bucket[position]]:starts[bucket[position] + 1]] for bucket, order, starts in band_buckets
+        ]))
+        candidates = candidates[~assigned[candidates]]
+        if not len(candidates):
+            continue
+        similarity = (signatures[candidates] == signatures[position]).mean(axis=1)
+        members = candidates[similarity >= threshold]
+        representative[members] = position
+        assigned[members] = True
+    return representative
+
+
+def plan_clusters(df, columns=CLUSTER_COLUMNS, reused=None, threshold=DEFAULT_THRESHOLD):
+    """
+    Cluster the descriptions of rows that still need one of the label columns.
+    Returns a Series mapping each cluster member (row label) to its
+    representative's row label; representatives and unclustered rows are left out.
+    """
+    reused = reused or {}
+    pending = pd.Index([], dtype=df.index.dtype)
+    for column in columns:
+        pending = pending.union(df.index.difference(pd.Index(reused.get(column, []))))
+    if len(pending) < 2 or "DESCRIPTION" not in df.columns:
+        return pd.Series(dtype=object)
+
+    texts = df.loc[pending, "DESCRIPTION"].tolist()
+    representative = cluster_representatives(texts, threshold)
+    members = np.flatnonzero(representative != np.arange(len(pending)))
+    return pd.Series(pending[representative[members]], index=pending[members])
+
+
+def skip_members(reused, members, columns=CLUSTER_COLUMNS):
+    """
+    Add cluster members to reused so the label stages skip them. Returns
+    {column: members that were not reused already}, the rows propagate_labels
+    fills afterwards.
+    """
+    targets = {}
+    for column in columns:
+        done = pd.Index(reused.get(column, []))
+        targets[column] = members.index.difference(done)
+        reused[column] = done.union(members.index)
+    return targets
+
+
+def propagate_labels(df, members, targets):
+    """
+    Copy each representative's labels to its cluster members in targets
+    ({column: member rows}, see skip_members) where the member's cell is
+    still empty. Returns {column: Index of rows filled}.
+    """
+    filled = {}
+    for column, rows in targets.items():
+        if column not in df.columns or not len(rows):
+            continue
+        values = df.loc[members.loc[rows].values, column].to_numpy()
+        fill = (is_empty(df.loc[rows, column]) & ~is_empty(pd.Series(values, index=rows))).to_numpy()
+        if fill.any():
+            df[column] = df[column].astype(object)
+            df.loc[rows[fill], column] = values[fill]
+            filled[column] = rows[fill]
+    return filled
@@ -1,12 +1,13 @@
 import pandas as pd
 import os
+import sys
 import time
-from openai import OpenAI
 from tqdm import tqdm
-from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.clients import get_client
+from scripts.llm import chat_completion, CircuitOpenError
+from scripts.tracing import NULL_TRACER
 
 class GPTDescriptionGenerator:
     """
@@ -14,14 +15,10 @@ class GPTDescriptionGenerator:
     using OpenAI's GPT-3.5 model
     """
     
-    def __init__(self):
-        # Get API key from environment variable
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY in your .env file.")
-        
-        # Initialize OpenAI client
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, client=None, tracer=None):
+        # Shared pooled OpenAI client (API key from OPENAI_API_KEY) unless one is given,
+        # created on the first request
+        self._client = client
         self.model = "gpt-3.5-turbo"  # Using GPT-3.5 for cost efficiency
         
         # Rate limiting parameters
@@ -33,6 +30,14 @@ class GPTDescriptionGenerator:
         self.total_tokens = 0
         self.total_requests = 0
         
+        # Span recorder for per-job tracing (no-op unless a Tracer is given)
+        self.tracer = tracer or NULL_TRACER
+        
+    @property
+    def client(self):
+        """OpenAI client; estimating a run needs no API key"""
+        return self._client or get_client()
+    
     def _wait_for_rate_limit(self):
         """Implements rate limiting to avoid API errors"""
         current_time = time.time()
@@ -40,7 +45,8 @@ class GPTDescriptionGenerator:
         
         if time_since_last_request < self.request_interval:
             sleep_time = self.request_interval - time_since_last_request
-            time.sleep(sleep_time)
+            with self.tracer.span("rate_limit_sleep", stage="descriptions", seconds=sleep_time):
+                time.sleep(sleep_time)
             
         self.last_request_time = time.time()
     
@@ -78,6 +84,13 @@ Make sure your response is ONLY the one-line description and nothing else."""
         
         return prompt
     
+    def build_messages(self, item_data):
+        """Chat messages asking GPT for the simple description of one item"""
+        return [
+            {"role": "system", "content": "You are a helpful assistant that creates simple, clear descriptions of medical items that non-medical people can understand."},
+            {"role": "user", "content": self._create_prompt(item_data)}
+        ]
+    
     def generate_description(self, item_data):
         """
         Generate a simple description for a medical item using GPT-3.5
@@ -95,9 +108,6 @@ Make sure your response is ONLY the one-line description and nothing else."""
         if pd.isna(description) or description == "":
             return "No description available"
             
-        # Create the prompt
-        prompt = self._create_prompt(item_data)
-        
         # Implement rate limiting
         self._wait_for_rate_limit()
         
@@ -105,12 +115,11 @@ Make sure your response is ONLY the one-line description and nothing else."""
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response = self.client.chat.completions.create(
+                response = chat_completion(
+                    self.client,
+                    self.tracer,
                     model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant that creates simple, clear descriptions of medical items that non-medical people can understand."},
-                        {"role": "user", "content": prompt}
-                    ],
+                    messages=self.build_messages(item_data),
                     temperature=0.3,  # Lower temperature for more consistent responses
                     max_tokens=60     # Limit response length
                 )
@@ -129,15 +138,79 @@ Make sure your response is ONLY the one-line description and nothing else."""
                     
             except Exception as e:
                 print(f"API error: {str(e)}")
-                if attempt < max_retries - 1:
+                if attempt < max_retries - 1 and not isinstance(e, CircuitOpenError):
                     wait_time = min(2 ** attempt, 60)  # Exponential backoff
                     print(f"Retrying in {wait_time} seconds... (Attempt {attempt + 1}/{max_retries})")
-                    time.sleep(wait_time)
+                    with self.tracer.span("retry_backoff", stage="descriptions", seconds=wait_time):
+                        time.sleep(wait_time)
                 else:
                     return f"Error generating description: {str(e)}"
                     
         return "Failed to generate description after multiple attempts"
     
+    def describe_dataframe(self, df, limit=None, batch_size=50, checkpoint_file=None, progress_callback=None,
+                           skip_rows=None, row_callback=None):
+        """
+        Add simple GPT-generated descriptions to an in-memory DataFrame
+        
+        Args:
+            df: DataFrame of inventory items, updated in place
+            limit: Only describe the first `limit` items (for testing with subset)
+            batch_size: Number of items between intermediate saves/progress reports
+            checkpoint_file: Where to save intermediate results (skipped if None)
+            progress_callback: Called as progress_callback(count, total) after every item
+            skip_rows: Rows to leave untouched (e.g. reused from a previous run)
+            row_callback: Called as row_callback(index) for every described row
+            
+        Returns:
+            DataFrame with added GPT descriptions
+        """
+        skip = df.index.isin(skip_rows if skip_rows is not None else [])
+        rows = df.index[~skip].tolist()
+        if limit is not None and limit < len(rows):
+            print(f"Processing subset of {limit} items for testing")
+            rows = rows[:limit]
+        total = len(rows)
+            
+        with self.tracer.span("stage", stage="descriptions", rows=total):
+            # Add a new column for the GPT descriptions
+            if 'SIMPLE_DESCRIPTION' not in df.columns:
+                df['SIMPLE_DESCRIPTION'] = ""
+            df['SIMPLE_DESCRIPTION'] = df['SIMPLE_DESCRIPTION'].astype(object)
+            df.loc[~skip, 'SIMPLE_DESCRIPTION'] = ""
+            
+            print(f"Generating descriptions for {total} items...")
+            progress_bar = tqdm(total=total, disable=progress_callback is not None)
+            count = 0
+            for batch_start in range(0, total, batch_size):
+                batch = rows[batch_start:batch_start + batch_size]
+                with self.tracer.span("batch", stage="descriptions", batch=batch_start // batch_size, rows=len(batch)):
+                    for idx in batch:
+                        self.tracer.set_context(row=idx)
+                        gpt_desc = self.generate_description(df.loc[idx].to_dict())
+                        df.loc[idx, 'SIMPLE_DESCRIPTION'] = gpt_desc
+                        
+                        count += 1
+                        progress_bar.update(1)
+                        if progress_callback:
+                            progress_callback(count, total)
+                        if row_callback:
+                            row_callback(idx)
+                    self.tracer.clear_context("row")
+                
+                # Save intermediate results after every batch
+                if checkpoint_file and count < total:
+                    with self.tracer.span("write", path=checkpoint_file):
+                        df.to_csv(checkpoint_file, index=False)
+                    print(f"Saved intermediate results after {count} items")
+                    
+                    # Display cost estimation
+                    cost_estimate = (self.total_tokens / 1000) * 0.002  # $0.002 per 1K tokens for GPT-3.5
+                    print(f"Tokens used so far: {self.total_tokens} (est. cost: ${cost_estimate:.2f})")
+            progress_bar.close()
+                    
+        return df
+    
     def process_inventory_file(self, input_file, output_file=None, batch_size=None):
         """
         Process a CSV inventory file to add simple GPT-generated descriptions
@@ -158,45 +231,15 @@ Make sure your response is ONLY the one-line description and nothing else."""
                 
             # Read the inventory file
             print(f"Reading inventory file: {input_file}")
-            df = pd.read_csv(input_file)
-            
-            # Limit to batch_size if specified
-            if batch_size and batch_size < len(df):
-                print(f"Processing subset of {batch_size} items for testing")
-                df_to_process = df.iloc[:batch_size].copy()
-            else:
-                df_to_process = df.copy()
-                
-            # Add a new column for the GPT descriptions
-            df_to_process['SIMPLE_DESCRIPTION'] = ""
-            
-            # Process each row with progress bar
-            print(f"Generating descriptions for {len(df_to_process)} items...")
-            for idx, row in tqdm(df_to_process.iterrows(), total=len(df_to_process)):
-                item_data = row.to_dict()
-                gpt_desc = self.generate_description(item_data)
-                df_to_process.loc[idx, 'SIMPLE_DESCRIPTION'] = gpt_desc
-                
-                # Save intermediate results every 50 items
-                if (idx + 1) % 50 == 0:
-                    intermediate_file = f"{output_file}.temp"
-                    df_to_process.to_csv(intermediate_file, index=False)
-                    print(f"Saved intermediate results after {idx + 1} items")
-                    
-                    # Display cost estimation
-                    cost_estimate = (self.total_tokens / 1000) * 0.002  # $0.002 per 1K tokens for GPT-3.5
-                    print(f"Tokens used so far: {self.total_tokens} (est. cost: ${cost_estimate:.2f})")
+            with self.tracer.span("read", path=input_file):
+                df = pd.read_csv(input_file)
             
-            # If we processed a subset, merge it back with the original dataframe
-            if batch_size and batch_size < len(df):
-                df.loc[:batch_size-1, 'SIMPLE_DESCRIPTION'] = df_to_process['SIMPLE_DESCRIPTION']
-                final_df = df
-            else:
-                final_df = df_to_process
+            final_df = self.describe_dataframe(df, limit=batch_size, checkpoint_file=f"{output_file}.temp")
                 
             # Save the results
             print(f"Saving results to {output_file}")
-            final_df.to_csv(output_file, index=False)
+            with self.tracer.span("write", path=output_file):
+                final_df.to_csv(output_file, index=False)
             
             # Print final statistics
             cost_estimate = (self.total_tokens / 1000) * 0.002
@@ -207,10 +250,10 @@ Make sure your response is ONLY the one-line description and nothing else."""
             
             # Print some examples
             print("\nExample simple descriptions:")
-            sample_size = min(5, len(df_to_process))
+            sample_size = min(5, len(final_df))
             for i in range(sample_size):
-                original = df_to_process.iloc[i]['DESCRIPTION']
-                simple = df_to_process.iloc[i]['SIMPLE_DESCRIPTION']
+                original = final_df.iloc[i]['DESCRIPTION']
+                simple = final_df.iloc[i]['SIMPLE_DESCRIPTION']
                 print(f"Original: {original}")
                 print(f"Simple: {simple}")
                 print("-" * 50)
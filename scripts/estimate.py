@@ -0,0 +1,405 @@
+import html
+import math
+
+import numpy as np
+import pandas as pd
+
+from scripts.canonical import canonical_key
+from scripts.incremental import is_empty
+
+# Typical seconds per API call; planning figures, not measurements
+MODEL_LATENCY = {"gpt-3.5-turbo": 0.7, "gpt-4": 2.5}
+DEFAULT_LATENCY = 1.5
+
+# USD per 1K tokens (prompt and completion alike), as used for the description cost estimate
+MODEL_PRICE_PER_1K = {"gpt-3.5-turbo": 0.002, "gpt-4": 0.03}
+
+# Share of a cascade model's answers expected to be escalated to the next model
+ESCALATION_RATE = 0.2
+
+# Typical completion length per stage in tokens
+COMPLETION_TOKENS = {"categorization": 8, "facility": 5, "electricity": 1, "descriptions": 25, "fused": 60}
+
+# Chat format overhead per message and per request
+MESSAGE_TOKENS = 4
+REQUEST_TOKENS = 3
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Tokens in text: tiktoken's cl100k_base when it is installed, otherwise about 4 characters per token"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return max(1, math.ceil(len(text) / 4))
+
+
+def prompt_tokens(requests):
+    """Total prompt tokens of an iterable of message lists; repeated texts (system prompts) are counted once"""
+    counts = {}
+    total = 0
+    for messages in requests:
+        total += REQUEST_TOKENS
+        for message in messages:
+            content = message["content"]
+            if content not in counts:
+                counts[content] = count_tokens(content)
+            total += counts[content] + MESSAGE_TOKENS
+    return total
+
+
+class StageEstimate:
+    """Rows, API calls, tokens and time one stage is expected to need"""
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.reused = 0       # kept from a baseline, the catalog or a cluster representative
+        self.existing = 0     # values already in the file that are preserved
+        self.keyword = 0      # decided by keyword rules without AI
+        self.duplicates = 0   # share the AI answer of an identical item
+        self.ai_rows = 0      # sent to the AI
+        self.calls = {}
+        self.prompt_tokens = {}
+        self.completion_tokens = {}
+        self.seconds = 0.0
+
+    def add_requests(self, models, requests, completion_tokens, latency):
+        """
+        Count the requests (message lists) for a model cascade: every request goes
+        to the first model and ESCALATION_RATE of each model's share to the next
+        """
+        count = len(requests)
+        tokens = prompt_tokens(requests)
+        share = 1.0
+        for model in models:
+            calls = count * share
+            self.calls[model] = self.calls.get(model, 0) + calls
+            self.prompt_tokens[model] = self.prompt_tokens.get(model, 0) + tokens * share
+            self.completion_tokens[model] = self.completion_tokens.get(model, 0) + calls * completion_tokens
+            self.seconds += calls * latency.get(model, DEFAULT_LATENCY)
+            share *= ESCALATION_RATE
+
+    def to_dict(self):
+        return {
+            "stage": self.name,
+            "rows": self.rows,
+            "reused": self.reused,
+            "existing": self.existing,
+            "keyword": self.keyword,
+            "duplicates": self.duplicates,
+            "ai_rows": self.ai_rows,
+            "calls": {model: round(calls) for model, calls in self.calls.items()},
+            "prompt_tokens": {model: round(tokens) for model, tokens in self.prompt_tokens.items()},
+            "completion_tokens": {model: round(tokens) for model, tokens in self.completion_tokens.items()},
+            "seconds": self.seconds,
+        }
+
+
+def _column(df, name):
+    return df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+def _pauses(rows, batch_size, pause):
+    """Seconds spent pausing between batches"""
+    return max(0, math.ceil(rows / batch_size) - 1) * pause if pause and batch_size else 0
+
+
+def _unique_rows(keys):
+    """Mask of the first row of every key"""
+    return ~pd.Series(keys).duplicated().to_numpy()
+
+
+def estimate_categorization(categorizer, df, skip_rows=None, preserve_existing=True, batch_size=50, pause=10,
+                            latency=MODEL_LATENCY):
+    """Estimate for MedicalInventoryCategorizer.categorize_dataframe"""
+    skip = df.index.isin(skip_rows if skip_rows is not None else [])
+    stage = StageEstimate("categorization", len(df))
+    stage.reused = int(skip.sum())
+    pending = ~skip
+    if preserve_existing and "Product Category" in df.columns:
+        kept = pending & ~is_empty(df["Product Category"]).to_numpy()
+        stage.existing = int(kept.sum())
+        pending &= ~kept
+    rows = df[pending]
+
+    descriptions, vendors, subcategories = (_column(rows, name) for name in ("DESCRIPTION", "VENDOR_NAME", "SUBCATEGORY"))
+    rules = categorizer.match_keywords_vectorized(descriptions, subcategories)
+    stage.keyword = int(rules.notna().sum())
+    ask = rules.isna().to_numpy()
+    items = list(zip(descriptions[ask], vendors[ask], subcategories[ask]))
+    first = _unique_rows([canonical_key(*item) for item in items])
+    unique = [item for item, keep in zip(items, first) if keep]
+    stage.duplicates = len(items) - len(unique)
+    stage.ai_rows = len(unique)
+
+    stage.add_requests(categorizer.cascade.models, [categorizer.build_messages(*item) for item in unique],
+                       COMPLETION_TOKENS["categorization"], latency)
+    stage.seconds += _pauses(len(rows), batch_size, pause)
+    return stage, rules
+
+
+def estimate_facility(classifier, df, categories=None, skip_rows=None, batch_size=50, pause=5, latency=MODEL_LATENCY):
+    """
+    Estimate for FacilitySuitabilityClassifier.classify_dataframe. categories are
+    the categories known before any AI call (keyword rules and existing values);
+    items are grouped by description and vendor where the category is not known.
+    """
+    skip = df.index.isin(skip_rows if skip_rows is not None else [])
+    stage = StageEstimate("facility", len(df))
+    stage.reused = int(skip.sum())
+    rows = df[~skip]
+    categories = categories if categories is not None else pd.Series(None, index=df.index, dtype=object)
+
+    descriptions, vendors = _column(rows, "DESCRIPTION"), _column(rows, "VENDOR_NAME")
+    rules = classifier.match_keywords_vectorized(descriptions)
+    stage.keyword = int(rules.notna().sum())
+    ask = rules.isna().to_numpy()
+    items = list(zip(descriptions[ask], categories.reindex(rows.index)[ask], vendors[ask]))
+    first = _unique_rows([canonical_key(description, vendor, category) for description, category, vendor in items])
+    unique = [item for item, keep in zip(items, first) if keep]
+    stage.duplicates = len(items) - len(unique)
+    stage.ai_rows = len(unique)
+
+    stage.add_requests(classifier.cascade.models, [classifier.build_messages(*item) for item in unique],
+                       COMPLETION_TOKENS["facility"], latency)
+    stage.seconds += _pauses(len(rows), batch_size, pause)
+    return stage
+
+
+def estimate_electricity(classifier, df, categories=None, skip_rows=None, batch_size=50, pause=5,
+                         latency=MODEL_LATENCY):
+    """Estimate for FacilitySuitabilityClassifier.electricity_dataframe (AI answers are not shared)"""
+    skip = df.index.isin(skip_rows if skip_rows is not None else [])
+    stage = StageEstimate("electricity", len(df))
+    stage.reused = int(skip.sum())
+    rows = df[~skip]
+    categories = categories if categories is not None else pd.Series(None, index=df.index, dtype=object)
+
+    descriptions = _column(rows, "DESCRIPTION")
+    rules = classifier.match_electricity_keywords_vectorized(descriptions)
+    stage.keyword = int(rules.notna().sum())
+    ask = rules.isna().to_numpy()
+    stage.ai_rows = int(ask.sum())
+
+    items = zip(descriptions[ask], categories.reindex(rows.index)[ask])
+    stage.add_requests([classifier.electricity_model], [classifier.electricity_messages(*item) for item in items],
+                       COMPLETION_TOKENS["electricity"], latency)
+    stage.seconds += _pauses(stage.ai_rows, batch_size, pause)
+    return stage
+
+
+def estimate_descriptions(generator, df, skip_rows=None, limit=None, latency=MODEL_LATENCY):
+    """Estimate for GPTDescriptionGenerator.describe_dataframe, including its own request pacing"""
+    skip = df.index.isin(skip_rows if skip_rows is not None else [])
+    stage = StageEstimate("descriptions", len(df))
+    stage.reused = int(skip.sum())
+    rows = df[~skip]
+    if limit is not None and limit < len(rows):
+        rows = rows.iloc[:limit]
+
+    descriptions = _column(rows, "DESCRIPTION")
+    ask = ~is_empty(descriptions).to_numpy()
+    stage.keyword = int((~ask).sum())
+    stage.ai_rows = int(ask.sum())
+
+    requests = [generator.build_messages(item) for item in rows[ask].to_dict("records")]
+    paced = {generator.model: max(latency.get(generator.model, DEFAULT_LATENCY), generator.request_interval)}
+    stage.add_requests([generator.model], requests, COMPLETION_TOKENS["descriptions"], paced)
+    return stage
+
+
+def estimate_fused(fused, df, skip_rows=None, preserve_existing=True, batch_size=50, pause=0, description_limit=None,
+                   latency=MODEL_LATENCY):
+    """Estimate for FusedItemClassifier.process_dataframe (one call per item for the fields rules leave open)"""
+    from scripts.fused import CATEGORY_COL, FACILITY_COL, ELECTRICITY_COL, DESCRIPTION_COL
+
+    columns = fused.output_columns()
+    skip_rows = skip_rows or {}
+    skipped = {column: df.index.isin(skip_rows.get(column, [])) for column in columns}
+    done = pd.DataFrame(skipped, index=df.index).all(axis=1).to_numpy() if columns else None
+    stage = StageEstimate("fused", len(df))
+    stage.reused = int(done.sum())
+    rows = df[~done]
+    descriptions = _column(rows, "DESCRIPTION")
+
+    # Fields still open per row after existing values and keyword rules
+    open_fields = {}
+    if fused.categorizer:
+        known = ~is_empty(_column(rows, CATEGORY_COL)) if preserve_existing else pd.Series(False, index=rows.index)
+        stage.existing = int(known.sum())
+        rules = fused.categorizer.match_keywords_vectorized(descriptions, _column(rows, "SUBCATEGORY"))
+        open_fields[CATEGORY_COL] = (~known & rules.isna()).to_numpy()
+    if fused.facility_classifier:
+        open_fields[FACILITY_COL] = fused.facility_classifier.match_keywords_vectorized(descriptions).isna().to_numpy()
+    if fused.electricity_classifier:
+        rules = fused.electricity_classifier.match_electricity_keywords_vectorized(descriptions)
+        open_fields[ELECTRICITY_COL] = rules.isna().to_numpy()
+    if fused.description_generator:
+        described = ~is_empty(descriptions).to_numpy() & ~skipped[DESCRIPTION_COL][~done]
+        if description_limit is not None:
+            # The limit counts the descriptions actually asked for
+            described &= np.cumsum(described) <= description_limit
+        open_fields[DESCRIPTION_COL] = described
+    open_fields = {column: mask & ~skipped[column][~done] for column, mask in open_fields.items()}
+
+    requests = []
+    items = rows.reindex(columns=["DESCRIPTION", "VENDOR_NAME", "CATEGORY", "SUBCATEGORY"]).to_dict("records")
+    for position, item_data in enumerate(items):
+        fields = [column for column, mask in open_fields.items() if mask[position]]
+        if fields:
+            requests.append(fused._build_messages(item_data, fields, {}))
+    stage.keyword = len(rows) - len(requests)
+    stage.ai_rows = len(requests)
+
+    stage.add_requests([fused.model], requests, COMPLETION_TOKENS["fused"], latency)
+    stage.seconds += _pauses(len(rows), batch_size, pause)
+    return stage
+
+
+def estimate_run(df, categorizer, classifier=None, electricity_classifier=None, description_generator=None,
+                 reused=None, settings=None, fused=None, requests_per_minute=None, sequential=False,
+                 latency=MODEL_LATENCY):
+    """
+    Dry run of a job: which rows every enabled stage would send to the AI, the
+    calls and tokens per model and the projected wall time, without any API
+    call. Arguments mirror build_stages (settings are the stage keyword
+    arguments); with fused (a FusedItemClassifier) the combined mode is estimated.
+    """
+    reused = reused or {}
+    settings = settings or {}
+
+    def option(stage, name, default):
+        return settings.get(stage, {}).get(name, default)
+
+    stages = []
+    if fused is not None:
+        stages.append(estimate_fused(
+            fused, df, skip_rows=reused,
+            preserve_existing=option("fused", "preserve_existing", True),
+            batch_size=option("fused", "batch_size", 50),
+            pause=option("fused", "pause", 0),
+            description_limit=option("fused", "description_limit", None),
+            latency=latency))
+        wall = stages[0].seconds
+    else:
+        categorization, rules = estimate_categorization(
+            categorizer, df, skip_rows=reused.get("Product Category"),
+            preserve_existing=option("categorization", "preserve_existing", True),
+            batch_size=option("categorization", "batch_size", 50),
+            pause=option("categorization", "pause", 10),
+            latency=latency)
+        stages.append(categorization)
+
+        # Categories known before any AI answer, used for the later stages' prompts and grouping
+        categories = _column(df, "Product Category").astype(object).where(lambda values: ~is_empty(values))
+        categories = categories.fillna(rules.reindex(df.index))
+        later = []
+        if classifier:
+            later.append(estimate_facility(
+                classifier, df, categories, skip_rows=reused.get("Facility Suitability"),
+                batch_size=option("facility", "batch_size", 50), pause=option("facility", "pause", 5),
+                latency=latency))
+        if electricity_classifier:
+            later.append(estimate_electricity(
+                electricity_classifier, df, categories, skip_rows=reused.get("Requires Electricity"),
+                batch_size=option("electricity", "batch_size", 50), pause=option("electricity", "pause", 5),
+                latency=latency))
+        stages.extend(later)
+        descriptions = None
+        if description_generator:
+            descriptions = estimate_descriptions(
+                description_generator, df, skip_rows=reused.get("SIMPLE_DESCRIPTION"),
+                limit=option("descriptions", "limit", None), latency=latency)
+            stages.append(descriptions)
+
+        if sequential:
+            wall = sum(stage.seconds for stage in stages)
+        else:
+            # Facility and electricity follow categorization; descriptions run alongside
+            wall = max(categorization.seconds + max((stage.seconds for stage in later), default=0),
+                       descriptions.seconds if descriptions else 0)
+
+    models = {}
+    for stage in stages:
+        for model, calls in stage.calls.items():
+            totals = models.setdefault(model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            totals["calls"] += calls
+            totals["prompt_tokens"] += stage.prompt_tokens[model]
+            totals["completion_tokens"] += stage.completion_tokens[model]
+    for model, totals in models.items():
+        tokens = totals["prompt_tokens"] + totals["completion_tokens"]
+        totals["cost"] = tokens / 1000 * MODEL_PRICE_PER_1K[model] if model in MODEL_PRICE_PER_1K else None
+        for key in ("calls", "prompt_tokens", "completion_tokens"):
+            totals[key] = round(totals[key])
+
+    calls = sum(totals["calls"] for totals in models.values())
+    rate_limited = False
+    if requests_per_minute:
+        limited = calls * 60 / requests_per_minute
+        rate_limited = limited > wall
+        wall = max(wall, limited)
+
+    return {
+        "rows": len(df),
+        "stages": [stage.to_dict() for stage in stages],
+        "models": models,
+        "calls": calls,
+        "seconds": wall,
+        "requests_per_minute": requests_per_minute,
+        "rate_limited": rate_limited,
+    }
+
+
+def format_duration(seconds):
+    """1h 02m, 3m 20s or 12s"""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def format_estimate(estimate):
+    """The estimate as text lines"""
+    lines = [f"Rows: {estimate['rows']}"]
+    for stage in estimate["stages"]:
+        lines.append(
+            f"- {stage['stage']}: {stage['ai_rows']} to AI ({stage['keyword']} by keyword rules, "
+            f"{stage['duplicates']} identical items, {stage['reused'] + stage['existing']} reused or kept), "
+            f"~{format_duration(stage['seconds'])}")
+    for model, totals in estimate["models"].items():
+        cost = f", ~${totals['cost']:.2f}" if totals["cost"] is not None else ""
+        lines.append(f"- {model}: {totals['calls']} calls, {totals['prompt_tokens']} prompt + "
+                     f"{totals['completion_tokens']} completion tokens{cost}")
+    limit = f" (limited by {estimate['requests_per_minute']:g} requests/minute)" if estimate["rate_limited"] else ""
+    lines.append(f"Projected time: ~{format_duration(estimate['seconds'])} for {estimate['calls']} AI calls{limit}")
+    return lines
+
+
+def render_estimate_html(estimate):
+    """The estimate as an HTML fragment for the configure page"""
+    parts = ["<table class=\"estimate\"><tr><th>Step</th><th>To AI</th><th>Keyword rules</th>"
+             "<th>Identical items</th><th>Reused or kept</th><th>Time</th></tr>"]
+    for stage in estimate["stages"]:
+        parts.append(f"<tr><td>{html.escape(stage['stage'])}</td><td>{stage['ai_rows']}</td><td>{stage['keyword']}</td>"
+                     f"<td>{stage['duplicates']}</td><td>{stage['reused'] + stage['existing']}</td>"
+                     f"<td>~{format_duration(stage['seconds'])}</td></tr>")
+    parts.append("</table><ul>")
+    for model, totals in estimate["models"].items():
+        cost = f", ~${totals['cost']:.2f}" if totals["cost"] is not None else ""
+        parts.append(f"<li>{html.escape(model)}: {totals['calls']} calls, {totals['prompt_tokens']} prompt + "
+                     f"{totals['completion_tokens']} completion tokens{cost}</li>")
+    parts.append("</ul>")
+    limit = f" (limited by {estimate['requests_per_minute']:g} requests/minute)" if estimate["rate_limited"] else ""
+    parts.append(f"<p>Projected time: <strong>~{format_duration(estimate['seconds'])}</strong> "
+                 f"for {estimate['calls']} AI calls{limit}</p>")
+    return "".join(parts)
@@ -1,19 +1,30 @@
 import pandas as pd
 import os
-from openai import OpenAI
+import sys
 import time
 import re 
-from dotenv import load_dotenv
-load_dotenv()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.canonical import canonical_text, canonical_texts, canonical_key
+from scripts.cascade import ModelCascade
+from scripts.clients import get_client
+from scripts.llm import chat_completion
+from scripts.tracing import NULL_TRACER
 
 class FacilitySuitabilityClassifier:
     """Classifies Medical Inventory based on suitability for rural clinicls or district hospitals"""
 
-    def __init__(self, client = None):
+    def __init__(self, client = None, tracer = None, cascade = None):
+
+        #shared pooled client unless one is given, created on first AI call
+        self._client = client
+        self.tracer = tracer or NULL_TRACER
 
-        self.client = client or globals().get('client')
-        if not self.client:
-            raise ValueError("OpenAI client is not initialized. Please provide a valid client.")
+        #models to ask, cheapest first; gpt-4 is only used when the cheap model is unsure
+        self.cascade = cascade or ModelCascade.for_stage("facility")
+        
+        #electricity questions are simple enough for the cheap model alone
+        self.electricity_model = "gpt-3.5-turbo"
 
         self.facility_types = [
             "Rural Clinics",
@@ -74,32 +85,75 @@ class FacilitySuitabilityClassifier:
             "radiation", "radioactive", "nuclear", "restricted", "controlled substance"
         ]
 
-    def determine_facility_suitability(self, description, category = None, vendor_name = None):
+        # Items that need mains or battery power to work
+        self.requires_electricity = [
+            "electric", "battery", "batteries", "powered", "rechargeable", "cordless",
+            "digital", "electronic", "ac adapter", "charger", "volt", "watt", "usb",
+            "monitor", "ventilator", "cpap", "bipap", "ecg", "ekg", "electrocardiograph",
+            "defibrillator", "infusion pump", "syringe pump", "feeding pump",
+            "suction machine", "aspirator", "oxygen concentrator", "nebulizer", "oximeter",
+            "doppler", "ultrasound", "x-ray", "analyzer", "centrifuge", "incubator",
+            "refrigerator", "freezer", "warmer", "autoclave", "sterilizer", "cautery",
+            "diathermy", "electrosurgical", "glucometer", "exam lamp", "examination lamp",
+            "heat lamp", "otoscope", "ophthalmoscope", "laryngoscope", "printer", "computer", "heater"
+        ]
+
+        # Unpowered consumables and manual instruments
+        self.no_electricity = [
+            "bandage", "gauze", "glove", "syringe", "needle", "mask", "gown", "tape",
+            "suture", "dressing", "swab", "cotton", "catheter", "tubing", "sponge", "wipe",
+            "soap", "forceps", "scissors", "scalpel", "blade", "cannula", "splint", "crutch",
+            "container", "drape", "apron", "tongue depressor", "specimen cup", "sanitizer",
+            "disinfectant", "underpad", "diaper", "brief", "sheet", "pillow", "towel",
+            "bedpan", "urinal", "cup", "sling", "cast", "stockinette", "lancet", "tourniquet"
+        ]
+
+        # Facility and electricity keywords in canonical form, matched against canonical descriptions
+        self.canonical_needs_review = [canonical_text(k) for k in self.needs_review_keywords]
+        self.canonical_rural = [canonical_text(k) for k in self.rural_clinic_equipment]
+        self.canonical_district = [canonical_text(k) for k in self.district_hospital_equipment]
+        self.canonical_requires_electricity = [canonical_text(k) for k in self.requires_electricity]
+        self.canonical_no_electricity = [canonical_text(k) for k in self.no_electricity]
+
+        # Compiled alternations for the vectorized keyword pass over whole columns
+        self.requires_electricity_pattern = "|".join(re.escape(k) for k in self.canonical_requires_electricity)
+        self.no_electricity_pattern = "|".join(re.escape(k) for k in self.canonical_no_electricity)
+
+        # AI answers by canonical item key, so descriptions that differ only in spelling are asked once
+        self.answers = {}
+        self.reused_answers = 0
+
+    @property
+    def client(self):
+        """OpenAI client; keyword-only work such as a dry run needs no API key"""
+        return self._client or get_client()
+
+    def match_keywords(self, description):
         """
-        Determine the suitability of a medical item based on its description and category.
-        First tries keyword matching, then falls back to OpenAI API
+        Keyword rules only: returns a facility type, or None if no rule matches
+        and the item needs an AI classification
         """
-
         if pd.isna(description) or description == "":
             return "Needs Review"
         
-        desc_lower = description.lower()
+        # canonical form: lowercase, no punctuation, units spelled one way
+        desc_lower = canonical_text(description)
 
         #check for items that need review first 
-        for keyword in self.needs_review_keywords:
+        for keyword in self.canonical_needs_review:
             if keyword in desc_lower:
                 return "Needs Review"
         
         # Check if suitable for rural clinics
         rural_match = False
-        for keyword in self.rural_clinic_equipment:
+        for keyword in self.canonical_rural:
             if keyword in desc_lower:
                 rural_match = True
                 break
         
         # Check if suitable for district hospitals
         district_match = False
-        for keyword in self.district_hospital_equipment:
+        for keyword in self.canonical_district:
             if keyword in desc_lower:
                 district_match = True
                 break
@@ -110,21 +164,46 @@ class FacilitySuitabilityClassifier:
             return "Rural Clinics"
         elif district_match:
             return "District Hospitals"
-        
-        #If no clear match through keywords, use OpenAI to classify
-        try:
-            # Combine description, category, and vendor
-            context = f"Description: {description}"
-            if category and not pd.isna(category):
-                context += f", Category: {category}"
-            if vendor_name and not pd.isna(vendor_name):
-                context += f", Vendor: {vendor_name}"
-
-            # Create prompt 
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages = [
-                    {"role": "system", "content": """You are a healthcare facility equipment specialist
+        return None
+
+    def match_keywords_vectorized(self, descriptions):
+        """
+        Keyword rules for a whole DESCRIPTION column at once (see match_keywords).
+        Returns a Series of facility types, with None where an AI answer is needed.
+        """
+        # Each distinct canonical description is matched once
+        codes, canonical = pd.factorize(canonical_texts(descriptions))
+        canonical = pd.Series(canonical, dtype=object)
+
+        def contains_any(keywords):
+            found = pd.Series(False, index=canonical.index)
+            for keyword in keywords:
+                found |= canonical.str.contains(keyword, regex=False)
+            return found
+
+        rural = contains_any(self.canonical_rural)
+        district = contains_any(self.canonical_district)
+        found = pd.Series(None, index=canonical.index, dtype=object)
+        found[rural] = "Rural Clinics"
+        found[district] = "District Hospitals"
+        found[rural & district] = "Both"
+        found[contains_any(self.canonical_needs_review)] = "Needs Review"
+
+        result = pd.Series(found.to_numpy()[codes], index=descriptions.index, dtype=object)
+        result[descriptions.isna() | (descriptions.astype(str) == "")] = "Needs Review"
+        return result
+
+    def build_messages(self, description, category = None, vendor_name = None):
+        """Chat messages asking the AI for the facility suitability of one item"""
+        # Combine description, category, and vendor
+        context = f"Description: {description}"
+        if category and not pd.isna(category):
+            context += f", Category: {category}"
+        if vendor_name and not pd.isna(vendor_name):
+            context += f", Vendor: {vendor_name}"
+
+        return [
+            {"role": "system", "content": """You are a healthcare facility equipment specialist
                     Rural clinics typically have:
                     - Basic equipment limited to essential primary care and first aid
                     - Basic maternal and child health services (simple deliveries, growth monitoring)
@@ -162,57 +241,115 @@ class FacilitySuitabilityClassifier:
                     Only use "Needs Review" if you truly cannot determine the category based on the description.
 
                     Respond with ONLY the category name."""
-                     },
-                    {"role": "user", "content": context}
-                ],
+            },
+            {"role": "user", "content": context}
+        ]
+
+    def determine_facility_suitability(self, description, category = None, vendor_name = None):
+        """
+        Determine the suitability of a medical item based on its description and category.
+        First tries keyword matching, then falls back to OpenAI API
+        """
+
+        facility_type = self.match_keywords(description)
+        if facility_type:
+            return facility_type
+
+        # Reuse the answer for an item with the same canonical description
+        key = canonical_key(description, vendor_name, category)
+        if key in self.answers:
+            self.reused_answers += 1
+            return self.answers[key]
+        
+        #If no clear match through keywords, use OpenAI to classify
+        try:
+            facility_type = self.cascade.run(
+                self.client,
+                messages = self.build_messages(description, category, vendor_name),
+                validate=self.parse_facility_type,
+                tracer=self.tracer,
                 temperature=0.1,
                 max_tokens = 30 
                 )
-            facility_type = response.choices[0].message.content.strip()
-
-            #Clean up response
-            if ":" in facility_type:
-                facility_type = facility_type.split(":")[1].strip()
-            if facility_type not in self.facility_types:
-                #find closest match
-                for valid_type in self.facility_types:
-                    if valid_type.lower() in facility_type.lower():
-                        return valid_type 
-                
-                #if still not match, return "needs review"
-                return "Needs Review"
-            
-            return facility_type 
+
+            #if still not match, return "needs review"
+            facility_type = facility_type or "Needs Review"
+            self.answers[key] = facility_type
+            return facility_type
 
         except Exception as e:
             print(f"Error classifying item: {e}")
             return "Needs Review"
+
+    def parse_facility_type(self, facility_type):
+        """Clean up a model response, returning one of self.facility_types or None if it isn't one"""
+        if ":" in facility_type:
+            facility_type = facility_type.split(":")[1].strip()
+        if facility_type not in self.facility_types:
+            #find closest match
+            for valid_type in self.facility_types:
+                if valid_type.lower() in facility_type.lower():
+                    return valid_type 
+            return None
         
-    def determine_electricity_usage(self, description, category=None):
+        return facility_type 
+        
+    def match_electricity_keywords(self, description):
         """
-        Determine if an item requires electricity based on its description.
-        Returns "Yes" if electricity is required, "No" if not.
+        Keyword rules only: returns "Yes", "No", "Needs Review" for a missing
+        description, or None if the item needs an AI answer
         """
         if pd.isna(description) or description == "":
             return "Needs Review"
         
-        desc_lower = description.lower()
+        # same canonical form as the facility rules ("O2-Concentrator" == "o2 concentrator")
+        desc_lower = canonical_text(description)
         
-        # Check if it matches any electricity-requiring keywords
-        for keyword in self.requires_electricity:
+        # Powered keywords win over consumable keywords ("battery powered suction + tubing")
+        for keyword in self.canonical_requires_electricity:
             if keyword in desc_lower:
                 return "Yes"
-        
-        # If no clear match through keywords, use OpenAI to classify
-        try:
-            context = f"Description: {description}"
-            if category and not pd.isna(category):
-                context += f", Category: {category}"
-            
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": """You are a healthcare equipment specialist.
+        for keyword in self.canonical_no_electricity:
+            if keyword in desc_lower:
+                return "No"
+        return None
+
+    def match_electricity_keywords_vectorized(self, descriptions):
+        """
+        Keyword rules for a whole DESCRIPTION column at once.
+        Returns a Series of "Yes"/"No"/"Needs Review", with None where an AI answer is needed.
+        """
+        # Each distinct canonical description is matched once
+        codes, canonical = pd.factorize(canonical_texts(descriptions))
+        canonical = pd.Series(canonical, dtype=object)
+        requires = canonical.str.contains(self.requires_electricity_pattern, regex=True)
+        unpowered = canonical.str.contains(self.no_electricity_pattern, regex=True)
+
+        found = pd.Series(None, index=canonical.index, dtype=object)
+        found[unpowered] = "No"
+        found[requires] = "Yes"
+
+        result = pd.Series(found.to_numpy()[codes], index=descriptions.index, dtype=object)
+        result[descriptions.isna() | (descriptions.astype(str) == "")] = "Needs Review"
+        return result
+
+    def determine_electricity_usage(self, description, category=None):
+        """
+        Determine if an item requires electricity based on its description.
+        Returns "Yes" if electricity is required, "No" if not.
+        """
+        answer = self.match_electricity_keywords(description)
+        if answer:
+            return answer
+        return self.ask_electricity_usage(description, category)
+
+    def electricity_messages(self, description, category=None):
+        """Chat messages asking the AI whether one item requires electricity"""
+        context = f"Description: {description}"
+        if category and not pd.isna(category):
+            context += f", Category: {category}"
+        return [
+            {"role": "system", "content": """You are a healthcare equipment specialist.
                         Determine if the specified medical item requires electricity to function properly.
                         Consider the following:
                         - Electronic devices or anything with powered components needs electricity
@@ -221,9 +358,18 @@ class FacilitySuitabilityClassifier:
                         - Consumable supplies like bandages, syringes, or medicines do not require electricity
                         
                         Respond with ONLY "Yes" or "No"."""
-                    },
-                    {"role": "user", "content": context}
-                ],
+            },
+            {"role": "user", "content": context}
+        ]
+
+    def ask_electricity_usage(self, description, category=None):
+        """Ask the AI whether an item requires electricity (no keyword rules)"""
+        try:
+            response = chat_completion(
+                self.client,
+                self.tracer,
+                model=self.electricity_model,
+                messages=self.electricity_messages(description, category),
                 temperature=0.1,
                 max_tokens=10
             )
@@ -243,6 +389,116 @@ class FacilitySuitabilityClassifier:
             print(f"Error determining electricity usage: {e}")
             return "Needs Review"
 
+    def classify_dataframe(self, df, category_col = "Product Category", batch_size = 50, pause = 5, progress_callback = None,
+                           skip_rows = None, row_callback = None):
+        """
+        Determine facility suitability for every item of an in-memory DataFrame,
+        writing the "Facility Suitability" column. Pauses `pause` seconds after each
+        batch of batch_size items; progress_callback(count, total) is called per item,
+        row_callback(index) with the row just classified.
+        Rows listed in skip_rows (e.g. reused from a previous run) are left untouched.
+        """
+        skip = df.index.isin(skip_rows if skip_rows is not None else [])
+
+        with self.tracer.span("stage", stage="facility", rows=len(df)):
+            # Add facility suitability column
+            if "Facility Suitability" not in df.columns:
+                df["Facility Suitability"] = ""
+            df["Facility Suitability"] = df["Facility Suitability"].astype(object)
+            df.loc[~skip, "Facility Suitability"] = ""
+
+            # Process items
+            rows = df.index[~skip].tolist()
+            total = len(rows)
+            count = 0
+            for batch_start in range(0, total, batch_size):
+                batch = rows[batch_start:batch_start + batch_size]
+                with self.tracer.span("batch", stage="facility", batch=batch_start // batch_size, rows=len(batch)):
+                    for i in batch:
+                        self.tracer.set_context(row=i)
+
+                        #get item description and other relevent fields
+                        description = df.loc[i, "DESCRIPTION"] if "DESCRIPTION" in df.columns else ""
+                        category = df.loc[i, category_col] if category_col in df.columns else None
+                        vendor_name = df.loc[i, "VENDOR_NAME"] if "VENDOR_NAME" in df.columns else None
+
+                        #determine facility suitability
+                        facility_type = self.determine_facility_suitability(description, category, vendor_name)
+                        df.loc[i, "Facility Suitability"] = facility_type
+
+                        #progress reporting
+                        count += 1
+                        if progress_callback:
+                            progress_callback(count, total)
+                        if row_callback:
+                            row_callback(i)
+                        if count % 10 == 0:
+                            print(f"Processed {count} items/{total} items")
+                    self.tracer.clear_context("row")
+
+                if pause and count < total:
+                    print(f"Pausing to avoid API rate limits...")
+                    with self.tracer.span("rate_limit_sleep", stage="facility", seconds=pause):
+                        time.sleep(pause)
+
+        return df
+
+    def electricity_dataframe(self, df, category_col = "Product Category", batch_size = 50, pause = 5, progress_callback = None,
+                              skip_rows = None, row_callback = None):
+        """
+        Write the "Requires Electricity" column for an in-memory DataFrame.
+        Keyword rules run over the whole DESCRIPTION column in one vectorized pass;
+        only the items they cannot decide are sent to the AI, in batches of batch_size.
+        progress_callback(count, total) counts keyword-decided items as done;
+        row_callback(index) is called for every row once its answer is written.
+        Rows listed in skip_rows (e.g. reused from a previous run) are left untouched.
+        """
+        skip = df.index.isin(skip_rows if skip_rows is not None else [])
+
+        with self.tracer.span("stage", stage="electricity", rows=len(df)) as stage_attrs:
+            descriptions = df["DESCRIPTION"] if "DESCRIPTION" in df.columns else pd.Series("", index=df.index)
+            descriptions = descriptions[~skip]
+            with self.tracer.span("keyword_pass", stage="electricity", rows=len(descriptions)):
+                answers = self.match_electricity_keywords_vectorized(descriptions)
+            if "Requires Electricity" not in df.columns:
+                df["Requires Electricity"] = ""
+            df["Requires Electricity"] = df["Requires Electricity"].astype(object)
+            df.loc[answers.index, "Requires Electricity"] = answers.fillna("")
+
+            residue = answers.index[answers.isna()].tolist()
+            total = len(answers)
+            count = total - len(residue)
+            stage_attrs["keyword_hits"] = count
+            stage_attrs["items"] = len(residue)
+            print(f"Electricity decided by keywords: {count}/{total}, sending {len(residue)} to AI")
+            if progress_callback:
+                progress_callback(count, total)
+            if row_callback:
+                for i in answers.index[answers.notna()]:
+                    row_callback(i)
+
+            for batch_start in range(0, len(residue), batch_size):
+                batch = residue[batch_start:batch_start + batch_size]
+                with self.tracer.span("batch", stage="electricity", batch=batch_start // batch_size, rows=len(batch)):
+                    for i in batch:
+                        self.tracer.set_context(row=i)
+                        category = df.loc[i, category_col] if category_col in df.columns else None
+                        df.loc[i, "Requires Electricity"] = self.ask_electricity_usage(descriptions[i], category)
+
+                        count += 1
+                        if progress_callback:
+                            progress_callback(count, total)
+                        if row_callback:
+                            row_callback(i)
+                    self.tracer.clear_context("row")
+
+                if pause and batch_start + batch_size < len(residue):
+                    print(f"Pausing to avoid API rate limits...")
+                    with self.tracer.span("rate_limit_sleep", stage="electricity", seconds=pause):
+                        time.sleep(pause)
+
+        return df
+
     def process_csv(self, input_file, output_file = None, category_col="Product Category"):
         """
         Process the CSV file to determine facility suitability for each item.
@@ -255,35 +511,15 @@ class FacilitySuitabilityClassifier:
             
             #read csv file
             print(f"Reading file: {input_file}")
-            df = pd.read_csv(input_file)
+            with self.tracer.span("read", path=input_file):
+                df = pd.read_csv(input_file)
             
-            # Add facility suitability column
-            df["Facility Suitability"] =""
-
-            # Process items
-            batch_size = 50 
-            for i in range(0, len(df)):
-                
-                #get item description and other relevent fields
-                description = df.loc[i, "DESCRIPTION"] if "DESCRIPTION" in df.columns else ""
-                category = df.iloc[i][category_col] if category_col in df.columns else None
-                vendor_name = df.loc[i, "VENDOR_NAME"] if "VENDOR_NAME" in df.columns else None
-
-                #determine facility suitability
-                facility_type = self.determine_facility_suitability(description, category, vendor_name)
-                df.loc[i, "Facility Suitability"] = facility_type
-
-                #progress reporting
-                if (i + 1) % 10 == 0:
-                    print(f"Processed {i + 1} items/{len(df)} items")
-
-                if (i + 1) % batch_size == 0 and (i + 1) < len(df):
-                    print(f"Pausing to avoid API rate limits...")
-                    time.sleep(5) 
+            df = self.classify_dataframe(df, category_col=category_col)
 
             #save processed data
             print(f"Saving results to {output_file}")
-            df.to_csv(output_file, index = False)
+            with self.tracer.span("write", path=output_file):
+                df.to_csv(output_file, index = False)
 
             #Print facility suitability distribution
             facility_counts = df["Facility Suitability"].value_counts()
@@ -301,15 +537,15 @@ def main():
     output_file = "inventory/Quarterly DC cleanout Dec 3 2024_facilitized.csv"
 
     #check api key is set 
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    try:
+        client = get_client()
+    except ValueError:
         print("Error: OPENAI_API_KEY environment variable is not set.")
         print("Please add your OpenAI API key to the .env file.")
         return
     
     try:
         # Initialize the classifier
-        client = OpenAI(api_key=api_key)
         classifier = FacilitySuitabilityClassifier(client)
         
         # Process the CSV file
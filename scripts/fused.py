@@ -0,0 +1,246 @@
+import json
+import time
+
+import pandas as pd
+
+from scripts.clients import get_client
+from scripts.llm import chat_completion
+from scripts.tracing import NULL_TRACER
+
+CATEGORY_COL = "Product Category"
+FACILITY_COL = "Facility Suitability"
+ELECTRICITY_COL = "Requires Electricity"
+DESCRIPTION_COL = "SIMPLE_DESCRIPTION"
+
+# Instructions for each field of the combined JSON answer
+FIELD_INSTRUCTIONS = {
+    CATEGORY_COL: """"Product Category": exactly one of
+    - "Medical Equipment & Furniture" (durable items such as exam tables, surgical lights, and patient chairs)
+    - "Medical & Surgical Supplies" (consumables including gloves, bandages, tubing, and instruments)
+    - "PPE & Infection Control" (personal protective equipment like masks, gowns, and sanitizing products)
+    - "Cleaning & Facility Maintenance" (disinfectants, wipes, and related sanitation materials)
+    - "Diagnostics & Lab Use" (items used for monitoring, testing, or sample handling)""",
+    FACILITY_COL: """"Facility Suitability": exactly one of
+    - "Rural Clinics" (basic items for rural health posts: manual or battery equipment, no surgery, rapid tests only)
+    - "District Hospitals" (needs surgical, imaging, lab, reliable electricity or specialized staff)
+    - "Both" (disposable, basic or low-infrastructure items usable in either setting)
+    - "Needs Review" (only if you truly cannot tell from the information given)""",
+    ELECTRICITY_COL: """"Requires Electricity": "Yes" if the item needs electricity to work (battery-operated counts),
+    "No" for mechanical, manual or unpowered items and consumable supplies""",
+    DESCRIPTION_COL: """"SIMPLE_DESCRIPTION": a clear one-line description (under 15 words if possible) that someone
+    without medical training understands. Use common abbreviations (pkg, qty, cm, ml), keep measurements,
+    and leave out brand names unless needed for identification""",
+}
+
+
+class FusedItemClassifier:
+    """
+    Fills every enabled output column for an item with a single structured API call
+    instead of one call per stage. Keyword rules still run first, and only the fields
+    they could not resolve are requested. Fields that come back invalid fall back to
+    the stage's own classifier. Electricity uses a FacilitySuitabilityClassifier's
+    electricity rules and prompt.
+    """
+
+    def __init__(self, client, categorizer=None, facility_classifier=None, description_generator=None,
+                 electricity_classifier=None, tracer=None, model="gpt-3.5-turbo"):
+        # shared pooled client unless one is given, created on the first AI call
+        self._client = client
+        self.categorizer = categorizer
+        self.facility_classifier = facility_classifier
+        self.description_generator = description_generator
+        self.electricity_classifier = electricity_classifier
+        self.tracer = tracer or NULL_TRACER
+        self.model = model
+
+        # Usage counters for progress reporting
+        self.total_requests = 0
+        self.total_fallbacks = 0
+
+    @property
+    def client(self):
+        """OpenAI client; estimating a run needs no API key"""
+        return self._client or get_client()
+
+    def _build_messages(self, item_data, fields, known):
+        """Prompt asking for a JSON object with only the requested fields"""
+        instructions = "\n".join(f"- {FIELD_INSTRUCTIONS[field]}" for field in fields)
+        system = f"""You are a healthcare equipment specialist who classifies medical inventory items.
+Based ONLY on the information provided, answer with a JSON object containing exactly these keys:
+{instructions}
+Respond with the JSON object only."""
+
+        context = f"Description: {item_data.get('DESCRIPTION', '')}"
+        for column, label in (("VENDOR_NAME", "Vendor"), ("CATEGORY", "Category"), ("SUBCATEGORY", "Subcategory")):
+            value = item_data.get(column)
+            if value and not pd.isna(value):
+                context += f"\n{label}: {value}"
+        for field, value in known.items():
+            context += f"\n{field}: {value}"
+
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": context},
+        ]
+
+    def _validate(self, field, value):
+        """Return the cleaned value for a field, or None if it is not valid"""
+        if not isinstance(value, str) or not value.strip():
+            return None
+        value = value.strip()
+        if field == CATEGORY_COL:
+            return self.categorizer.parse_category(value)
+        if field == FACILITY_COL:
+            return self.facility_classifier.parse_facility_type(value)
+        if field == ELECTRICITY_COL:
+            if value.lower() in ("yes", "no"):
+                return value.capitalize()
+            return None
+        return value.strip('"\'')
+
+    def classify_item(self, item_data, fields, known=None):
+        """
+        Ask for all requested fields at once.
+        Returns {field: value}, with None for fields that were missing or invalid.
+        """
+        known = known or {}
+        try:
+            response = chat_completion(
+                self.client,
+                self.tracer,
+                model=self.model,
+                messages=self._build_messages(item_data, fields, known),
+                response_format={"type": "json_object"},
+                temperature=0.1,
+                max_tokens=150
+            )
+            self.total_requests += 1
+            answer = json.loads(response.choices[0].message.content)
+            if not isinstance(answer, dict):
+                answer = {}
+        except Exception as e:
+            print(f"Error in combined classification: {e}")
+            answer = {}
+
+        return {field: self._validate(field, answer.get(field)) for field in fields}
+
+    def _fallback(self, field, item_data, category):
+        """Classify a single field with its stage's own classifier"""
+        self.total_fallbacks += 1
+        description = item_data.get("DESCRIPTION", "")
+        vendor_name = item_data.get("VENDOR_NAME")
+        if field == CATEGORY_COL:
+            return self.categorizer.categorize_item(description, vendor_name, item_data.get("SUBCATEGORY"))
+        if field == FACILITY_COL:
+            return self.facility_classifier.determine_facility_suitability(description, category, vendor_name)
+        if field == ELECTRICITY_COL:
+            return self.electricity_classifier.ask_electricity_usage(description, category)
+        return self.description_generator.generate_description(item_data)
+
+    def output_columns(self):
+        """Output columns this classifier fills, in pipeline order"""
+        columns = []
+        if self.categorizer:
+            columns.append(CATEGORY_COL)
+        if self.facility_classifier:
+            columns.append(FACILITY_COL)
+        if self.electricity_classifier:
+            columns.append(ELECTRICITY_COL)
+        if self.description_generator:
+            columns.append(DESCRIPTION_COL)
+        return columns
+
+    def process_dataframe(self, df, preserve_existing=True, batch_size=50, pause=0, description_limit=None,
+                          progress_callback=None, skip_rows=None, row_callback=None):
+        """
+        Fill all enabled output columns of an in-memory DataFrame.
+        description_limit restricts descriptions to the first N items that have one
+        to write (for testing), as in GPTDescriptionGenerator.describe_dataframe.
+        progress_callback(count, total) is called after every item.
+        skip_rows maps output columns to rows whose value should be kept as it is
+        (e.g. reused from a previous run); rows kept for every column are not processed.
+        row_callback(index) is called once a row's output columns are all filled.
+        """
+        columns = self.output_columns()
+        skip_rows = skip_rows or {}
+        skip = {column: set(skip_rows.get(column, [])) for column in columns}
+
+        with self.tracer.span("stage", stage="fused", rows=len(df)):
+            for column in columns:
+                if column not in df.columns:
+                    df[column] = ""
+                df[column] = df[column].astype(object)
+                keep = df.index.isin(list(skip[column]))
+                if column == CATEGORY_COL and preserve_existing:
+                    continue
+                df.loc[~keep, column] = ""
+
+            rows = [i for i in df.index if not all(i in skip[column] for column in columns)]
+            total = len(rows)
+            count = 0
+            described = 0
+            for batch_start in range(0, total, batch_size):
+                batch = rows[batch_start:batch_start + batch_size]
+                with self.tracer.span("batch", stage="fused", batch=batch_start // batch_size, rows=len(batch)) as batch_attrs:
+                    calls = 0
+                    for i in batch:
+                        self.tracer.set_context(row=i)
+                        item_data = df.loc[i].to_dict()
+                        description = item_data.get("DESCRIPTION", "")
+                        results = {}
+
+                        # Keyword rules and existing values first
+                        if self.categorizer:
+                            existing = item_data.get(CATEGORY_COL)
+                            if existing and not pd.isna(existing):
+                                results[CATEGORY_COL] = existing
+                            else:
+                                results[CATEGORY_COL] = self.categorizer.match_keywords(description, item_data.get("SUBCATEGORY"))
+                        if self.facility_classifier:
+                            results[FACILITY_COL] = self.facility_classifier.match_keywords(description)
+                        if self.electricity_classifier:
+                            results[ELECTRICITY_COL] = self.electricity_classifier.match_electricity_keywords(description)
+                        if self.description_generator and i not in skip[DESCRIPTION_COL]:
+                            if pd.isna(description) or description == "":
+                                results[DESCRIPTION_COL] = "No description available"
+                            elif description_limit is not None and described >= description_limit:
+                                results[DESCRIPTION_COL] = ""
+                            else:
+                                results[DESCRIPTION_COL] = None
+                                described += 1
+                        for column in columns:
+                            if i in skip[column]:
+                                results[column] = item_data.get(column)
+
+                        # One call for everything the rules could not answer
+                        needed = [field for field, value in results.items() if value is None]
+                        if needed:
+                            known = {field: value for field, value in results.items()
+                                     if value and field in (CATEGORY_COL, FACILITY_COL)}
+                            results.update(self.classify_item(item_data, needed, known))
+                            calls += 1
+
+                        for field in needed:
+                            if results[field] is None:
+                                results[field] = self._fallback(field, item_data, results.get(CATEGORY_COL))
+
+                        for field, value in results.items():
+                            df.loc[i, field] = value
+                        if row_callback:
+                            row_callback(i)
+
+                        count += 1
+                        if progress_callback:
+                            progress_callback(count, total)
+                        if count % 10 == 0:
+                            print(f"Processed {count}/{total} items")
+                    self.tracer.clear_context("row")
+                    batch_attrs["llm_calls"] = calls
+
+                if pause and count < total:
+                    print(f"Pausing for {pause} seconds to avoid rate limiting...")
+                    with self.tracer.span("rate_limit_sleep", stage="fused", seconds=pause):
+                        time.sleep(pause)
+
+        print(f"Combined requests: {self.total_requests}, single-stage fallbacks: {self.total_fallbacks}")
+        return df
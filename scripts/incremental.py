@@ -0,0 +1,91 @@
+import pandas as pd
+
+# Input columns whose content decides whether an item's results can be reused
+HASH_COLUMNS = ["DESCRIPTION", "VENDOR_NAME", "VEND_CAT_NUM", "CATEGORY", "SUBCATEGORY"]
+
+# Output columns written by the pipeline stages
+OUTPUT_COLUMNS = ["Product Category", "Facility Suitability", "Requires Electricity", "SIMPLE_DESCRIPTION"]
+
+
+def normalized_text(series):
+    """String form of a column that is stable across CSV round trips (1000 vs 1000.0, NaN)"""
+    return series.astype(object).where(series.notna(), "").astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+
+
+def item_keys(df):
+    """Normalized ITEM_NO for matching rows between files"""
+    return normalized_text(df["ITEM_NO"]).rename("_item_key")
+
+
+def content_hash(df, columns=HASH_COLUMNS):
+    """64-bit hash per row over the content columns present in df"""
+    present = [column for column in columns if column in df.columns]
+    content = pd.DataFrame({column: normalized_text(df[column]) for column in present}, index=df.index)
+    return pd.util.hash_pandas_object(content, index=False).rename("_content_hash")
+
+
+def is_empty(series):
+    """True for missing or blank cells"""
+    return series.isna() | (series.astype(str).str.strip() == "")
+
+
+def apply_baseline(df, baseline_df, output_columns=OUTPUT_COLUMNS):
+    """
+    Copy results from a previously processed file onto unchanged rows of df.
+    Rows match when ITEM_NO and the content hash are equal. Values already present
+    in df are never overwritten.
+
+    Returns {output column: Index of rows filled from the baseline}; stages should
+    skip those rows for that column.
+    """
+    if "ITEM_NO" not in df.columns or "ITEM_NO" not in baseline_df.columns:
+        raise ValueError("Both the input and the baseline file need an ITEM_NO column.")
+
+    reusable = [column for column in output_columns if column in baseline_df.columns]
+    if not reusable:
+        return {}
+
+    baseline = pd.concat([item_keys(baseline_df), content_hash(baseline_df), baseline_df[reusable]], axis=1)
+    baseline = baseline.drop_duplicates(subset=["_item_key", "_content_hash"], keep="last")
+
+    current = pd.concat([item_keys(df), content_hash(df)], axis=1)
+    matched = current.reset_index().merge(baseline, on=["_item_key", "_content_hash"], how="inner")
+    matched = matched.set_index(matched.columns[0])
+    return fill_matches(df, matched, reusable)
+
+
+def fill_matches(df, matched, columns):
+    """
+    Copy non-empty values from matched (indexed by row of df) into empty cells of df.
+    Returns {column: Index of rows filled}.
+    """
+    filled = {}
+    for column in columns:
+        values = matched[column]
+        values = values[~is_empty(values)]
+        if column in df.columns:
+            values = values[is_empty(df.loc[values.index, column])]
+        else:
+            df[column] = ""
+        df[column] = df[column].astype(object)
+        df.loc[values.index, column] = values
+        filled[column] = values.index
+    return filled
+
+
+def merge_filled(*results):
+    """Combine several {column: rows filled} results into one"""
+    merged = {}
+    for filled in results:
+        for column, rows in filled.items():
+            merged[column] = merged[column].union(rows) if column in merged else rows
+    return merged
+
+
+def unchanged_rows(filled, columns):
+    """Rows reused for every one of the given output columns"""
+    rows = None
+    for column in columns:
+        column_rows = filled.get(column, pd.Index([]))
+        rows = column_rows if rows is None else rows.intersection(column_rows)
+    return rows if rows is not None else pd.Index([])
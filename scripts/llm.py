@@ -0,0 +1,352 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from scripts.tracing import NULL_TRACER
+
+# Seconds one API call may take before it is abandoned (0 waits forever)
+DEFAULT_DEADLINE = float(os.getenv("LLM_DEADLINE_SECONDS", 30))
+# Send a duplicate of calls slower than the HEDGE_QUANTILE of the model's recent latencies
+DEFAULT_HEDGE = os.getenv("LLM_HEDGE", "").lower() in ("1", "true", "yes", "on")
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+# Consecutive failed calls that open the circuit, and seconds before a trial call is let through
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+# Threads that run API calls with a deadline (per process)
+CALL_THREADS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 64))
+
+# Shared limit on API requests, see set_rate_limiter
+_rate_limiter = None
+
+# Deadline and hedging for every call, see set_call_policy
+_deadline = DEFAULT_DEADLINE
+_hedge = DEFAULT_HEDGE
+
+
+def set_rate_limiter(limiter):
+    """
+    Make every chat_completion call in this process wait for limiter.acquire()
+    first (None removes the limit). Batch workers all get the same limiter.
+    """
+    global _rate_limiter
+    _rate_limiter = limiter
+
+
+def set_call_policy(deadline=DEFAULT_DEADLINE, hedge=DEFAULT_HEDGE):
+    """
+    Abandon API calls after deadline seconds (None or 0: no deadline) and, with
+    hedge, send a duplicate of calls slower than the model's usual p95 latency
+    and use whichever response arrives first.
+    """
+    global _deadline, _hedge
+    _deadline = deadline or 0
+    _hedge = bool(hedge)
+
+
+class DeadlineExceeded(TimeoutError):
+    """An API call took longer than its deadline"""
+
+
+class CircuitOpenError(RuntimeError):
+    """An API call was not sent because recent calls kept failing"""
+
+
+class CircuitBreaker:
+    """
+    Stops sending API calls after failure_threshold consecutive failures, so
+    callers fall back at once instead of waiting out deadlines and retries on
+    every item. After reset_timeout seconds one trial call is let through; it
+    closes the circuit again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not be sent"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._trial or time.time() - self._opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(f"AI requests paused after {self._failures} consecutive failures")
+            self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self.opened += 1
+                self._opened_at = time.time()
+            self._trial = False
+
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._trial else "open"
+
+    def stats(self):
+        return {"state": self.state(), "opened": self.opened, "rejected": self.rejected}
+
+
+def is_endpoint_failure(error):
+    """
+    Whether an error says the API is unavailable (timeouts, connection errors,
+    rate limits, server errors) rather than that this one request was invalid
+    """
+    status = getattr(error, "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+class LatencyTracker:
+    """Recent call latencies per model"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies = {}
+
+    def record(self, model, seconds):
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, model, q, min_samples=HEDGE_MIN_SAMPLES):
+        """The q quantile of the model's recent latencies, or None with fewer than min_samples"""
+        with self._lock:
+            latencies = sorted(self._latencies.get(model, ()))
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+# Endpoint health and latencies shared by every job in this process
+circuit_breaker = CircuitBreaker()
+latencies = LatencyTracker()
+call_counts = {"calls": 0, "hedged": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+_counts_lock = threading.Lock()
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _count(name):
+    with _counts_lock:
+        call_counts[name] += 1
+
+
+def call_stats():
+    """Calls, hedges, deadline misses and circuit breaker activity in this process so far"""
+    with _counts_lock:
+        stats = dict(call_counts)
+    stats.update(circuit_opened=circuit_breaker.opened, circuit_rejected=circuit_breaker.rejected)
+    return stats
+
+
+def _call_executor():
+    """Threads for calls with a deadline, created on first use in each process"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=CALL_THREADS, thread_name_prefix="llm-call")
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _timed_create(client, params, timeout, rate_limited):
+    """
+    Send one request; returns (response, seconds it took). With a timeout the
+    request is sent once (no client retries) and gives up after timeout
+    seconds, so a call past its deadline stops instead of running on.
+    """
+    if rate_limited and _rate_limiter is not None:
+        _rate_limiter.acquire()
+    start = time.perf_counter()
+    if timeout:
+        client = client.with_options(max_retries=0, timeout=timeout)
+    response = client.chat.completions.create(**params)
+    return response, time.perf_counter() - start
+
+
+def _send_with_deadline(client, params, deadline, hedge):
+    """
+    Send a request and wait at most deadline seconds for it. With hedge, a
+    duplicate is sent once the first has been outstanding longer than the
+    model's p95 latency; the first successful response wins. Each request
+    times out itself at the deadline, and DeadlineExceeded is only raised once
+    they have stopped. Returns (response, whether a duplicate was sent).
+    """
+    model = params.get("model")
+    if not deadline and not hedge:
+        response, seconds = _timed_create(client, params, None, False)
+        latencies.record(model, seconds)
+        return response, False
+
+    executor = _call_executor()
+    started = time.monotonic()
+    first = executor.submit(_timed_create, client, params, deadline, False)
+    pending = {first}
+    hedge_delay = latencies.quantile(model, HEDGE_QUANTILE) if hedge else None
+    hedged = False
+    error = None
+    while pending:
+        timeout = deadline - (time.monotonic() - started) if deadline else None
+        if timeout is not None and timeout <= 0:
+            break
+        if hedge_delay is not None and not hedged:
+            until_hedge = max(0, hedge_delay - (time.monotonic() - started))
+            timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response, seconds = future.result()
+            except Exception as e:
+                error = e
+                continue
+            latencies.record(model, seconds)
+            if future is not first:
+                _count("hedge_wins")
+            return response, hedged
+        if not done and hedge_delay is not None and not hedged:
+            # The first request is slower than usual: race a duplicate against it
+            hedged = True
+            _count("hedged")
+            remaining = deadline - (time.monotonic() - started) if deadline else None
+            pending.add(executor.submit(_timed_create, client, params, remaining, True))
+
+    if not pending:
+        raise error
+    # The requests time out on their own; do not leave them running
+    wait(pending)
+    _count("deadline_exceeded")
+    raise DeadlineExceeded(f"No response from {model} within {deadline:g} seconds")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers that ask for a key while
+    its call is still running wait for it and get the same result (or error)
+    instead of running their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """function() for key, shared with concurrent callers. Returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+# Identical requests in flight at the same time, from any job in this process
+single_flight = SingleFlight()
+
+
+def request_key(params):
+    """Key for identical requests: the model, the prompts with whitespace collapsed and all other parameters"""
+    normalized = dict(params)
+    normalized["messages"] = [
+        {**message, "content": re.sub(r"\s+", " ", message.get("content") or "").strip()}
+        for message in params.get("messages", [])
+    ]
+    encoded = json.dumps(normalized, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def chat_completion(client, tracer=None, **params):
+    """
+    Send a chat completion request and record it as an "llm_call" span.
+    All classifier API calls go through here so they are instrumented the same way.
+    A request identical to one already in flight waits for that one's response.
+    Calls are abandoned after the deadline (DeadlineExceeded), optionally
+    hedged (see set_call_policy), and refused with CircuitOpenError while the
+    API keeps failing, so callers can fall back to their rules at once.
+    """
+    tracer = tracer or NULL_TRACER
+
+    def send():
+        circuit_breaker.before_call()
+        if _rate_limiter is not None:
+            with tracer.span("rate_limit_wait", category="llm"):
+                _rate_limiter.acquire()
+        with tracer.span("llm_call", category="llm", model=params.get("model")) as attrs:
+            _count("calls")
+            try:
+                response, hedged = _send_with_deadline(client, params, _deadline, _hedge)
+            except Exception as e:
+                # A rejected request still means the API is answering
+                if is_endpoint_failure(e):
+                    circuit_breaker.record_failure()
+                else:
+                    circuit_breaker.record_success()
+                raise
+            circuit_breaker.record_success()
+            attrs["hedged"] = hedged
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                attrs["prompt_tokens"] = usage.prompt_tokens
+                attrs["completion_tokens"] = usage.completion_tokens
+                attrs["tokens"] = usage.total_tokens
+            return response
+
+    with tracer.span("llm_request", category="llm", model=params.get("model")) as attrs:
+        response, shared = single_flight.do(request_key(params), send)
+        attrs["coalesced"] = shared
+        return response
@@ -1,11 +1,11 @@
 import argparse
+import glob
+import json
 import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
-from dotenv import load_dotenv
-from openai import OpenAI
-from tqdm import tqdm
 
 # Import custom modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -13,229 +13,685 @@ from scripts.read_csv import read_inventory_csv
 from scripts.categorize import MedicalInventoryCategorizer
 from scripts.facilitize import FacilitySuitabilityClassifier
 from scripts.description import GPTDescriptionGenerator
-
-# Load environment variables
-load_dotenv()
+from scripts.tracing import Tracer, NULL_TRACER
+from scripts.cascade import ModelCascade, DEFAULT_STAGE_MODELS, DEFAULT_CONFIDENCE_THRESHOLD
+from scripts.fused import FusedItemClassifier
+from scripts.incremental import apply_baseline, unchanged_rows, merge_filled
+from scripts.catalog import ItemCatalog
+from scripts.summary import SummaryAggregator
+from scripts.pipeline import build_stages, run_stages, run_streaming
+from scripts.ratelimit import RateLimiter
+from scripts.llm import set_rate_limiter, set_call_policy, call_stats, DEFAULT_DEADLINE, DEFAULT_HEDGE
+from scripts.clients import get_client
+from scripts.preview import run_preview, adopt_sample, format_projection, projection_records
+from scripts.priority import PRIORITY_COLUMNS, priority_order, ValueCoverage
+from scripts.clusters import CLUSTER_COLUMNS, DEFAULT_THRESHOLD, plan_clusters, skip_members, propagate_labels
+from scripts.estimate import estimate_run, format_estimate
+from scripts.bulk import BATCH_RUNNERS, get_runner, run_bulk
 
 def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description="Medical Inventory Processing System")
-    parser.add_argument("--input", required=True, help="Path to input CSV file")
-    parser.add_argument("--output", help="Path to output CSV file (default: <input_basename>_processed.csv)")
+    parser.add_argument("--input", required=True,
+                        help="Path to input CSV file, or a directory or quoted glob (e.g. \"data/*.csv\") of files "
+                             "to process as a batch")
+    parser.add_argument("--output", help="Path to output CSV file (default: <input_basename>_processed.csv); "
+                                         "for a batch, the directory the outputs are written to")
     parser.add_argument("--skip-facility", action="store_true", help="Skip facility suitability classification")
     parser.add_argument("--skip-descriptions", action="store_true", help="Skip generation of simple descriptions")
+    parser.add_argument("--electricity", action="store_true",
+                        help="Determine whether each item requires electricity (adds a \"Requires Electricity\" column)")
+    parser.add_argument("--baseline",
+                        help="Previously processed output; unchanged rows (same ITEM_NO and content) reuse its results")
+    parser.add_argument("--catalog",
+                        help="Shared item catalog database; known items reuse their stored results and new results "
+                             "are added to it (seed it with scripts/catalog.py)")
     parser.add_argument("--preserve-existing", action="store_true", default=True, 
                         help="Preserve existing category assignments (default: True)")
     parser.add_argument("--batch-size", type=int, default=50, 
                         help="Batch size for API calls to avoid rate limiting (default: 50)")
     parser.add_argument("--description-batch", type=int, 
                         help="Number of items to process for descriptions (for testing, default: all items)")
+    parser.add_argument("--category-models", default=",".join(DEFAULT_STAGE_MODELS["categorization"]),
+                        help="Comma-separated models for categorization, cheapest first; later models are only "
+                             "asked when earlier ones are unsure (default: %(default)s)")
+    parser.add_argument("--facility-models", default=",".join(DEFAULT_STAGE_MODELS["facility"]),
+                        help="Comma-separated models for facility suitability, cheapest first (default: %(default)s)")
+    parser.add_argument("--cascade-threshold", type=float, default=DEFAULT_CONFIDENCE_THRESHOLD,
+                        help="Minimum answer confidence (0-1) before escalating to the next model (default: %(default)s)")
+    parser.add_argument("--fused", action="store_true",
+                        help="Ask for category, facility suitability and description in one AI call per item")
+    parser.add_argument("--fused-model", default="gpt-3.5-turbo",
+                        help="Model used for combined calls in --fused mode (default: %(default)s)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Run stages one at a time instead of running independent stages in parallel")
+    parser.add_argument("--stream", action="store_true",
+                        help="Pass rows through the stages in chunks and write finished rows to "
+                             "<output_basename>_partial.csv while the run continues")
+    parser.add_argument("--chunk-size", type=int, default=100,
+                        help="Rows per chunk in --stream mode (default: %(default)s)")
+    parser.add_argument("--bulk", choices=["manual"] + list(BATCH_RUNNERS),
+                        help="Send the AI requests as JSONL batch files in two rounds (categories and "
+                             "descriptions, then facility and electricity) instead of one call per item: openai "
+                             "submits them to the Batch API and waits, local runs them with ordinary calls, manual "
+                             "only writes <input_basename>_round<N>_requests.jsonl and reads "
+                             "<input_basename>_round<N>_results.jsonl when run again. Categories and facility use "
+                             "only the first model of their cascade, without escalation, so results can differ "
+                             "from the default gpt-3.5-turbo,gpt-4 facility cascade")
+    parser.add_argument("--bulk-dir",
+                        help="Directory for the batch request and result files (default: <output_basename>_bulk)")
+    parser.add_argument("--cluster", action="store_true",
+                        help="Classify one representative per group of near-identical descriptions "
+                             "(e.g. size or colour variants) and copy its labels to the rest")
+    parser.add_argument("--cluster-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Minimum estimated similarity (0-1) to a representative for --cluster (default: %(default)s)")
+    parser.add_argument("--preview", type=int, metavar="N",
+                        help="Classify a stratified sample of N items (by CATEGORY and VENDOR_NAME) first and show "
+                             "the projected distributions before the full run")
+    parser.add_argument("--priority", metavar="COLUMN",
+                        help="Process rows by descending value of a numeric column (e.g. "
+                             f"{', '.join(PRIORITY_COLUMNS)}) instead of file order; the output keeps the file order")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report how many items each step would send to the AI, the estimated tokens per model "
+                             "and the projected time, without any API call or output file")
+    parser.add_argument("--trace", action="store_true",
+                        help="Write a Chrome trace of the run to <output_basename>_trace.json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Files processed at the same time in batch mode (default: number of CPUs)")
+    parser.add_argument("--requests-per-minute", type=float,
+                        help="Limit on AI requests per minute, shared by all batch workers (default: no limit)")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_DEADLINE,
+                        help=f"Seconds an AI request may take before it is abandoned and the item falls back "
+                             f"to keyword rules or Needs Review (default: {DEFAULT_DEADLINE:g}; 0 waits forever)")
+    parser.add_argument("--hedge", action=argparse.BooleanOptionalAction, default=DEFAULT_HEDGE,
+                        help="Send a duplicate of AI requests that take longer than the model's usual 95th "
+                             "percentile and use whichever answers first (default: LLM_HEDGE, off)")
+    parser.add_argument("--manifest",
+                        help="Batch manifest with per-file timings and summary stats "
+                             "(default: batch_manifest.json in the output directory)")
     
     return parser.parse_args()
 
-def generate_summary_report(df, output_path, processing_time, skip_facility=False, skip_descriptions=False):
-    """Generate a summary report of the processing results"""
-    # Create a summary report
+def print_distribution(df, column):
+    """Print the value distribution of an output column"""
+    print(f"\n   {column} Distribution:")
+    counts = df[column].value_counts()
+    for value, count in counts.items():
+        percentage = (count / len(df)) * 100
+        print(f"   - {value}: {count} ({percentage:.1f}%)")
+
+def print_cascade_stats(cascade):
+    """Print how many AI answers each model in a cascade produced"""
+    if len(cascade.models) < 2:
+        return
+    print("\n   Model cascade usage:")
+    for model, stats in cascade.stats().items():
+        print(f"   - {model}: {stats['answered']} answered, {stats['escalated']} escalated")
+
+def call_notes(before, deadline):
+    """Report lines on hedged, abandoned and refused AI calls since the call_stats() snapshot before"""
+    stats = {name: value - before[name] for name, value in call_stats().items()}
+    notes = []
+    if stats["hedged"]:
+        notes.append(f"Slow AI requests hedged with a duplicate: {stats['hedged']} "
+                     f"({stats['hedge_wins']} answered by the duplicate)")
+    if stats["deadline_exceeded"]:
+        notes.append(f"AI requests abandoned after the {deadline:g} second deadline: {stats['deadline_exceeded']}")
+    if stats["circuit_rejected"]:
+        notes.append(f"AI requests skipped while the API was failing: {stats['circuit_rejected']}")
+    return notes
+
+def init_worker(limiter, deadline, hedge):
+    """Batch worker process setup: the shared rate limit and the call policy"""
+    set_rate_limiter(limiter)
+    set_call_policy(deadline, hedge)
+
+def generate_summary_report(summary, input_path, output_path, processing_time, notes=()):
+    """Write the text and JSON summary reports from the aggregated totals"""
     report_path = os.path.splitext(output_path)[0] + "_summary.txt"
-    
-    with open(report_path, "w") as f:
-        f.write("Medical Inventory Processing Summary\n")
-        f.write("==================================\n\n")
-        
-        f.write(f"Input file: {args.input}\n")
-        f.write(f"Output file: {output_path}\n")
-        f.write(f"Processing time: {processing_time:.2f} seconds\n\n")
-        
-        f.write(f"Total items processed: {len(df)}\n\n")
-        
-        # Product Category distribution
-        f.write("Product Category Distribution:\n")
-        f.write("----------------------------\n")
-        category_counts = df["Product Category"].value_counts()
-        total_items = len(df)
-        
-        for category, count in category_counts.items():
-            percentage = (count / total_items) * 100
-            f.write(f"{category}: {count} ({percentage:.1f}%)\n")
-        
-        # Facility Suitability distribution (if available)
-        if not skip_facility and "Facility Suitability" in df.columns:
-            f.write("\nFacility Suitability Distribution:\n")
-            f.write("--------------------------------\n")
-            facility_counts = df["Facility Suitability"].value_counts()
-            
-            for facility, count in facility_counts.items():
-                percentage = (count / total_items) * 100
-                f.write(f"{facility}: {count} ({percentage:.1f}%)\n")
-        
-        # Cross-tabulation of Category and Facility Suitability
-        if not skip_facility and "Facility Suitability" in df.columns:
-            f.write("\nCategory by Facility Cross-tabulation:\n")
-            f.write("---------------------------------\n")
-            cross_tab = pd.crosstab(df["Product Category"], df["Facility Suitability"])
-            f.write(cross_tab.to_string())
-            
-        # Sample of Simple Descriptions (if available)
-        if not skip_descriptions and "SIMPLE_DESCRIPTION" in df.columns:
-            f.write("\nSample of Simple Descriptions:\n")
-            f.write("----------------------------\n")
-            # Get 10 random samples of item descriptions
-            samples = df.sample(min(10, len(df)))
-            for _, row in samples.iterrows():
-                original = row["DESCRIPTION"]
-                simple = row["SIMPLE_DESCRIPTION"]
-                f.write(f"Original: {original}\n")
-                f.write(f"Simple  : {simple}\n\n")
-            
+    summary.write_text(report_path, input_path, output_path, processing_time, notes)
+    summary.write_json(os.path.splitext(output_path)[0] + "_summary.json",
+                       input_file=input_path, output_file=output_path, processing_time=processing_time)
     print(f"Summary report written to: {report_path}")
     return report_path
 
+def preview_file(args, df, categorizer, classifier, electricity_classifier, reused, tracer):
+    """
+    Classify a stratified sample, print the projected distributions and ask
+    whether to continue with the full run (only when run interactively)
+    """
+    stages = build_stages(
+        categorizer,
+        classifier=classifier,
+        electricity_classifier=electricity_classifier,
+        reused=reused,
+        settings={"categorization": {"batch_size": args.batch_size, "preserve_existing": args.preserve_existing}}
+    )
+    print(f"\n   Preview: classifying a stratified sample of {min(args.preview, len(df))} of {len(df)} items...")
+    start_time = time.time()
+    with tracer.span("preview", rows=args.preview):
+        sample, projections = run_preview(df, args.preview, stages)
+    preview_time = time.time() - start_time
+    print(f"   Sample classified in {preview_time:.2f} seconds.")
+    for column, projection in projections.items():
+        print()
+        for line in format_projection(column, projection):
+            print(f"   {line}")
+    
+    proceed = False
+    if sys.stdin.isatty():
+        proceed = input("\nRun the full job now? [y/N] ").strip().lower() in ("y", "yes")
+    if not proceed:
+        print("\nPreview only; run again without --preview to process every item.")
+    return {
+        "continue": proceed,
+        "sample_rows": len(sample),
+        "time": preview_time,
+        "projections": projection_records(projections),
+        # Sampled rows keep their labels in the full run
+        "adopted": adopt_sample(df, sample, projections) if proceed else {},
+    }
+
+def dry_run_file(args, df, categorizer, classifier, electricity_classifier, description_generator, reused,
+                 fused_model=None):
+    """Print the pre-flight estimate for df and return it"""
+    fused = None
+    if fused_model:
+        fused = FusedItemClassifier(
+            None,
+            categorizer=categorizer,
+            facility_classifier=classifier,
+            electricity_classifier=electricity_classifier,
+            description_generator=description_generator,
+            model=fused_model
+        )
+    estimate = estimate_run(
+        df,
+        categorizer,
+        classifier=classifier,
+        electricity_classifier=electricity_classifier,
+        description_generator=description_generator,
+        reused=reused,
+        settings={
+            "categorization": {"batch_size": args.batch_size, "preserve_existing": args.preserve_existing},
+            "descriptions": {"limit": args.description_batch},
+            "fused": {"batch_size": args.batch_size, "preserve_existing": args.preserve_existing, "pause": 10,
+                      "description_limit": args.description_batch},
+        },
+        fused=fused,
+        requests_per_minute=args.requests_per_minute,
+        sequential=args.sequential
+    )
+    print("\n   Dry run: no AI requests are sent and no output is written")
+    for line in format_estimate(estimate):
+        print(f"   {line}")
+    return estimate
+
+def expand_inputs(pattern):
+    """Input files for --input: a single file, every CSV in a directory, or a glob"""
+    if os.path.isdir(pattern):
+        paths = glob.glob(os.path.join(pattern, "*.csv"))
+    elif glob.has_magic(pattern):
+        paths = glob.glob(pattern)
+    else:
+        return [pattern]
+    # Outputs of earlier runs may sit next to the inputs
+    outputs = ("_processed.csv", "_partial.csv", "_categorized.csv", "_facilitized.csv")
+    return sorted(path for path in paths if os.path.isfile(path) and not path.endswith(outputs))
+
+def process_file(args, input_path, output_path):
+    """Process one inventory file with the options in args and return its stats"""
+    # Shared pooled OpenAI client (one per worker process); a dry run sends no requests and needs no key
+    client = None if args.dry_run else get_client()
+    tracer = Tracer(job_name=os.path.basename(input_path)) if args.trace else NULL_TRACER
+    calls_before = call_stats()
+    
+    # 1. Read and validate the CSV file
+    print(f"\n1. Reading and validating CSV file: {input_path}")
+    start_time = time.time()
+    with tracer.span("read", path=input_path):
+        df = read_inventory_csv(input_path)
+    read_time = time.time() - start_time
+    print(f"   CSV file read in {read_time:.2f} seconds.")
+    
+    # Most valuable rows first, so a stopped run has covered as much value as possible
+    file_order = df.index
+    coverage = None
+    if args.priority:
+        df = df.loc[priority_order(df, args.priority)]
+        coverage = ValueCoverage(df, args.priority)
+        print(f"   Rows will be processed by descending {args.priority}")
+    
+    # Set up the classifiers for the enabled stages
+    category_cascade = ModelCascade.from_string(args.category_models, args.cascade_threshold)
+    categorizer = MedicalInventoryCategorizer(client, tracer=tracer, cascade=category_cascade)
+    
+    classifier = None
+    if not args.skip_facility:
+        facility_cascade = ModelCascade.from_string(args.facility_models, args.cascade_threshold)
+        classifier = FacilitySuitabilityClassifier(client, tracer=tracer, cascade=facility_cascade)
+    
+    electricity_classifier = None
+    if args.electricity:
+        electricity_classifier = classifier or FacilitySuitabilityClassifier(client, tracer=tracer)
+    
+    description_generator = None
+    if not args.skip_descriptions:
+        description_generator = GPTDescriptionGenerator(client, tracer=tracer)
+    
+    # Output columns written by the enabled stages
+    output_columns = ["Product Category"]
+    if classifier:
+        output_columns.append("Facility Suitability")
+    if electricity_classifier:
+        output_columns.append("Requires Electricity")
+    if description_generator:
+        output_columns.append("SIMPLE_DESCRIPTION")
+    
+    # Running totals for the summary report
+    summary = SummaryAggregator(output_columns)
+    notes = []
+    
+    # Reuse results for rows that have not changed since a previous run
+    reused = {}
+    if args.baseline:
+        print(f"\n   Matching rows against baseline: {args.baseline}")
+        with tracer.span("baseline", path=args.baseline):
+            reused = apply_baseline(df, pd.read_csv(args.baseline), output_columns)
+        print(f"   Unchanged rows copied from baseline: {len(unchanged_rows(reused, output_columns))}/{len(df)}")
+        notes.append(f"Unchanged items reused from previous results: {len(unchanged_rows(reused, output_columns))}")
+        for column in output_columns:
+            print(f"   - {column}: {len(reused.get(column, []))} reused")
+    
+    # Reuse results any earlier job stored for the same items
+    catalog = None
+    if args.catalog and args.dry_run and not os.path.exists(args.catalog):
+        print(f"\n   Catalog {args.catalog} does not exist yet; no items are found in it")
+    elif args.catalog:
+        # A dry run only reads the catalog and never creates or changes it
+        catalog = ItemCatalog(args.catalog, read_only=args.dry_run)
+        print(f"\n   Looking up items in catalog: {args.catalog}")
+        with tracer.span("catalog_lookup", path=args.catalog):
+            known = catalog.lookup(df, output_columns)
+        print(f"   Items found in catalog: {len(unchanged_rows(known, output_columns))}/{len(df)}")
+        notes.append(f"Items found in shared catalog: {len(unchanged_rows(known, output_columns))}")
+        reused = merge_filled(reused, known)
+    
+    # Descriptions are checkpointed here while they are generated
+    checkpoint_file = f"{output_path}.temp"
+    
+    # Projected distributions from a sample; its answers are kept for the full run
+    if args.preview and args.dry_run:
+        print("\n   --preview is not run with --dry-run")
+    elif args.preview:
+        preview = preview_file(args, df, categorizer, classifier, electricity_classifier, reused, tracer)
+        if not preview["continue"]:
+            return {
+                "input": input_path,
+                "output": output_path,
+                "status": "preview",
+                "rows": len(df),
+                "sample_rows": preview["sample_rows"],
+                "read_time": read_time,
+                "preview_time": preview["time"],
+                "total_time": read_time + preview["time"],
+                "projections": preview["projections"],
+            }
+        reused = merge_filled(reused, preview["adopted"])
+        notes.append(f"Items classified in the preview sample: {preview['sample_rows']}")
+    
+    # Near-duplicate items skip the label stages and copy their representative's labels afterwards
+    clusters = pd.Series(dtype=object)
+    cluster_targets = {}
+    cluster_columns = [column for column in CLUSTER_COLUMNS if column in output_columns]
+    if args.cluster and (args.fused or args.stream):
+        print("\n   --cluster is only used with staged processing; ignored with --fused and --stream")
+    elif args.cluster:
+        print(f"\n   Grouping near-identical descriptions (similarity >= {args.cluster_threshold})")
+        with tracer.span("cluster", rows=len(df)):
+            clusters = plan_clusters(df, cluster_columns, reused, threshold=args.cluster_threshold)
+        print(f"   Items that will copy labels from a representative: {len(clusters)} "
+              f"({clusters.nunique()} representatives)")
+        cluster_targets = skip_members(reused, clusters, cluster_columns)
+    
+    if args.dry_run:
+        start_time = time.time()
+        estimate = dry_run_file(args, df, categorizer, classifier, electricity_classifier, description_generator,
+                                reused, fused_model=args.fused_model if args.fused else None)
+        return {
+            "input": input_path,
+            "output": output_path,
+            "status": "dry-run",
+            "rows": len(df),
+            "read_time": read_time,
+            "total_time": read_time + time.time() - start_time,
+            "estimate": estimate,
+        }
+    
+    if args.bulk:
+        # 2-4. Every step's AI requests as one batch file per round
+        bulk_dir = args.bulk_dir or os.path.splitext(output_path)[0] + "_bulk"
+        print(f"\n2. Classifying items with batch files in {bulk_dir} ({args.bulk})...")
+        start_time = time.time()
+        with tracer.span("bulk", runner=args.bulk):
+            df, bulk_report = run_bulk(
+                df,
+                categorizer,
+                classifier=classifier,
+                electricity_classifier=electricity_classifier,
+                description_generator=description_generator,
+                reused=reused,
+                settings={
+                    "categorization": {"preserve_existing": args.preserve_existing},
+                    "descriptions": {"limit": args.description_batch},
+                },
+                runner=get_runner(args.bulk, client, tracer),
+                work_dir=bulk_dir,
+                name=os.path.splitext(os.path.basename(input_path))[0]
+            )
+        classification_time = time.time() - start_time
+        if bulk_report["status"] == "waiting":
+            print(f"\n   Submit {bulk_report['pending']} to the Batch API and save its output as "
+                  f"{bulk_report['results']}, then run the same command again.")
+            return {
+                "input": input_path,
+                "output": output_path,
+                "status": "waiting",
+                "rows": len(df),
+                "pending": bulk_report["pending"],
+                "total_time": read_time + classification_time,
+            }
+        for stage, counts in bulk_report["stages"].items():
+            print(f"   {stage}: {counts['requests']} requests, {counts['failed']} failed")
+            if counts["failed"]:
+                notes.append(f"Batch requests without an answer ({stage}): {counts['failed']}")
+        print(f"   Batch classification completed in {classification_time:.2f} seconds.")
+        
+        if len(clusters):
+            filled = propagate_labels(df, clusters, cluster_targets)
+            labelled = len(set().union(*filled.values()))
+            print(f"   Items labelled from a near-duplicate representative: {labelled}")
+            notes.append(f"Items labelled from a near-duplicate representative: {labelled}")
+        summary.add_frame(df)
+    
+        print_distribution(df, "Product Category")
+        if classifier:
+            print_distribution(df, "Facility Suitability")
+        if electricity_classifier:
+            print_distribution(df, "Requires Electricity")
+    elif args.fused:
+        # 2-4. One combined AI call per item for all enabled stages
+        print("\n2. Classifying items with one combined AI call per item...")
+        fused = FusedItemClassifier(
+            client,
+            categorizer=categorizer,
+            facility_classifier=classifier,
+            electricity_classifier=electricity_classifier,
+            description_generator=description_generator,
+            tracer=tracer,
+            model=args.fused_model
+        )
+    
+        # Rows reused for every column are finished already; the rest are counted as they finish
+        summary.add_frame(df.loc[unchanged_rows(reused, output_columns)])
+    
+        start_time = time.time()
+        df = fused.process_dataframe(
+            df,
+            preserve_existing=args.preserve_existing,
+            batch_size=args.batch_size,
+            pause=10,
+            description_limit=args.description_batch,
+            skip_rows=reused,
+            row_callback=lambda i: summary.add_row(df.loc[i])
+        )
+        classification_time = time.time() - start_time
+        print(f"   Combined classification completed in {classification_time:.2f} seconds.")
+    
+        print_distribution(df, "Product Category")
+        if classifier:
+            print_distribution(df, "Facility Suitability")
+        if electricity_classifier:
+            print_distribution(df, "Requires Electricity")
+    else:
+        # 2-4. Enabled stages; stages that do not depend on each other run in parallel
+        stages = build_stages(
+            categorizer,
+            classifier=classifier,
+            electricity_classifier=electricity_classifier,
+            description_generator=description_generator,
+            reused=reused,
+            settings={
+                "categorization": {"batch_size": args.batch_size, "preserve_existing": args.preserve_existing},
+                # Streamed rows are saved to the partial output instead of the checkpoint
+                "descriptions": {"limit": args.description_batch,
+                                 "checkpoint_file": None if args.stream else checkpoint_file},
+            }
+        )
+    
+        start_time = time.time()
+        if args.stream:
+            # Rows are written to the partial output as soon as they have been through every stage
+            partial_path = os.path.splitext(output_path)[0] + "_partial.csv"
+            print(f"\n2. Streaming rows through {' -> '.join(stage.name for stage in stages)} "
+                  f"in chunks of {args.chunk_size}; finished rows go to {partial_path}")
+            written = {"rows": 0}
+    
+            def save_chunk(chunk):
+                chunk.to_csv(partial_path, mode="a" if written["rows"] else "w", header=not written["rows"], index=False)
+                written["rows"] += len(chunk)
+                summary.add_frame(chunk)
+                if coverage:
+                    coverage.add(chunk.index)
+                print(f"   {written['rows']}/{len(df)} rows finished"
+                      f"{f' ({coverage.describe()})' if coverage else ''}")
+    
+            df = run_streaming(df, stages, chunk_size=args.chunk_size, on_chunk=save_chunk)
+            classification_time = time.time() - start_time
+            print(f"   All stages completed in {classification_time:.2f} seconds.")
+        else:
+            print(f"\n2. Running stages: {', '.join(stage.name for stage in stages)}"
+                  f"{' (one at a time)' if args.sequential else ''}...")
+            df, durations = run_stages(df, stages, max_workers=1 if args.sequential else None)
+            classification_time = time.time() - start_time
+            for name, seconds in durations.items():
+                print(f"   Stage {name} completed in {seconds:.2f} seconds.")
+            print(f"   All stages completed in {classification_time:.2f} seconds.")
+    
+            if len(clusters):
+                filled = propagate_labels(df, clusters, cluster_targets)
+                labelled = len(set().union(*filled.values()))
+                print(f"   Items labelled from a near-duplicate representative: {labelled}")
+                notes.append(f"Items labelled from a near-duplicate representative: {labelled}")
+    
+            # Every row finishes with the last stage
+            summary.add_frame(df)
+    
+        print_distribution(df, "Product Category")
+        print_cascade_stats(category_cascade)
+        if classifier:
+            print_distribution(df, "Facility Suitability")
+            print_cascade_stats(facility_cascade)
+        if electricity_classifier:
+            print_distribution(df, "Requires Electricity")
+    
+    # AI answers shared by items whose descriptions differ only in spelling
+    reused_answers = categorizer.reused_answers + (classifier.reused_answers if classifier else 0)
+    if reused_answers:
+        print(f"\n   AI answers reused for items with the same canonical description: {reused_answers}")
+        notes.append(f"AI answers reused for items with the same canonical description: {reused_answers}")
+    
+    if args.priority:
+        df = df.loc[file_order]
+        notes.append(f"Rows processed by descending {args.priority}")
+    
+    for note in call_notes(calls_before, args.deadline):
+        print(f"\n   {note}")
+        notes.append(note)
+    
+    # Save the processed data
+    print(f"\n   Saving results to {output_path}")
+    with tracer.span("write", path=output_path):
+        df.to_csv(output_path, index=False)
+    if catalog:
+        with tracer.span("catalog_record", path=args.catalog):
+            recorded = catalog.record(df, output_columns)
+        print(f"   Catalog updated with {recorded} items")
+    
+    # Export the trace before reporting so it survives a failing summary step
+    trace_path = None
+    if args.trace:
+        trace_path = tracer.export(os.path.splitext(output_path)[0] + "_trace.json")
+        print(f"\n   Trace written to: {trace_path}")
+        for name, seconds in sorted(tracer.totals().items(), key=lambda item: -item[1]):
+            print(f"   - {name}: {seconds:.2f} seconds")
+    
+    # 5. Generate summary report
+    total_time = read_time + classification_time
+    print(f"\n5. Generating summary report...")
+    report_path = generate_summary_report(summary, input_path, output_path, total_time, notes)
+    
+    # Clean up the description checkpoint and the partial output
+    for leftover in (checkpoint_file, os.path.splitext(output_path)[0] + "_partial.csv"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+            print(f"\nRemoved intermediate file: {leftover}")
+    
+    print(f"\nProcessing completed successfully in {total_time:.2f} seconds.")
+    print(f"Results saved to: {output_path}")
+    print(f"Summary report: {report_path}")
+    if trace_path:
+        print(f"Trace: {trace_path}")
+    
+    return {
+        "input": input_path,
+        "output": output_path,
+        "status": "completed",
+        "rows": len(df),
+        "read_time": read_time,
+        "classification_time": classification_time,
+        "total_time": total_time,
+        "report": report_path,
+        "trace": trace_path,
+        "summary": summary.to_dict(),
+    }
+
+def _batch_worker(args, input_path, output_path):
+    """Process pool entry point: process one file and report failures instead of raising"""
+    start = time.time()
+    try:
+        return process_file(args, input_path, output_path)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"input": input_path, "output": output_path, "status": "failed", "error": str(e),
+                "total_time": time.time() - start}
+
+def run_batch(args, inputs):
+    """Process many files in a process pool and write the combined manifest"""
+    output_dir = args.output or None
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    def output_for(input_path):
+        name = f"{os.path.splitext(os.path.basename(input_path))[0]}_processed.csv"
+        return os.path.join(output_dir or os.path.dirname(input_path), name)
+    
+    workers = max(1, min(args.workers, len(inputs)))
+    limiter = RateLimiter(args.requests_per_minute) if args.requests_per_minute else None
+    print(f"Processing {len(inputs)} files with {workers} workers"
+          f"{f', at most {args.requests_per_minute:g} AI requests per minute' if limiter else ''}")
+    
+    start_time = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(limiter, args.deadline, args.hedge)) as pool:
+        futures = {pool.submit(_batch_worker, args, path, output_for(path)): path for path in inputs}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(inputs)}] {result['input']}: {result['status']} "
+                  f"in {result['total_time']:.2f} seconds")
+    wall_time = time.time() - start_time
+    
+    # Keep the manifest in input order and add totals over all files
+    results.sort(key=lambda result: inputs.index(result["input"]))
+    completed = [result for result in results if result["status"] == "completed"]
+    distributions = {}
+    for result in completed:
+        for column, counts in result["summary"]["distributions"].items():
+            combined = distributions.setdefault(column, {})
+            for value, count in counts.items():
+                combined[value] = combined.get(value, 0) + count
+    manifest = {
+        "files": len(inputs),
+        "completed": len(completed),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "workers": workers,
+        "requests_per_minute": args.requests_per_minute,
+        "wall_time": wall_time,
+        "total_rows": sum(result["rows"] for result in completed),
+        "distributions": distributions,
+        "results": results,
+    }
+    
+    manifest_path = args.manifest or os.path.join(output_dir or os.path.dirname(inputs[0]) or ".", "batch_manifest.json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    
+    print(f"\nBatch finished in {wall_time:.2f} seconds: {manifest['completed']} completed, {manifest['failed']} failed, "
+          f"{manifest['total_rows']} rows")
+    print(f"Manifest: {manifest_path}")
+    return manifest
+
 def main():
     # Get command line arguments
     args = parse_arguments()
     
-    # Validate input file
-    if not os.path.exists(args.input):
+    # Validate input files
+    inputs = expand_inputs(args.input)
+    if not inputs:
+        print(f"Error: No CSV files match: {args.input}")
+        sys.exit(1)
+    if len(inputs) == 1 and not os.path.exists(inputs[0]):
         print(f"Error: Input file does not exist: {args.input}")
         sys.exit(1)
+    if args.baseline and not os.path.exists(args.baseline):
+        print(f"Error: Baseline file does not exist: {args.baseline}")
+        sys.exit(1)
+    
+    # Check for OpenAI API key (also read from .env); dry runs only estimate
+    if not args.dry_run:
+        try:
+            get_client()
+        except ValueError:
+            print("Error: OPENAI_API_KEY is not set in the environment or .env file.")
+            print("Please set your OpenAI API key before running this script.")
+            sys.exit(1)
+    
+    if args.bulk and (args.fused or args.stream):
+        print("--bulk sends each step's own requests; --fused and --stream are ignored")
+        args.fused = args.stream = False
+    
+    # A directory or glob is processed as a batch
+    if len(inputs) > 1 or inputs[0] != args.input:
+        if args.preview:
+            print("--preview is only used for single files; ignored in batch mode")
+            args.preview = None
+        manifest = run_batch(args, inputs)
+        sys.exit(1 if manifest["failed"] else 0)
     
     # Determine output path
     if not args.output:
         base_name = os.path.splitext(args.input)[0]
         args.output = f"{base_name}_processed.csv"
     
-    # Check for OpenAI API key
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        print("Error: OPENAI_API_KEY is not set in the environment or .env file.")
-        print("Please set your OpenAI API key before running this script.")
-        sys.exit(1)
+    if args.requests_per_minute:
+        set_rate_limiter(RateLimiter(args.requests_per_minute))
+    set_call_policy(args.deadline, args.hedge)
     
     try:
-        # Initialize OpenAI client
-        client = OpenAI(api_key=api_key)
-        
-        # 1. Read and validate the CSV file
-        print(f"\n1. Reading and validating CSV file: {args.input}")
-        start_time = time.time()
-        df = read_inventory_csv(args.input)
-        read_time = time.time() - start_time
-        print(f"   CSV file read in {read_time:.2f} seconds.")
-        
-        # 2. Categorize items
-        print("\n2. Categorizing medical inventory items...")
-        categorizer = MedicalInventoryCategorizer(client)
-        
-        # Determine if we need to create intermediate files
-        categorized_output = args.output
-        if not args.skip_facility or not args.skip_descriptions:
-            # Create an intermediate file if we're doing more processing steps
-            categorized_output = os.path.splitext(args.output)[0] + "_categorized.csv"
-        
-        start_time = time.time()
-        df = categorizer.process_csv(
-            input_file=args.input,
-            output_file=categorized_output,
-            batch_size=args.batch_size,
-            preserve_existing=args.preserve_existing
-        )
-        category_time = time.time() - start_time
-        print(f"   Categorization completed in {category_time:.2f} seconds.")
-        
-        # Print category distribution
-        print("\n   Product Category Distribution:")
-        category_counts = df["Product Category"].value_counts()
-        for category, count in category_counts.items():
-            percentage = (count / len(df)) * 100
-            print(f"   - {category}: {count} ({percentage:.1f}%)")
-        
-        # 3. Classify facility suitability (if not skipped)
-        facility_time = 0
-        facility_output = categorized_output
-        
-        if not args.skip_facility:
-            print("\n3. Classifying facility suitability...")
-            classifier = FacilitySuitabilityClassifier(client)
-            
-            if not args.skip_descriptions:
-                # Create intermediate file if we're adding descriptions after
-                facility_output = os.path.splitext(args.output)[0] + "_facilitized.csv"
-            else:
-                facility_output = args.output
-            
-            start_time = time.time()
-            df = classifier.process_csv(
-                input_file=categorized_output,
-                output_file=facility_output,
-                category_col="Product Category"
-            )
-            facility_time = time.time() - start_time
-            print(f"   Facility classification completed in {facility_time:.2f} seconds.")
-            
-            # Print facility distribution
-            print("\n   Facility Suitability Distribution:")
-            facility_counts = df["Facility Suitability"].value_counts()
-            for facility, count in facility_counts.items():
-                percentage = (count / len(df)) * 100
-                print(f"   - {facility}: {count} ({percentage:.1f}%)")
-        
-        # 4. Generate simple descriptions (if not skipped)
-        description_time = 0
-        if not args.skip_descriptions:
-            print("\n4. Generating simple layperson-friendly descriptions...")
-            description_generator = GPTDescriptionGenerator()
-            
-            start_time = time.time()
-            input_for_desc = facility_output if not args.skip_facility else categorized_output
-            
-            # Use the process_inventory_file method directly from the imported module
-            final_df = description_generator.process_inventory_file(
-                input_file=input_for_desc,
-                output_file=args.output,
-                batch_size=args.description_batch
-            )
-            
-            # Update our working dataframe
-            df = final_df
-            
-            description_time = time.time() - start_time
-            print(f"   Description generation completed in {description_time:.2f} seconds.")
-        
-        # 5. Generate summary report
-        total_time = read_time + category_time + facility_time + description_time
-        print(f"\n5. Generating summary report...")
-        report_path = generate_summary_report(
-            df, 
-            args.output, 
-            total_time, 
-            skip_facility=args.skip_facility,
-            skip_descriptions=args.skip_descriptions
-        )
-        
-        # Clean up intermediate files
-        intermediate_files = []
-        if not args.skip_facility and not args.skip_descriptions:
-            if os.path.exists(categorized_output) and categorized_output != args.output:
-                intermediate_files.append(categorized_output)
-            if os.path.exists(facility_output) and facility_output != args.output:
-                intermediate_files.append(facility_output)
-        elif not args.skip_facility:
-            if os.path.exists(categorized_output) and categorized_output != args.output:
-                intermediate_files.append(categorized_output)
-        elif not args.skip_descriptions:
-            if os.path.exists(categorized_output) and categorized_output != args.output:
-                intermediate_files.append(categorized_output)
-        
-        if intermediate_files:
-            print("\nCleaning up intermediate files...")
-            for file in intermediate_files:
-                os.remove(file)
-                print(f"   Removed: {file}")
-        
-        print(f"\nProcessing completed successfully in {total_time:.2f} seconds.")
-        print(f"Results saved to: {args.output}")
-        print(f"Summary report: {report_path}")
-        
+        process_file(args, args.input, args.output)
     except Exception as e:
         print(f"\nError: {str(e)}")
         import traceback
@@ -0,0 +1,238 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+
+
+class Stage:
+    """
+    One pipeline step. run(df) receives a private copy of the data with the outputs
+    of every stage in depends_on already filled in, and returns the DataFrame with
+    its own output columns set. inputs lists the columns run reads (None: all);
+    run_stages copies only those and the outputs.
+    """
+
+    def __init__(self, name, run, outputs, depends_on=(), inputs=None):
+        self.name = name
+        self.run = run
+        self.outputs = list(outputs)
+        self.depends_on = list(depends_on)
+        self.inputs = None if inputs is None else list(inputs)
+
+    def columns(self, df):
+        """Columns of df the stage needs to see"""
+        if self.inputs is None:
+            return list(df.columns)
+        return [column for column in df.columns if column in self.inputs or column in self.outputs]
+
+
+def run_stages(df, stages, max_workers=None, on_stage=None):
+    """
+    Run stages as soon as their dependencies have finished, independent ones in
+    parallel threads. Each stage works on its own copy of the columns it reads and
+    writes, and its output columns are copied back when it finishes, after which
+    on_stage(stage name) is called. Returns (df, seconds per stage).
+    """
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        unknown = [name for name in stage.depends_on if name not in names]
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {', '.join(unknown)}")
+
+    pending = list(stages)
+    done = set()
+    durations = {}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1) as pool:
+        while pending or running:
+            # Start everything whose dependencies are complete
+            for stage in [stage for stage in pending if all(name in done for name in stage.depends_on)]:
+                pending.remove(stage)
+                snapshot = df[stage.columns(df)].copy()
+                running[pool.submit(_timed, stage.run, snapshot)] = stage
+
+            if not running:
+                raise ValueError(f"Stage dependencies form a cycle: {', '.join(stage.name for stage in pending)}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                result, seconds = future.result()
+                for column in stage.outputs:
+                    df[column] = result[column]
+                durations[stage.name] = seconds
+                done.add(stage.name)
+                if on_stage:
+                    on_stage(stage.name)
+
+    return df, durations
+
+
+def _timed(function, *args):
+    start = time.time()
+    return function(*args), time.time() - start
+
+
+def build_stages(categorizer, classifier=None, electricity_classifier=None, description_generator=None,
+                 reused=None, settings=None, progress=None, row_progress=None):
+    """
+    Stages for the enabled classifiers. settings maps a stage name to extra keyword
+    arguments for its DataFrame method (batch_size, pause, ...); progress(stage name)
+    returns a progress callback for that stage, or None, and row_progress(stage name)
+    likewise a callback receiving each row the stage has written.
+    """
+    reused = reused or {}
+    settings = settings or {}
+    progress = progress or (lambda name: None)
+    row_progress = row_progress or (lambda name: None)
+
+    def options(name):
+        kwargs = dict(settings.get(name, {}))
+        callback = progress(name)
+        if callback:
+            kwargs["progress_callback"] = callback
+        row_callback = row_progress(name)
+        if row_callback:
+            kwargs["row_callback"] = row_callback
+        return kwargs
+
+    stages = [Stage(
+        "categorization",
+        lambda data, kwargs=options("categorization"): categorizer.categorize_dataframe(
+            data, skip_rows=reused.get("Product Category"), **kwargs),
+        outputs=["Product Category"],
+        inputs=["DESCRIPTION", "VENDOR_NAME", "SUBCATEGORY"]
+    )]
+    if classifier:
+        stages.append(Stage(
+            "facility",
+            lambda data, kwargs=options("facility"): classifier.classify_dataframe(
+                data, category_col="Product Category", skip_rows=reused.get("Facility Suitability"), **kwargs),
+            outputs=["Facility Suitability"],
+            depends_on=["categorization"],
+            inputs=["DESCRIPTION", "VENDOR_NAME", "Product Category"]
+        ))
+    if electricity_classifier:
+        stages.append(Stage(
+            "electricity",
+            lambda data, kwargs=options("electricity"): electricity_classifier.electricity_dataframe(
+                data, category_col="Product Category", skip_rows=reused.get("Requires Electricity"), **kwargs),
+            outputs=["Requires Electricity"],
+            depends_on=["categorization"],
+            inputs=["DESCRIPTION", "Product Category"]
+        ))
+    if description_generator:
+        kwargs = options("descriptions")
+        skip_rows = reused.get("SIMPLE_DESCRIPTION")
+        # A description limit covers the whole run, also when the rows arrive in chunks
+        remaining = {"limit": kwargs.pop("limit", None)}
+
+        def describe(data):
+            limit = remaining["limit"]
+            if limit is not None:
+                pending = int((~data.index.isin(skip_rows if skip_rows is not None else [])).sum())
+                remaining["limit"] = max(0, limit - pending)
+            return description_generator.describe_dataframe(data, limit=limit, skip_rows=skip_rows, **kwargs)
+
+        # Descriptions only use the input columns
+        stages.append(Stage("descriptions", describe, outputs=["SIMPLE_DESCRIPTION"],
+                            inputs=["DESCRIPTION", "VENDOR_NAME", "CATEGORY", "SUBCATEGORY"]))
+    return stages
+
+
+def _dependency_order(stages):
+    """Stages sorted so every stage comes after the stages it depends on"""
+    ordered, done, pending = [], set(), list(stages)
+    while pending:
+        ready = [stage for stage in pending if all(name in done for name in stage.depends_on)]
+        if not ready:
+            raise ValueError(f"Stage dependencies form a cycle: {', '.join(stage.name for stage in pending)}")
+        for stage in ready:
+            pending.remove(stage)
+            ordered.append(stage)
+            done.add(stage.name)
+    return ordered
+
+
+_END = object()
+
+
+def run_streaming(df, stages, chunk_size=100, queue_size=2, on_chunk=None, on_progress=None):
+    """
+    Pass the rows through the stages in chunks, each stage on its own thread and
+    connected by bounded queues, so later stages work on early chunks while earlier
+    stages move on. on_chunk(chunk) is called with every chunk that has been through
+    all stages, in input order; on_progress({stage name: rows done}) after every
+    stage step. Returns the processed DataFrame.
+    """
+    ordered = _dependency_order(stages)
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(ordered) + 1)]
+    stop = threading.Event()
+    rows_done = {stage.name: 0 for stage in ordered}
+    lock = threading.Lock()
+
+    def put(target, item):
+        # Give up once another thread failed, instead of blocking on a full queue
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def feed():
+        for start in range(0, len(df), chunk_size):
+            if stop.is_set():
+                return
+            put(queues[0], df.iloc[start:start + chunk_size].copy())
+        put(queues[0], _END)
+
+    def work(stage, source, target):
+        while not stop.is_set():
+            try:
+                chunk = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is _END or isinstance(chunk, BaseException):
+                put(target, chunk)
+                return
+            try:
+                # Chunks are private copies made by the feeder, so stages can work on them in place
+                chunk = stage.run(chunk)
+            except Exception as e:
+                put(target, e)
+                return
+            with lock:
+                rows_done[stage.name] += len(chunk)
+                counts = dict(rows_done)
+            if on_progress:
+                on_progress(counts)
+            put(target, chunk)
+
+    threads = [threading.Thread(target=feed, name="stream-feed", daemon=True)]
+    for position, stage in enumerate(ordered):
+        threads.append(threading.Thread(target=work, args=(stage, queues[position], queues[position + 1]),
+                                        name=f"stream-{stage.name}", daemon=True))
+    for thread in threads:
+        thread.start()
+
+    finished = []
+    try:
+        while True:
+            chunk = queues[-1].get()
+            if chunk is _END:
+                break
+            if isinstance(chunk, BaseException):
+                raise chunk
+            if on_chunk:
+                on_chunk(chunk)
+            finished.append(chunk)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    return pd.concat(finished) if finished else df
@@ -0,0 +1,137 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from scripts.pipeline import run_stages
+
+# Input columns whose combinations form the sampling strata
+STRATA_COLUMNS = ["CATEGORY", "VENDOR_NAME"]
+
+# Strata expected to get fewer sampled rows than this are pooled into one
+MIN_PER_STRATUM = 2
+
+# Normal quantile for 95% confidence intervals
+Z_95 = 1.96
+
+# Output columns a preview projects
+PREVIEW_COLUMNS = ["Product Category", "Facility Suitability", "Requires Electricity"]
+
+
+def assign_strata(df, n, columns=STRATA_COLUMNS):
+    """
+    Stratum number per row from the combination of columns. Rows whose
+    combination is too small to get MIN_PER_STRATUM of n rows under
+    proportional allocation fall back to fewer columns (CATEGORY alone),
+    and the rest share stratum -1.
+    """
+    strata = np.full(len(df), -1)
+    present = [column for column in columns if column in df.columns]
+    if not present or n >= len(df):
+        return pd.Series(0, index=df.index)
+
+    unassigned = np.ones(len(df), dtype=bool)
+    offset = 0
+    for depth in range(len(present), 0, -1):
+        codes = df.groupby(present[:depth], dropna=False, observed=True, sort=False).ngroup().to_numpy()
+        sizes = np.bincount(codes[unassigned], minlength=codes.max() + 1)
+        take = unassigned & (sizes * n / len(df) >= MIN_PER_STRATUM)[codes]
+        strata[take] = codes[take] + offset
+        unassigned &= ~take
+        offset += len(sizes)
+    return pd.Series(strata, index=df.index)
+
+
+def allocate(sizes, n):
+    """Sample size per stratum, proportional to its size (largest remainders), at least one each"""
+    exact = sizes * n / sizes.sum()
+    counts = np.floor(exact).astype(int)
+    extra = n - counts.sum()
+    if extra > 0:
+        counts[np.argsort(-(exact - counts), kind="stable")[:extra]] += 1
+    return np.clip(counts, 1, sizes)
+
+
+def stratified_sample(df, n, columns=STRATA_COLUMNS, seed=0):
+    """
+    Stratified random sample of about n rows of df. Returns (sample, strata of
+    the sampled rows, rows per stratum in df).
+    """
+    strata = assign_strata(df, n, columns)
+    sizes = strata.value_counts().sort_index()
+    counts = pd.Series(allocate(sizes.to_numpy(), min(n, len(df))), index=sizes.index)
+
+    # Shuffle, then keep the first rows of every stratum
+    shuffled = strata.iloc[np.random.default_rng(seed).permutation(len(strata))]
+    rank = shuffled.groupby(shuffled).cumcount()
+    chosen = shuffled.index[rank.to_numpy() < counts.loc[shuffled.to_numpy()].to_numpy()]
+    chosen = df.index[np.sort(df.index.get_indexer(chosen))]
+    return df.loc[chosen].copy(), strata.loc[chosen], sizes
+
+
+def project_distribution(values, strata, sizes, z=Z_95):
+    """
+    Projected share of every value in the full file from the labels of the
+    sampled rows (stratified estimator with finite population correction).
+    Returns a DataFrame with share, low, high (confidence interval) and
+    items, largest share first.
+    """
+    values = values.astype(object).where(values.notna(), "(empty)")
+    total = sizes.sum()
+    sampled = strata.value_counts().reindex(sizes.index, fill_value=0)
+    weights = sizes / total
+    correction = (1 - sampled / sizes) / (sampled - 1).clip(lower=1)
+
+    rows = []
+    for value in values.unique():
+        p = (values == value).groupby(strata).mean().reindex(sizes.index, fill_value=0.0)
+        share = float((weights * p).sum())
+        margin = z * math.sqrt(float((weights ** 2 * correction * p * (1 - p)).sum()))
+        rows.append({"value": value, "share": share, "low": max(0.0, share - margin),
+                     "high": min(1.0, share + margin), "items": int(round(share * total))})
+    return pd.DataFrame(rows, columns=["value", "share", "low", "high", "items"]) \
+        .sort_values("share", ascending=False, kind="stable").set_index("value")
+
+
+def run_preview(df, n, stages, columns=PREVIEW_COLUMNS, seed=0):
+    """
+    Run stages on a stratified sample of n rows. Returns (classified sample,
+    {column: project_distribution of that column}).
+    """
+    sample, strata, sizes = stratified_sample(df, n, seed=seed)
+    sample, _ = run_stages(sample, stages)
+    projections = {column: project_distribution(sample[column], strata, sizes)
+                   for column in columns if column in sample.columns}
+    return sample, projections
+
+
+def adopt_sample(df, sample, columns):
+    """
+    Copy the sample's labels into df so the full run does not classify those
+    rows again. Returns {column: rows copied} in the form the stages skip.
+    """
+    adopted = {}
+    for column in columns:
+        if column not in sample.columns:
+            continue
+        if column not in df.columns:
+            df[column] = ""
+        df[column] = df[column].astype(object)
+        df.loc[sample.index, column] = sample[column].astype(object)
+        adopted[column] = sample.index
+    return adopted
+
+
+def format_projection(column, projection):
+    """Text lines for one projected distribution"""
+    lines = [f"{column} (projected, 95% confidence interval):"]
+    for value, row in projection.iterrows():
+        lines.append(f"- {value}: {row['share']:.1%} ({row['low']:.1%} - {row['high']:.1%}), ~{int(row['items']):,} items")
+    return lines
+
+
+def projection_records(projections):
+    """Projections as plain lists of dicts, for JSON and templates"""
+    return {column: [{"value": str(value), **{key: row[key] for key in ("share", "low", "high")},
+                      "items": int(row["items"])} for value, row in projection.iterrows()]
+            for column, projection in projections.items()}
@@ -0,0 +1,83 @@
+import threading
+
+import pandas as pd
+
+# Value columns rows can be prioritized by (highest value first)
+PRIORITY_COLUMNS = ["EXT_COST", "EST_PALLETS", "AVAILABILITY_QTY"]
+
+
+def priority_values(df, column):
+    """Numeric value per row; missing, non-numeric and negative values count as 0"""
+    return pd.to_numeric(df[column], errors="coerce").fillna(0).clip(lower=0)
+
+
+def priority_order(df, column):
+    """Row labels of df by descending value of column, ties in file order"""
+    if column not in df.columns:
+        raise ValueError(f"Priority column not found: {column}")
+    return priority_values(df, column).sort_values(ascending=False, kind="stable").index
+
+
+class ValueCoverage:
+    """
+    Share of a value column's total held by finished rows. Rows can be added
+    from several threads.
+    """
+
+    def __init__(self, df, column):
+        self.column = column
+        self.values = priority_values(df, column)
+        self.total = float(self.values.sum())
+        self.covered = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, rows):
+        """Count finished rows (an index label or a list/Index of them)"""
+        value = self.values.loc[rows]
+        value = float(value.sum()) if isinstance(value, pd.Series) else float(value)
+        with self._lock:
+            self.covered += value
+
+    def share(self):
+        return self.covered / self.total if self.total else 0.0
+
+    def describe(self):
+        return f"{self.share():.1%} of total {self.column}"
+
+
+class StageRows:
+    """
+    Rows finished across several concurrently running stages. A row is finished
+    once every stage has either reported it or completed; rows a stage leaves
+    untouched (reused, preserved) therefore finish when that stage completes.
+    on_finished(rows) receives each newly finished batch of row labels.
+    """
+
+    def __init__(self, index, stage_names, on_finished):
+        self.index = index
+        self.reported = {name: set() for name in stage_names}
+        self.completed = set()
+        self.finished = set()
+        self.on_finished = on_finished
+        self._lock = threading.Lock()
+
+    def _is_finished(self, row):
+        return all(name in self.completed or row in rows for name, rows in self.reported.items())
+
+    def row_done(self, name, row):
+        """Stage `name` has written its output for row"""
+        with self._lock:
+            self.reported[name].add(row)
+            if row in self.finished or not self._is_finished(row):
+                return
+            self.finished.add(row)
+        self.on_finished([row])
+
+    def stage_done(self, name):
+        """Stage `name` has completed; the rows it skipped count as done by it"""
+        with self._lock:
+            self.completed.add(name)
+            rows = [row for row in self.index if row not in self.finished and self._is_finished(row)]
+            self.finished.update(rows)
+        if rows:
+            self.on_finished(rows)
@@ -0,0 +1,33 @@
+import multiprocessing
+import time
+
+
+class RateLimiter:
+    """
+    Keeps API requests under requests_per_minute, allowing bursts of up to
+    burst requests. State lives in shared memory, so one limiter handed to
+    every worker process (and used from any number of threads) enforces a
+    single limit for all of them.
+    """
+
+    def __init__(self, requests_per_minute, burst=1):
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+        self.requests_per_minute = requests_per_minute
+        self.interval = 60.0 / requests_per_minute
+        self.burst = max(1, int(burst))
+        self._lock = multiprocessing.Lock()
+        # Theoretical arrival time of the next request (GCRA)
+        self._next = multiprocessing.Value("d", 0.0, lock=False)
+
+    def acquire(self):
+        """Wait until a request may be sent. Returns the seconds waited."""
+        with self._lock:
+            now = time.time()
+            next_time = max(self._next.value, now)
+            start = max(now, next_time - (self.burst - 1) * self.interval)
+            self._next.value = next_time + self.interval
+        wait = start - now
+        if wait > 0:
+            time.sleep(wait)
+        return max(wait, 0.0)
@@ -1,8 +1,43 @@
 import pandas as pd
+import numpy as np
 import os 
 
-def read_inventory_csv(file_path):
+# Text columns with few distinct values, loaded as categoricals
+CATEGORICAL_COLUMNS = [
+    "DC_NAME", "VENDOR_NAME", "VENDOR_ABBR", "CATEGORY",
+    "SUBCATEGORY", "SELL_UOM", "ABC_CODE", "REGULATION"
+]
 
+# Identifiers keep their dtype so matching against other files is unaffected
+KEY_COLUMNS = ["ITEM_NO", "VEND_CAT_NUM"]
+
+def compact_dtypes(df):
+    """
+    Shrink a DataFrame in place: categoricals for the repetitive text columns,
+    the smallest integer type for whole-number columns and float32 for float
+    columns whose values it holds exactly (so written CSVs do not change)
+    """
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    for column in df.select_dtypes(include="number").columns:
+        if column in KEY_COLUMNS:
+            continue
+        series = df[column]
+        if pd.api.types.is_integer_dtype(series):
+            df[column] = pd.to_numeric(series, downcast="integer")
+        elif series.dtype == np.float64:
+            narrow = series.astype(np.float32)
+            if (narrow.astype(np.float64) == series)[series.notna()].all():
+                df[column] = narrow
+    return df
+
+def read_inventory_csv(file_path, compact=True):
+    """
+    Read and validate an inventory CSV. With compact (the default) repetitive
+    text columns are read straight into categoricals and numbers are downcast,
+    which takes a fraction of the memory of plain object columns.
+    """
     try:
         # Check if file exists
         if not os.path.exists(file_path):
@@ -10,7 +45,10 @@ def read_inventory_csv(file_path):
             
         # Read CSV file
         print(f"Reading file: {file_path}")
-        df = pd.read_csv(file_path)
+        if compact:
+            df = pd.read_csv(file_path, dtype={column: "category" for column in CATEGORICAL_COLUMNS})
+        else:
+            df = pd.read_csv(file_path)
 
         # Basic validation
         expected_columns = [
@@ -30,6 +68,9 @@ def read_inventory_csv(file_path):
         if missing_columns:
             raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
 
+        if compact:
+            compact_dtypes(df)
+
         #print basic statistics
         print(f"DataFrame shape: {df.shape}")
         print(f"Columns: {df.columns.tolist()}")
@@ -0,0 +1,178 @@
+import html
+import json
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+CATEGORY_COL = "Product Category"
+FACILITY_COL = "Facility Suitability"
+ELECTRICITY_COL = "Requires Electricity"
+DESCRIPTION_COL = "SIMPLE_DESCRIPTION"
+
+# Distributions in report order, with their headings
+DISTRIBUTION_TITLES = {
+    CATEGORY_COL: "Product Category Distribution",
+    FACILITY_COL: "Facility Suitability Distribution",
+    ELECTRICITY_COL: "Requires Electricity Distribution",
+}
+
+
+class SummaryAggregator:
+    """
+    Running totals for the summary report, updated as rows finish: value counts
+    per output column, the category by facility cross-tab and a fixed-size
+    random sample of descriptions (reservoir sampling). Rendering a report only
+    reads these totals, never the processed data.
+    """
+
+    def __init__(self, columns=(CATEGORY_COL,), sample_size=10, seed=None):
+        self.columns = [column for column in DISTRIBUTION_TITLES if column in columns]
+        self.crosstab = CATEGORY_COL in columns and FACILITY_COL in columns
+        self.sample = DESCRIPTION_COL in columns
+        self.sample_size = sample_size
+        self._rng = np.random.default_rng(seed)
+        # Live reports may be rendered from another thread while rows are added
+        self._lock = threading.RLock()
+
+        self.total = 0
+        self.counts = {column: Counter() for column in self.columns}
+        self.pairs = Counter()
+        self.samples = []
+
+    def add_row(self, row):
+        """Count one finished row (a dict or Series with the output columns)"""
+        with self._lock:
+            self._add_row(row)
+
+    def _add_row(self, row):
+        self.total += 1
+        for column in self.columns:
+            value = row.get(column)
+            if value is not None and not pd.isna(value):
+                self.counts[column][value] += 1
+        if self.crosstab:
+            category, facility = row.get(CATEGORY_COL), row.get(FACILITY_COL)
+            if not pd.isna(category) and not pd.isna(facility):
+                self.pairs[(category, facility)] += 1
+        if self.sample:
+            self._offer(self.total - 1, (row.get("DESCRIPTION"), row.get(DESCRIPTION_COL)))
+
+    def add_frame(self, df):
+        """Count a block of finished rows at once"""
+        if df.empty:
+            return
+        with self._lock:
+            self._add_frame(df)
+
+    def _add_frame(self, df):
+        for column in self.columns:
+            if column in df.columns:
+                counts = df[column].value_counts()
+                # Categorical columns also list labels that do not occur
+                self.counts[column].update(counts[counts > 0].to_dict())
+        if self.crosstab and FACILITY_COL in df.columns:
+            self.pairs.update(df.groupby([CATEGORY_COL, FACILITY_COL], observed=True).size().to_dict())
+        if self.sample and DESCRIPTION_COL in df.columns:
+            # Only rows that win a reservoir slot are read
+            seen = self.total + np.arange(len(df))
+            draws = np.floor(self._rng.random(len(df)) * (seen + 1)).astype(int)
+            for position in np.flatnonzero((draws < self.sample_size) | (seen < self.sample_size)):
+                row = df.iloc[position]
+                self._offer(int(seen[position]), (row.get("DESCRIPTION"), row[DESCRIPTION_COL]), int(draws[position]))
+        self.total += len(df)
+
+    def _offer(self, seen, pair, draw=None):
+        """Algorithm R: the n-th row (0-based) replaces a random slot with probability k/(n+1)"""
+        if len(self.samples) < self.sample_size:
+            self.samples.append(pair)
+            return
+        if draw is None:
+            draw = int(self._rng.integers(0, seen + 1))
+        if draw < self.sample_size:
+            self.samples[draw] = pair
+
+    def distribution(self, column):
+        """Counts for a column, most common first"""
+        with self._lock:
+            return dict(self.counts[column].most_common()) if column in self.counts else {}
+
+    def crosstab_frame(self):
+        """Category by facility cross-tab as a small DataFrame"""
+        if not self.pairs:
+            return pd.DataFrame()
+        table = pd.Series(self.pairs).unstack(fill_value=0)
+        table.index.name, table.columns.name = CATEGORY_COL, FACILITY_COL
+        return table.sort_index().sort_index(axis=1)
+
+    def to_dict(self):
+        """Totals as plain JSON-serializable data"""
+        with self._lock:
+            return {
+                "total": self.total,
+                "distributions": {column: self.distribution(column) for column in self.columns},
+                "crosstab": {f"{category} | {facility}": count for (category, facility), count in self.pairs.items()},
+                "samples": [{"original": original, "simple": simple} for original, simple in self.samples],
+            }
+
+    def render_text(self, input_name, output_name, processing_time, notes=()):
+        """The plain-text summary report"""
+        with self._lock:
+            return self._render_text(input_name, output_name, processing_time, notes)
+
+    def _render_text(self, input_name, output_name, processing_time, notes):
+        lines = [
+            "Medical Inventory Processing Summary",
+            "==================================",
+            "",
+            f"Input file: {input_name}",
+            f"Output file: {output_name}",
+            f"Processing time: {processing_time:.2f} seconds",
+            "",
+            f"Total items processed: {self.total}",
+        ]
+        lines.extend(notes)
+        lines.append("")
+
+        for position, column in enumerate(self.columns):
+            title = DISTRIBUTION_TITLES[column]
+            if position:
+                lines.append("")
+            lines.extend([f"{title}:", "-" * len(title)])
+            for value, count in self.distribution(column).items():
+                percentage = (count / self.total) * 100 if self.total else 0
+                lines.append(f"{value}: {count} ({percentage:.1f}%)")
+
+        if self.crosstab:
+            lines.extend(["", "Category by Facility Cross-tabulation:", "---------------------------------"])
+            lines.append(self.crosstab_frame().to_string())
+
+        if self.sample:
+            lines.extend(["", "Sample of Simple Descriptions:", "----------------------------"])
+            for original, simple in self.samples:
+                lines.extend([f"Original: {original}", f"Simple  : {simple}", ""])
+
+        return "\n".join(lines) + "\n"
+
+    def write_text(self, path, input_name, output_name, processing_time, notes=()):
+        with open(path, "w") as f:
+            f.write(self.render_text(input_name, output_name, processing_time, notes))
+        return path
+
+    def write_json(self, path, **metadata):
+        with open(path, "w") as f:
+            json.dump({**metadata, **self.to_dict()}, f, indent=2, default=str)
+        return path
+
+    def render_html(self):
+        """Distributions as an HTML fragment, e.g. for showing live progress"""
+        data = self.to_dict()
+        parts = [f"<p><strong>{data['total']}</strong> items finished</p>"]
+        for column, counts in data["distributions"].items():
+            parts.append(f"<h4>{html.escape(column)}</h4><ul>")
+            for value, count in counts.items():
+                percentage = (count / data["total"]) * 100 if data["total"] else 0
+                parts.append(f"<li>{html.escape(str(value))}: {count} ({percentage:.1f}%)</li>")
+            parts.append("</ul>")
+        return "".join(parts)
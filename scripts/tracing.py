@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    Records timed spans for a single processing job and exports them as a
+    Chrome trace (open the file in chrome://tracing or https://ui.perfetto.dev)
+    """
+
+    def __init__(self, job_name="job"):
+        self.job_name = job_name
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def _context(self):
+        """Attributes attached to every span opened on the current thread"""
+        if not hasattr(self._local, "context"):
+            self._local.context = {}
+        return self._local.context
+
+    def set_context(self, **attributes):
+        """Set attributes (e.g. row index) that later spans on this thread inherit"""
+        self._context().update(attributes)
+
+    def clear_context(self, *names):
+        context = self._context()
+        for name in names:
+            context.pop(name, None)
+
+    @contextmanager
+    def span(self, name, category="pipeline", **attributes):
+        """
+        Time the enclosed block. Yields the attribute dict so callers can add
+        results that are only known at the end (tokens used, cache hits, ...)
+        """
+        attrs = dict(self._context())
+        attrs.update(attributes)
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except Exception as e:
+            attrs["error"] = str(e)
+            raise
+        finally:
+            end = time.perf_counter()
+            record = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self._origin) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": self._pid,
+                "tid": threading.get_ident(),
+                "args": attrs,
+            }
+            with self._lock:
+                self.spans.append(record)
+
+    def totals(self):
+        """Total seconds spent per span name, useful for quick console summaries"""
+        totals = {}
+        with self._lock:
+            for record in self.spans:
+                totals[record["name"]] = totals.get(record["name"], 0) + record["dur"] / 1e6
+        return totals
+
+    def export(self, path):
+        """Write the recorded spans to a Chrome trace JSON file"""
+        with self._lock:
+            events = list(self.spans)
+        trace = {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"job": self.job_name},
+        }
+        with open(path, "w") as f:
+            json.dump(trace, f, default=str)
+        return path
+
+
+class NullTracer:
+    """Tracer stand-in used when tracing is disabled; every call is a no-op"""
+
+    def set_context(self, **attributes):
+        pass
+
+    def clear_context(self, *names):
+        pass
+
+    @contextmanager
+    def span(self, name, category="pipeline", **attributes):
+        yield {}
+
+    def totals(self):
+        return {}
+
+    def export(self, path):
+        return None
+
+
+NULL_TRACER = NullTracer()
@@ -0,0 +1,99 @@
+import os
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "web_app"))
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("JANITOR_INTERVAL_SECONDS", "0")
+
+
+class _Obj(types.SimpleNamespace):
+    pass
+
+
+class FakeCompletions:
+    """Answers every prompt with a fixed label for its stage"""
+
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **params):
+        self.calls.append(params)
+        system = params["messages"][0]["content"]
+        if params.get("response_format"):
+            text = ('{"Product Category": "Medical & Surgical Supplies", "Facility Suitability": "Both", '
+                    '"Requires Electricity": "No", "SIMPLE_DESCRIPTION": "A thing"}')
+        elif "categorizes" in system:
+            text = "Medical & Surgical Supplies"
+        elif "facility" in system:
+            text = "Both"
+        elif "electricity" in system:
+            text = "No"
+        else:
+            text = "A simple description"
+        return _Obj(choices=[_Obj(message=_Obj(content=text), logprobs=None, finish_reason="stop")],
+                    usage=_Obj(prompt_tokens=10, completion_tokens=3, total_tokens=13))
+
+
+class FakeClient:
+    def __init__(self):
+        self.chat = _Obj(completions=FakeCompletions())
+        self.options = []
+
+    def with_options(self, **options):
+        """Per-call client options (timeout, max_retries) are recorded; the same fake answers"""
+        self.options.append(options)
+        return self
+
+
+@pytest.fixture
+def fake_client():
+    """A fake OpenAI client returned by get_client() in this process"""
+    import scripts.clients as clients
+    client = FakeClient()
+    key = (os.getpid(), os.environ["OPENAI_API_KEY"])
+    previous = clients._clients.get(key)
+    clients._clients[key] = client
+    yield client
+    if previous is None:
+        clients._clients.pop(key, None)
+    else:
+        clients._clients[key] = previous
+
+
+def inventory(descriptions, **columns):
+    """A minimal inventory DataFrame with the given descriptions"""
+    count = len(descriptions)
+    data = {
+        "ITEM_NO": range(1000, 1000 + count),
+        "VENDOR_NAME": ["Acme"] * count,
+        "DESCRIPTION": descriptions,
+        "CATEGORY": ["MED"] * count,
+        "SUBCATEGORY": ["SUB"] * count,
+        "EXT_COST": [float(i) for i in range(count)],
+    }
+    data.update(columns)
+    return pd.DataFrame(data)
+
+
+@pytest.fixture(scope="session")
+def web_app(tmp_path_factory):
+    """The Flask app, with its uploads, results and catalog in a temporary directory"""
+    workdir = tmp_path_factory.mktemp("web_app")
+    os.environ["ITEM_CATALOG_PATH"] = str(workdir / "item_catalog.db")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    app.app.config["UPLOAD_FOLDER"] = str(workdir / "uploads")
+    app.app.config["RESULTS_FOLDER"] = str(workdir / "results")
+    app.app.config["TESTING"] = True
+    app.result_store.path = str(workdir / "results" / "index.db")
+    return app
@@ -0,0 +1,78 @@
+import io
+import json
+import time
+
+import pandas as pd
+
+from conftest import inventory
+
+
+def wait_for(client, job_id, timeout=60):
+    """Poll a job until it is finished and return its status"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.get(f"/api/jobs/{job_id}").get_json()
+        if status.get("completed"):
+            return status
+        time.sleep(0.1)
+    raise AssertionError(f"Job {job_id} did not finish: {status}")
+
+
+def test_launched_preview_job_serves_its_artifacts(web_app, fake_client):
+    client = web_app.app.test_client()
+    df = inventory([f"WIDGET MODEL {i}" for i in range(40)])
+    upload = io.BytesIO(df.to_csv(index=False).encode("utf-8"))
+
+    response = client.post("/api/jobs", data={
+        "file": (upload, "inventory.csv"),
+        "options": json.dumps({"preview": 10, "use_catalog": False}),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 202
+    preview_id = response.get_json()["jobs"][0]["job_id"]
+    preview = wait_for(client, preview_id)
+    assert preview["preview"]["sample_rows"] == 10
+
+    response = client.post(preview["launch_url"])
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    status = wait_for(client, job_id)
+    assert status["error"] is None
+    assert "data" in status["artifacts"]
+
+    response = client.get(status["artifacts"]["data"])
+    assert response.status_code == 200
+    data = pd.read_csv(io.BytesIO(response.data))
+    assert len(data) == 40
+    assert data["Product Category"].notna().all()
+    assert client.get(f"/api/jobs/{job_id}/rows").status_code == 200
+
+
+def test_batch_status_outlives_evicted_jobs(web_app, fake_client):
+    client = web_app.app.test_client()
+    uploads = [(io.BytesIO(inventory([f"GLOVE SIZE {i}"]).to_csv(index=False).encode("utf-8")), f"part{i}.csv")
+               for i in range(2)]
+    response = client.post("/api/jobs", data={
+        "file": uploads,
+        "options": json.dumps({"use_catalog": False}),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 202
+    body = response.get_json()
+    job_ids = [job["job_id"] for job in body["jobs"]]
+    for job_id in job_ids:
+        wait_for(client, job_id)
+    batch_url = f"/api/batches/{body['batch_id']}"
+    assert [job["job_id"] for job in client.get(batch_url).get_json()["jobs"]] == job_ids
+
+    # The janitor drops the job state first and the results later
+    for job_id in job_ids:
+        web_app.processing_tasks.pop(job_id)
+    web_app.result_store.remove(job_ids[1])
+
+    response = client.get(batch_url)
+    assert response.status_code == 200
+    batch = response.get_json()
+    assert batch["completed"]
+    assert [job["job_id"] for job in batch["jobs"]] == job_ids
+    assert "data" in batch["jobs"][0]["artifacts"]
+    assert batch["jobs"][1]["status"] == "expired"
+    assert client.get("/api/batches/unknown").status_code == 404
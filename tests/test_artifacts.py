@@ -0,0 +1,91 @@
+import gzip
+import uuid
+
+import pytest
+
+from conftest import inventory
+
+
+@pytest.fixture
+def artifact(web_app, tmp_path):
+    """A registered data artifact large enough to be compressed; yields (url, contents)"""
+    job_id = str(uuid.uuid4())
+    path = tmp_path / f"{job_id}_inventory_processed.csv"
+    inventory([f"WIDGET MODEL {i}" for i in range(200)]).to_csv(path, index=False)
+    web_app.result_store.register(job_id, "data", str(path), "inventory_processed.csv")
+    yield f"/api/jobs/{job_id}/artifacts/data", path.read_bytes()
+    web_app.result_store.remove(job_id)
+
+
+def test_artifact_is_gzipped_for_clients_that_accept_it(web_app, artifact):
+    url, contents = artifact
+    client = web_app.app.test_client()
+
+    plain = client.get(url)
+    assert plain.status_code == 200
+    assert "Content-Encoding" not in plain.headers
+    assert plain.data == contents
+
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert compressed.status_code == 200
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["Vary"] == "Accept-Encoding"
+    assert "attachment" in compressed.headers["Content-Disposition"]
+    assert len(compressed.data) < len(contents)
+    assert gzip.decompress(compressed.data) == contents
+    # Each encoding is a different representation, so caches must not mix them up
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+
+
+def test_small_artifacts_are_sent_as_they_are(web_app, tmp_path):
+    job_id = str(uuid.uuid4())
+    path = tmp_path / "summary.txt"
+    path.write_text("Total items: 3\n")
+    web_app.result_store.register(job_id, "summary", str(path), "summary.txt")
+    try:
+        response = web_app.app.test_client().get(f"/api/jobs/{job_id}/artifacts/summary",
+                                                 headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+        assert response.data == b"Total items: 3\n"
+    finally:
+        web_app.result_store.remove(job_id)
+
+
+def test_etag_and_range_requests(web_app, artifact):
+    url, contents = artifact
+    client = web_app.app.test_client()
+    etag = client.get(url).headers["ETag"]
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get(url, headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206
+    assert partial.headers["Content-Range"] == f"bytes 100-199/{len(contents)}"
+    assert partial.data == contents[100:200]
+
+    # A resumed download only gets the rest when the file has not changed
+    resumed = client.get(url, headers={"Range": "bytes=100-", "If-Range": etag})
+    assert resumed.status_code == 206
+    assert resumed.data == contents[100:]
+    restarted = client.get(url, headers={"Range": "bytes=100-", "If-Range": '"stale"'})
+    assert restarted.status_code == 200
+    assert restarted.data == contents
+
+
+def test_range_of_a_compressed_artifact_is_taken_from_the_gzip_stream(web_app, artifact):
+    url, contents = artifact
+    client = web_app.app.test_client()
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"}).data
+
+    partial = client.get(url, headers={"Accept-Encoding": "gzip", "Range": "bytes=0-99"})
+    assert partial.status_code == 206
+    assert partial.headers["Content-Encoding"] == "gzip"
+    assert partial.data == compressed[:100]
+    rest = client.get(url, headers={"Accept-Encoding": "gzip", "Range": "bytes=100-"})
+    assert gzip.decompress(partial.data + rest.data) == contents
+
+
+def test_unknown_artifacts_are_not_found(web_app):
+    client = web_app.app.test_client()
+    assert client.get(f"/api/jobs/{uuid.uuid4()}/artifacts/data").status_code == 404
+    assert client.get(f"/api/jobs/{uuid.uuid4()}/artifacts/secrets").status_code == 404
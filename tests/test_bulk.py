@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from conftest import inventory
+from scripts.bulk import LocalBatchRunner, run_bulk
+from scripts.categorize import MedicalInventoryCategorizer
+from scripts.description import GPTDescriptionGenerator
+from scripts.facilitize import FacilitySuitabilityClassifier
+
+DESCRIPTIONS = ["WIDGET MODEL A", "WIDGET MODEL B", "GLOVE EXAM NITRILE", "", "SPROCKET 3 IN"]
+
+
+@pytest.fixture
+def classifiers(fake_client):
+    classifier = FacilitySuitabilityClassifier(fake_client)
+    return MedicalInventoryCategorizer(fake_client), classifier, classifier, GPTDescriptionGenerator(fake_client)
+
+
+def bulk(df, classifiers, tmp_path, runner=None, limit=None):
+    categorizer, classifier, electricity_classifier, generator = classifiers
+    return run_bulk(df, categorizer, classifier=classifier, electricity_classifier=electricity_classifier,
+                    description_generator=generator, settings={"descriptions": {"limit": limit}},
+                    runner=runner, work_dir=str(tmp_path), name="stock")
+
+
+def requests(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_local_runner_fills_both_rounds(fake_client, classifiers, tmp_path):
+    df, report = bulk(inventory(DESCRIPTIONS), classifiers, tmp_path, runner=LocalBatchRunner(fake_client))
+
+    assert report["status"] == "completed"
+    round1 = requests(tmp_path / "stock_round1_requests.jsonl")
+    round2 = requests(tmp_path / "stock_round2_requests.jsonl")
+    assert {line["custom_id"].split("-")[0] for line in round1} == {"categorization", "descriptions"}
+    assert {line["custom_id"].split("-")[0] for line in round2} <= {"facility", "electricity"}
+    assert os.path.exists(tmp_path / "stock_round2_results.jsonl")
+    # Round 2 prompts carry the categories answered in round 1
+    assert any("Medical & Surgical Supplies" in line["body"]["messages"][-1]["content"] for line in round2)
+
+    assert (df["Product Category"] != "").all()
+    assert (df["Facility Suitability"] != "").all()
+    assert df.loc[2, "Requires Electricity"] == "No"  # keyword rule, no request
+    assert df.loc[3, "SIMPLE_DESCRIPTION"] == "No description available"
+    assert df.loc[0, "SIMPLE_DESCRIPTION"] == "A simple description"
+    assert report["stages"]["descriptions"]["failed"] == 0
+    assert len(fake_client.chat.completions.calls) == report["requests"]
+
+
+def test_manual_run_waits_and_reads_error_records(fake_client, classifiers, tmp_path):
+    df, report = bulk(inventory(DESCRIPTIONS), classifiers, tmp_path)
+    assert report["status"] == "waiting"
+    assert report["pending"].endswith("stock_round1_requests.jsonl")
+    assert not fake_client.chat.completions.calls
+
+    # Answer the categorization requests; the description requests fail
+    with open(tmp_path / "stock_round1_results.jsonl", "w") as f:
+        for line in requests(report["pending"]):
+            if line["custom_id"].startswith("categorization"):
+                body = {"choices": [{"message": {"content": "Diagnostics & Lab Use"}}]}
+                f.write(json.dumps({"custom_id": line["custom_id"], "response": {"status_code": 200, "body": body}}))
+            else:
+                f.write(json.dumps({"custom_id": line["custom_id"], "response": None,
+                                    "error": {"code": "server_error", "message": "overloaded"}}))
+            f.write("\n")
+
+    df, report = bulk(inventory(DESCRIPTIONS), classifiers, tmp_path)
+    assert report["status"] == "waiting"
+    assert report["pending"].endswith("stock_round2_requests.jsonl")
+    stages = report["stages"]
+    assert stages["descriptions"]["failed"] == stages["descriptions"]["requests"] > 0
+    assert df.loc[0, "SIMPLE_DESCRIPTION"] == "Error generating description: overloaded"
+    assert df.loc[0, "Product Category"] == "Diagnostics & Lab Use"
+
+
+def test_changed_requests_move_old_results_aside(fake_client, classifiers, tmp_path):
+    runner = LocalBatchRunner(fake_client)
+    bulk(inventory(DESCRIPTIONS), classifiers, tmp_path, runner=runner)
+    calls = len(fake_client.chat.completions.calls)
+
+    # Same input and options: the stored results are reused
+    bulk(inventory(DESCRIPTIONS), classifiers, tmp_path, runner=runner)
+    assert len(fake_client.chat.completions.calls) == calls
+    assert not os.path.exists(tmp_path / "stock_round1_results.jsonl.stale")
+
+    # Fewer descriptions change the round 1 requests
+    df, report = bulk(inventory(DESCRIPTIONS), classifiers, tmp_path, runner=runner, limit=1)
+    assert os.path.exists(tmp_path / "stock_round1_results.jsonl.stale")
+    assert report["stages"]["descriptions"]["requests"] == 1
+    assert (df["SIMPLE_DESCRIPTION"].iloc[1:] == "").all()
+
+
+def test_description_limit_zero_describes_nothing(fake_client, classifiers, tmp_path):
+    df, report = bulk(inventory(DESCRIPTIONS), classifiers, tmp_path, runner=LocalBatchRunner(fake_client), limit=0)
+    assert report["stages"]["descriptions"]["requests"] == 0
+    assert (df["SIMPLE_DESCRIPTION"] == "").all()
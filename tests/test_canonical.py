@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.canonical import canonical_key, canonical_keys, canonical_text, canonical_texts, canonical_vendor
+
+
+@pytest.mark.parametrize("variants, canonical", [
+    (["SYRINGE 10ML", "Syringe 10 ml", "SYRINGE, 10.0 ML", "syringe 10 milliliters", "SYRINGE 10CC"], "syringe 10ml"),
+    (["NEEDLE .5 IN", "needle 0.50 inch", "Needle 0.5in"], "needle 0.5in"),
+    (["GAUZE 4 X 4", "gauze 4x4", "Gauze 4 x4"], "gauze 4x4"),
+    (["GLOVE BX/100", "glove 100 per box", "Glove box of 100", "GLOVE 100/BOX", "glove 100 / bx"], "glove 100/bx"),
+    (["TAPE CS/12 ROLLS", "tape 12 per case rolls"], "tape 12/cs rolls"),
+    (["Catheter 14 FR", "CATHETER 14FR", "catheter 14 french"], "catheter 14fr"),
+    (["  MASK   (N95)  ", "mask n95", "Mask - N95"], "mask n95"),
+    (["ALCOHOL 70%", "Alcohol, 70%."], "alcohol 70%"),
+])
+def test_spelling_variants_share_one_canonical_text(variants, canonical):
+    assert {canonical_text(variant) for variant in variants} == {canonical}
+
+
+def test_different_sizes_stay_different():
+    assert canonical_text("SYRINGE 10 ML") != canonical_text("SYRINGE 1 ML")
+    assert canonical_text("GLOVE BX/100") != canonical_text("GLOVE BX/10")
+    assert canonical_text("DRESSING 10 IN") != canonical_text("DRESSING 10 CM")
+
+
+def test_inches_and_the_word_in():
+    # "10 in", "10 inch" and "10in" all mean inches and share a canonical text ...
+    assert canonical_text("BANDAGE ELASTIC 10 IN") == canonical_text("bandage elastic 10 inch") == "bandage elastic 10in"
+    assert canonical_text("GAUZE 4 IN X 4 IN") == "gauze 4in x 4in"
+    assert canonical_text("BANDAGE 6 IN 2 PLY") == "bandage 6in 2 ply"
+    # ... but "in" followed by 1 or an article is the word and is not read as inches
+    assert canonical_text("SHAMPOO 2 IN 1") == "shampoo 2 in 1"
+    assert canonical_text("WIPES 100 IN A TUB") == "wipes 100 in a tub"
+    assert canonical_text("SHAMPOO 2 IN 1") != canonical_text("SHAMPOO 2IN 1")
+    # Only whole words are units
+    assert canonical_text("10 INSERTS") == "10 inserts"
+
+
+def test_missing_values_are_empty():
+    assert canonical_text(None) == canonical_text(np.nan) == canonical_text("  ") == ""
+    series = pd.Series(["GLOVE 10 ML", None, "glove 10ml", np.nan], index=[5, 6, 7, 8])
+    assert canonical_texts(series).tolist() == ["glove 10ml", "", "glove 10ml", ""]
+    assert canonical_texts(series).index.tolist() == [5, 6, 7, 8]
+
+
+def test_keys_combine_description_vendor_and_context():
+    assert canonical_vendor("Acme, Inc.") == canonical_vendor("ACME CORP") == "acme"
+    # A vendor called only by a suffix word keeps it
+    assert canonical_vendor("Co.") == "co"
+    assert canonical_key("GLOVE BX/100", "Acme Inc", "Exam") == canonical_key("glove 100 per box", "ACME", "EXAM")
+    assert canonical_key("GLOVE", "Acme") != canonical_key("GLOVE", "Medline")
+    df = pd.DataFrame({"DESCRIPTION": ["GLOVE 10 ML", "glove 10ml"], "VENDOR_NAME": ["Acme LLC", "acme"]})
+    assert canonical_keys(df).nunique() == 1
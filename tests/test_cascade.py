@@ -0,0 +1,97 @@
+import math
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FakeClient
+from scripts.cascade import ModelCascade
+
+LABELS = {"Rural Clinics", "District Hospitals", "Both", "Needs Review"}
+MESSAGES = [{"role": "user", "content": "Which facility?"}]
+
+
+class ScriptedCompletions:
+    """Answers per model: (text, probability of the answer or None for no logprobs)"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def create(self, **params):
+        self.calls.append(params)
+        text, probability = self.answers[params["model"]]
+        logprobs = None
+        if probability is not None:
+            logprobs = SimpleNamespace(content=[SimpleNamespace(logprob=math.log(probability))])
+        message = SimpleNamespace(content=text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, logprobs=logprobs)], usage=None)
+
+
+def scripted(cheap, strong):
+    client = FakeClient()
+    client.chat.completions = ScriptedCompletions({"gpt-3.5-turbo": cheap, "gpt-4": strong})
+    return client
+
+
+def validate(text):
+    return text if text in LABELS else None
+
+
+def run(client, messages=MESSAGES):
+    cascade = ModelCascade(["gpt-3.5-turbo", "gpt-4"], confidence_threshold=0.8)
+    return cascade, cascade.run(client, messages, validate, max_tokens=5)
+
+
+def models_called(client):
+    return [call["model"] for call in client.chat.completions.calls]
+
+
+def test_confident_cheap_answer_is_accepted():
+    client = scripted(("Both", 0.95), ("Rural Clinics", None))
+    cascade, answer = run(client)
+    assert answer == "Both"
+    assert models_called(client) == ["gpt-3.5-turbo"]
+    assert client.chat.completions.calls[0]["logprobs"] is True
+    assert cascade.stats()["gpt-3.5-turbo"] == {"answered": 1, "escalated": 0}
+
+
+@pytest.mark.parametrize("cheap", [("Both", 0.5), ("Somewhere", 0.99), ("Needs Review", 0.99)],
+                         ids=["low confidence", "invalid label", "needs review"])
+def test_escalates_to_the_strong_model(cheap):
+    client = scripted(cheap, ("District Hospitals", None))
+    cascade, answer = run(client)
+    assert answer == "District Hospitals"
+    assert models_called(client) == ["gpt-3.5-turbo", "gpt-4"]
+    assert "logprobs" not in client.chat.completions.calls[1]
+    assert cascade.stats() == {"gpt-3.5-turbo": {"answered": 0, "escalated": 1},
+                               "gpt-4": {"answered": 1, "escalated": 0}}
+
+
+def test_unknown_confidence_is_not_low_confidence():
+    client = scripted(("Both", None), ("District Hospitals", None))
+    assert run(client)[1] == "Both"
+
+
+def test_invalid_last_answer_returns_none():
+    client = scripted(("Somewhere", 0.99), ("Elsewhere", None))
+    cascade, answer = run(client)
+    assert answer is None
+    assert cascade.stats()["gpt-4"] == {"answered": 1, "escalated": 0}
+
+
+def test_counters_are_exact_across_threads():
+    client = scripted(("Both", 0.5), ("Both", None))
+    cascade = ModelCascade(["gpt-3.5-turbo", "gpt-4"], confidence_threshold=0.8)
+
+    def work(worker):
+        for item in range(50):
+            cascade.run(client, [{"role": "user", "content": f"item {worker}-{item}"}], validate)
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cascade.stats() == {"gpt-3.5-turbo": {"answered": 0, "escalated": 400},
+                               "gpt-4": {"answered": 400, "escalated": 0}}
@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import scripts.clients as clients
+
+
+class CountingOpenAI:
+    """Stands in for openai.OpenAI and counts how many clients were built"""
+    created = 0
+
+    def __init__(self, api_key, **options):
+        time.sleep(0.05)
+        CountingOpenAI.created += 1
+        self.api_key = api_key
+        self.options = options
+
+
+@pytest.fixture(autouse=True)
+def openai_module(monkeypatch):
+    CountingOpenAI.created = 0
+    monkeypatch.setitem(sys.modules, "openai", types.SimpleNamespace(OpenAI=CountingOpenAI))
+    monkeypatch.setattr(clients, "_clients", {})
+    monkeypatch.setattr(clients, "_env_loaded", True)
+
+
+def test_client_is_reused_per_key():
+    first = clients.get_client("key-a")
+    assert clients.get_client("key-a") is first
+    assert clients.get_client("key-b") is not first
+    assert first.options["max_retries"] == clients.MAX_RETRIES
+    assert CountingOpenAI.created == 2
+
+
+def test_default_key_comes_from_the_environment(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "key-env")
+    assert clients.get_client().api_key == "key-env"
+    monkeypatch.delenv("OPENAI_API_KEY")
+    with pytest.raises(ValueError):
+        clients.get_client()
+
+
+def test_concurrent_first_use_builds_one_client():
+    found = []
+    barrier = threading.Barrier(8)
+
+    def use():
+        barrier.wait()
+        found.append(clients.get_client("key-a"))
+
+    threads = [threading.Thread(target=use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert CountingOpenAI.created == 1
+    assert all(client is found[0] for client in found)
+
+
+def test_another_process_builds_its_own_client(monkeypatch):
+    parent = clients.get_client("key-a")
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+    child = clients.get_client("key-a")
+    assert child is not parent
+    assert clients.get_client("key-a") is child
+    assert CountingOpenAI.created == 2
+
+
+def built_in_child(api_key):
+    """(client inherited from the parent was reused, clients built in the child)"""
+    inherited = [client for (pid, key), client in clients._clients.items() if key == api_key]
+    client = clients.get_client(api_key)
+    return any(client is parent for parent in inherited), CountingOpenAI.created
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_forked_worker_does_not_reuse_the_parent_client():
+    clients.get_client("key-a")
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as pool:
+        reused, created = pool.submit(built_in_child, "key-a").result()
+    assert not reused
+    assert created == 2
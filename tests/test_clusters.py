@@ -0,0 +1,58 @@
+import pandas as pd
+
+from conftest import inventory
+from scripts.clusters import plan_clusters, propagate_labels, skip_members, variant_free_text
+
+COLUMNS = ["Product Category", "Facility Suitability"]
+
+
+def catalog():
+    return inventory([
+        "GLOVE EXAM NITRILE POWDER FREE X-LARGE BLUE",
+        "GLOVE EXAM NITRILE POWDER FREE SMALL BLUE",
+        "Glove, exam, nitrile, powder-free, medium, white",
+        "SUTURE NYLON 3-0 BLACK MONOFILAMENT",
+        "WHEELCHAIR TRANSPORT 19IN SEAT",
+    ])
+
+
+def test_variant_words_match_canonical_text():
+    assert variant_free_text("GLOVE NITRILE X-LARGE BLUE") == variant_free_text("Glove nitrile, small") == "glove nitrile"
+
+
+def test_plan_clusters_groups_size_and_colour_variants():
+    members = plan_clusters(catalog(), COLUMNS)
+    assert members.to_dict() == {1: 0, 2: 0}
+
+
+def test_plan_clusters_leaves_rows_reused_for_every_column():
+    df = catalog()
+    reused = {column: pd.Index([0]) for column in COLUMNS}
+    assert plan_clusters(df, COLUMNS, reused).to_dict() == {2: 1}
+
+
+def test_plan_clusters_without_variants():
+    df = inventory(["SUTURE NYLON 3-0 BLACK MONOFILAMENT", "WHEELCHAIR TRANSPORT 19IN SEAT", "THERMOMETER DIGITAL ORAL"])
+    assert plan_clusters(df, COLUMNS).empty
+
+
+def test_skip_members_and_propagate_labels():
+    df = catalog()
+    df["Product Category"] = ["Medical & Surgical Supplies", "", "", "Medical & Surgical Supplies", ""]
+    df["Facility Suitability"] = ["Both", "", "Rural Clinics", "", ""]
+    members = plan_clusters(df, COLUMNS)
+    reused = {"Facility Suitability": pd.Index([2])}
+
+    targets = skip_members(reused, members, COLUMNS)
+    assert list(targets["Product Category"]) == [1, 2]
+    assert list(targets["Facility Suitability"]) == [1]
+    assert list(reused["Product Category"]) == [1, 2]
+    assert list(reused["Facility Suitability"]) == [1, 2]
+
+    filled = propagate_labels(df, members, targets)
+    assert list(filled["Product Category"]) == [1, 2]
+    assert list(filled["Facility Suitability"]) == [1]
+    assert df.loc[[1, 2], "Product Category"].tolist() == ["Medical & Surgical Supplies"] * 2
+    assert df.loc[[1, 2], "Facility Suitability"].tolist() == ["Both", "Rural Clinics"]
+    # Rows outside any cluster are untouched
+    assert df.loc[4, "Product Category"] == ""
@@ -0,0 +1,66 @@
+import sqlite3
+import sys
+
+import pytest
+
+import scripts.clients as clients
+from conftest import inventory
+from scripts import main
+from scripts.catalog import ItemCatalog
+
+
+def test_dry_run_needs_no_api_key(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv("OPENAI_API_KEY")
+    monkeypatch.setattr(clients, "_env_loaded", True)
+    path = tmp_path / "inventory.csv"
+    inventory([f"WIDGET MODEL {i}" for i in range(20)]).to_csv(path, index=False)
+
+    monkeypatch.setattr(sys, "argv", ["main.py", "--input", str(path), "--dry-run"])
+    main.main()
+
+    out = capsys.readouterr().out
+    assert "OPENAI_API_KEY is not set" not in out
+    assert "Dry run: no AI requests are sent" in out
+    assert not (tmp_path / "inventory_processed.csv").exists()
+
+
+@pytest.mark.parametrize("limit, described", [("0", 0), ("3", 3), (None, 20)])
+def test_dry_run_estimate_follows_the_description_limit(tmp_path, monkeypatch, limit, described):
+    path = tmp_path / "inventory.csv"
+    inventory([f"WIDGET MODEL {i}" for i in range(20)]).to_csv(path, index=False)
+    argv = ["main.py", "--input", str(path), "--dry-run"] + (["--description-batch", limit] if limit else [])
+    monkeypatch.setattr(sys, "argv", argv)
+    args = main.parse_arguments()
+
+    stats = main.process_file(args, str(path), str(tmp_path / "out.csv"))
+    stages = {stage["stage"]: stage for stage in stats["estimate"]["stages"]}
+    assert stages["descriptions"]["ai_rows"] == described
+
+
+def test_dry_run_does_not_create_the_catalog(tmp_path, monkeypatch):
+    path = tmp_path / "inventory.csv"
+    inventory([f"WIDGET MODEL {i}" for i in range(5)]).to_csv(path, index=False)
+    catalog_path = tmp_path / "catalog.db"
+    monkeypatch.setattr(sys, "argv", ["main.py", "--input", str(path), "--dry-run", "--catalog", str(catalog_path)])
+    main.main()
+    assert not catalog_path.exists()
+
+
+def test_dry_run_reads_an_existing_catalog_without_writing(tmp_path, monkeypatch):
+    path = tmp_path / "inventory.csv"
+    df = inventory([f"WIDGET MODEL {i}" for i in range(5)])
+    df.to_csv(path, index=False)
+    catalog_path = tmp_path / "catalog.db"
+    catalog = ItemCatalog(str(catalog_path))
+    catalog.record(df.assign(**{"Product Category": "Office Supplies"}).head(2))
+    monkeypatch.setattr(sys, "argv", ["main.py", "--input", str(path), "--dry-run", "--catalog", str(catalog_path)])
+    args = main.parse_arguments()
+
+    stats = main.process_file(args, str(path), str(tmp_path / "out.csv"))
+    stages = {stage["stage"]: stage for stage in stats["estimate"]["stages"]}
+    assert stages["categorization"]["ai_rows"] == 3
+    assert catalog.count() == 2
+
+    # A read-only catalog refuses writes instead of adding items
+    with pytest.raises(sqlite3.OperationalError):
+        ItemCatalog(str(catalog_path), read_only=True).record(df.assign(**{"Product Category": "Lab Supplies"}))
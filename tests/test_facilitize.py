@@ -0,0 +1,26 @@
+import pandas as pd
+import pytest
+
+from scripts.facilitize import FacilitySuitabilityClassifier
+
+SPELLINGS = [
+    ("X-RAY VIEWER", "x ray viewer", "Yes"),
+    ("Infusion-Pump, volumetric", "INFUSION PUMP VOLUMETRIC", "Yes"),
+    ("Tongue-Depressor wood", "tongue depressor, wood", "No"),
+]
+
+
+@pytest.mark.parametrize("first, second, answer", SPELLINGS)
+def test_electricity_keywords_match_canonical_text(first, second, answer):
+    classifier = FacilitySuitabilityClassifier()
+    assert classifier.match_electricity_keywords(first) == answer
+    assert classifier.match_electricity_keywords(second) == answer
+
+
+def test_vectorized_electricity_keywords_agree_with_single_items():
+    classifier = FacilitySuitabilityClassifier()
+    descriptions = pd.Series([text for first, second, _ in SPELLINGS for text in (first, second)]
+                             + ["WIDGET", "", None], index=range(10, 19))
+    result = classifier.match_electricity_keywords_vectorized(descriptions)
+    expected = [classifier.match_electricity_keywords(text) for text in descriptions]
+    assert [None if pd.isna(value) else value for value in result] == expected
@@ -0,0 +1,70 @@
+import json
+
+import pandas as pd
+
+from conftest import inventory
+from scripts.categorize import MedicalInventoryCategorizer
+from scripts.description import GPTDescriptionGenerator
+from scripts.facilitize import FacilitySuitabilityClassifier
+from scripts.fused import FusedItemClassifier
+
+
+def fused(client=None, **answer):
+    """Fused classifier; answer overrides fields of the fake's JSON answer"""
+    if answer:
+        create = client.chat.completions.create
+
+        def patched(**params):
+            response = create(**params)
+            if params.get("response_format"):
+                values = json.loads(response.choices[0].message.content)
+                values.update(answer)
+                response.choices[0].message.content = json.dumps(values)
+            return response
+        client.chat.completions.create = patched
+    classifier = FacilitySuitabilityClassifier()
+    generator = GPTDescriptionGenerator()
+    generator.request_interval = 0
+    return FusedItemClassifier(None, categorizer=MedicalInventoryCategorizer(), facility_classifier=classifier,
+                               electricity_classifier=classifier, description_generator=generator)
+
+
+def json_calls(client):
+    return [call for call in client.chat.completions.calls if call.get("response_format")]
+
+
+def test_one_json_call_per_row(fake_client):
+    df = inventory([f"WIDGET MODEL {i}" for i in range(6)])
+    df = fused().process_dataframe(df, pause=0)
+
+    assert len(json_calls(fake_client)) == 6
+    assert len(fake_client.chat.completions.calls) == 6
+    assert (df["Product Category"] == "Medical & Surgical Supplies").all()
+    assert (df["Facility Suitability"] == "Both").all()
+    assert (df["Requires Electricity"] == "No").all()
+    assert (df["SIMPLE_DESCRIPTION"] == "A thing").all()
+
+
+def test_invalid_field_falls_back_to_its_stage(fake_client):
+    classifier = fused(fake_client, **{"Product Category": "Gadgets"})
+    df = classifier.process_dataframe(inventory([f"WIDGET MODEL {i}" for i in range(3)]), pause=0)
+
+    assert len(json_calls(fake_client)) == 3
+    assert classifier.total_fallbacks == 3
+    # The categorizer's own prompt answered instead
+    assert len(fake_client.chat.completions.calls) == 6
+    assert (df["Product Category"] == "Medical & Surgical Supplies").all()
+    assert (df["Facility Suitability"] == "Both").all()
+
+
+def test_description_limit_counts_descriptions(fake_client):
+    df = inventory(["WIDGET A", "", "WIDGET B", "WIDGET C", "WIDGET D", "WIDGET E"])
+    df["SIMPLE_DESCRIPTION"] = ["", "", "kept", "", "", ""]
+    df = fused().process_dataframe(df, pause=0, description_limit=2,
+                                   skip_rows={"SIMPLE_DESCRIPTION": pd.Index([2])})
+
+    assert df["SIMPLE_DESCRIPTION"].tolist() == ["A thing", "No description available", "kept", "A thing", "", ""]
+
+
+def test_client_is_resolved_lazily(fake_client):
+    assert fused().client is fake_client
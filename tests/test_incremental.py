@@ -0,0 +1,69 @@
+import sys
+
+import pandas as pd
+
+from conftest import inventory
+from scripts import main
+from scripts.incremental import apply_baseline, content_hash, unchanged_rows
+
+LABELS = {
+    "Product Category": "Lab Supplies",
+    "Facility Suitability": "Hospital",
+    "Requires Electricity": "Yes",
+    "SIMPLE_DESCRIPTION": "A widget",
+}
+
+
+def processed(df):
+    return df.assign(**LABELS)
+
+
+def test_content_hash_survives_a_csv_round_trip(tmp_path):
+    df = inventory(["GLOVE NITRILE", "GAUZE PAD"], VEND_CAT_NUM=[1234.0, None])
+    df.to_csv(tmp_path / "items.csv", index=False)
+    # 1234.0 is read back as a float, the missing number as NaN
+    assert (content_hash(pd.read_csv(tmp_path / "items.csv")) == content_hash(df)).all()
+
+
+def test_unchanged_rows_reuse_the_baseline_and_changed_rows_do_not():
+    baseline = processed(inventory(["GLOVE NITRILE", "GAUZE PAD", "SYRINGE 10ML", "MASK"]))
+    df = inventory([" GLOVE NITRILE ", "GAUZE PAD STERILE", "SYRINGE 10ML", "MASK"], VENDOR_NAME=["Acme", "Acme", "Other", "Acme"])
+    df["Product Category"] = ["", "", "", "Kept"]
+
+    filled = apply_baseline(df, baseline)
+
+    # Row 0 only differs by whitespace; rows 1 and 2 changed description or vendor
+    assert list(filled["SIMPLE_DESCRIPTION"]) == [0, 3]
+    assert list(filled["Product Category"]) == [0]
+    assert list(unchanged_rows(filled, ["Facility Suitability", "SIMPLE_DESCRIPTION"])) == [0, 3]
+    assert list(df["Product Category"]) == ["Lab Supplies", "", "", "Kept"]
+    assert list(df["SIMPLE_DESCRIPTION"]) == ["A widget", "", "", "A widget"]
+
+
+def test_empty_baseline_values_are_not_reused():
+    baseline = processed(inventory(["GLOVE NITRILE", "GAUZE PAD"]))
+    baseline.loc[1, "SIMPLE_DESCRIPTION"] = None
+    df = inventory(["GLOVE NITRILE", "GAUZE PAD"])
+
+    filled = apply_baseline(df, baseline)
+    assert list(filled["Product Category"]) == [0, 1]
+    assert list(filled["SIMPLE_DESCRIPTION"]) == [0]
+
+
+def test_run_with_a_baseline_only_classifies_changed_rows(tmp_path, monkeypatch, fake_client):
+    descriptions = [f"WIDGET MODEL {i}" for i in range(5)]
+    baseline_path = tmp_path / "baseline.csv"
+    processed(inventory(descriptions)).to_csv(baseline_path, index=False)
+    descriptions[2] = "WIDGET MODEL 2 REV B"
+    path = tmp_path / "inventory.csv"
+    inventory(descriptions).to_csv(path, index=False)
+
+    monkeypatch.setattr(sys, "argv", ["main.py", "--input", str(path), "--baseline", str(baseline_path)])
+    main.process_file(main.parse_arguments(), str(path), str(tmp_path / "out.csv"))
+
+    prompts = [call["messages"][-1]["content"] for call in fake_client.chat.completions.calls]
+    assert prompts and all("REV B" in prompt for prompt in prompts)
+    result = pd.read_csv(tmp_path / "out.csv")
+    assert (result.drop(index=2)["Product Category"] == "Lab Supplies").all()
+    assert result.loc[2, "Product Category"] == "Medical & Surgical Supplies"
+    assert result.loc[2, "SIMPLE_DESCRIPTION"] == "A simple description"
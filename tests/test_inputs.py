@@ -0,0 +1,63 @@
+import json
+import sys
+
+import pytest
+
+from conftest import inventory
+from scripts import main
+
+
+@pytest.fixture
+def folder(tmp_path):
+    """A folder of inputs next to outputs of an earlier run and other files"""
+    for name in ["b.csv", "a.csv", "a_processed.csv", "a_partial.csv", "b_categorized.csv", "b_facilitized.csv",
+                 "notes.txt", "nested/c.csv"]:
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        inventory(["GLOVE", "GAUZE"]).to_csv(path, index=False)
+    (tmp_path / "folder.csv").mkdir()
+    return tmp_path
+
+
+def test_directory_expands_to_its_inputs(folder):
+    assert main.expand_inputs(str(folder)) == [str(folder / "a.csv"), str(folder / "b.csv")]
+
+
+@pytest.mark.parametrize("pattern, names", [
+    ("*.csv", ["a.csv", "b.csv"]),
+    ("a*", ["a.csv"]),
+    ("*/c.csv", ["nested/c.csv"]),
+    ("[b]*.csv", ["b.csv"]),
+    ("missing*.csv", []),
+])
+def test_glob_expands_to_matching_inputs(folder, pattern, names):
+    assert main.expand_inputs(str(folder / pattern)) == [str(folder / name) for name in names]
+
+
+def test_single_file_is_used_as_given(folder):
+    # Even an output or a missing file; main reports the missing file
+    assert main.expand_inputs(str(folder / "a_processed.csv")) == [str(folder / "a_processed.csv")]
+    assert main.expand_inputs(str(folder / "missing.csv")) == [str(folder / "missing.csv")]
+
+
+def test_directory_is_processed_as_a_batch(folder, monkeypatch):
+    out = folder / "out"
+    monkeypatch.setattr(sys, "argv", ["main.py", "--input", str(folder), "--output", str(out),
+                                      "--dry-run", "--workers", "2"])
+    with pytest.raises(SystemExit) as exit_info:
+        main.main()
+    assert exit_info.value.code == 0
+
+    with open(out / "batch_manifest.json") as f:
+        manifest = json.load(f)
+    assert manifest["files"] == 2 and manifest["failed"] == 0
+    assert [result["input"] for result in manifest["results"]] == [str(folder / "a.csv"), str(folder / "b.csv")]
+    assert all(result["status"] == "dry-run" for result in manifest["results"])
+
+
+def test_glob_without_matches_is_an_error(folder, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["main.py", "--input", str(folder / "missing*.csv")])
+    with pytest.raises(SystemExit) as exit_info:
+        main.main()
+    assert exit_info.value.code == 1
+    assert "No CSV files match" in capsys.readouterr().out
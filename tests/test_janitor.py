@@ -0,0 +1,48 @@
+import queue
+import time
+import uuid
+
+from janitor import Janitor
+from result_store import ResultStore
+
+
+def upload(folder, job_id):
+    folder.mkdir(exist_ok=True)
+    path = folder / f"{job_id}_inventory.csv"
+    path.write_text("DESCRIPTION\nGLOVE\n")
+    return str(path)
+
+
+def janitor(web_app, tmp_path, folder):
+    return Janitor(web_app.processing_tasks, ResultStore(str(tmp_path / "index.db")), [str(folder)],
+                   task_ttl=3600, file_ttl=0, disk_quota=0)
+
+
+def test_sweep_keeps_the_upload_of_a_queued_launched_preview(web_app, tmp_path, monkeypatch):
+    # Nothing picks the launched job up, so it stays queued during the sweep
+    monkeypatch.setattr(web_app, "job_queue", queue.Queue())
+    monkeypatch.setattr(web_app, "job_workers", [None] * web_app.app.config["JOB_WORKERS"])
+
+    folder = tmp_path / "uploads"
+    preview_id, launched_id = str(uuid.uuid4()), str(uuid.uuid4())
+    path = upload(folder, preview_id)
+    web_app.processing_tasks[preview_id] = {
+        'unique_id': preview_id, 'original_filename': 'inventory.csv', 'completed': True,
+        'finished_at': time.time(), 'preview': {'file_path': path, 'options': {}, 'total_rows': 1},
+    }
+    try:
+        assert web_app.launch_preview(preview_id, launched_id)
+        assert web_app.job_queue.qsize() == 1
+
+        sweep = janitor(web_app, tmp_path, folder).sweep(now=time.time() + 60)
+        assert sweep['deleted_jobs'] == 0
+        assert (folder / f"{preview_id}_inventory.csv").exists()
+
+        # Once the launched job has finished, the preview's upload may go
+        web_app.processing_tasks[launched_id]['completed'] = True
+        sweep = janitor(web_app, tmp_path, folder).sweep(now=time.time() + 60)
+        assert sweep['deleted_jobs'] == 1
+        assert not (folder / f"{preview_id}_inventory.csv").exists()
+    finally:
+        web_app.processing_tasks.pop(preview_id, None)
+        web_app.processing_tasks.pop(launched_id, None)
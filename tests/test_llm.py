@@ -0,0 +1,201 @@
+import threading
+import time
+
+import pytest
+
+from conftest import FakeClient
+from scripts import llm
+from scripts.llm import CircuitBreaker, CircuitOpenError, DeadlineExceeded, LatencyTracker
+
+MESSAGES = [{"role": "system", "content": "You describe items."}, {"role": "user", "content": "GLOVE"}]
+
+
+class SlowCompletions:
+    """Answers after the given delays, one per call in order; records running calls"""
+
+    def __init__(self, *delays):
+        self.delays = list(delays)
+        self.calls = 0
+        self.running = 0
+        self.answered = []
+        self._lock = threading.Lock()
+
+    def create(self, **params):
+        with self._lock:
+            delay = self.delays[min(self.calls, len(self.delays) - 1)]
+            self.calls += 1
+            number = self.calls
+            self.running += 1
+        try:
+            time.sleep(delay)
+            self.answered.append(number)
+            return FakeClient().chat.completions.create(**params)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def slow_client(*delays):
+    client = FakeClient()
+    client.chat.completions = SlowCompletions(*delays)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def fresh_policy(monkeypatch):
+    """Own breaker and latency history per test, default call policy afterwards"""
+    monkeypatch.setattr(llm, "circuit_breaker", CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    monkeypatch.setattr(llm, "latencies", LatencyTracker())
+    yield
+    llm.set_call_policy()
+
+
+def test_deadline_stops_the_request_without_retries():
+    client = slow_client(0.3)
+    llm.set_call_policy(deadline=0.05)
+    with pytest.raises(DeadlineExceeded):
+        llm.chat_completion(client, model="gpt-3.5-turbo", messages=MESSAGES)
+    assert client.options == [{"max_retries": 0, "timeout": 0.05}]
+    # The request thread has finished by the time the caller gets the error
+    assert client.chat.completions.running == 0
+
+
+def test_hedge_answers_from_the_faster_duplicate():
+    for _ in range(llm.HEDGE_MIN_SAMPLES):
+        llm.latencies.record("gpt-3.5-turbo", 0.01)
+    client = slow_client(0.5, 0.0)
+    llm.set_call_policy(deadline=2, hedge=True)
+    wins = llm.call_stats()["hedge_wins"]
+
+    start = time.monotonic()
+    response, hedged = llm._send_with_deadline(client, {"model": "gpt-3.5-turbo", "messages": MESSAGES}, 2, True)
+    assert hedged
+    assert time.monotonic() - start < 0.4
+    assert response.choices[0].message.content == "A simple description"
+    assert client.chat.completions.answered[0] == 2
+    assert llm.call_stats()["hedge_wins"] == wins + 1
+    # The duplicate only has the time left until the deadline
+    assert client.options[1]["timeout"] < 2
+
+
+def test_no_hedge_without_latency_history():
+    client = slow_client(0.05)
+    response, hedged = llm._send_with_deadline(client, {"model": "gpt-4", "messages": MESSAGES}, 2, True)
+    assert not hedged
+    assert client.chat.completions.calls == 1
+
+
+def test_breaker_opens_after_repeated_failures_and_refuses_calls():
+    client = slow_client(0.3)
+    llm.set_call_policy(deadline=0.02)
+    for _ in range(2):
+        with pytest.raises(DeadlineExceeded):
+            llm.chat_completion(client, model="gpt-3.5-turbo", messages=MESSAGES)
+    assert llm.circuit_breaker.state() == "open"
+
+    calls = client.chat.completions.calls
+    with pytest.raises(CircuitOpenError):
+        llm.chat_completion(client, model="gpt-3.5-turbo", messages=MESSAGES)
+    assert client.chat.completions.calls == calls
+    assert llm.circuit_breaker.stats()["rejected"] == 1
+
+
+def test_breaker_trial_call_closes_or_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()  # the trial call
+    assert breaker.state() == "half-open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.state() == "open" and breaker.opened == 2
+
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state() == "closed"
+    breaker.before_call()
+
+
+def test_rejected_request_does_not_count_against_the_endpoint():
+    class BadRequest(Exception):
+        status_code = 400
+
+    breaker = llm.circuit_breaker
+    client = FakeClient()
+    client.chat.completions.create = lambda **params: (_ for _ in ()).throw(BadRequest("invalid"))
+    for _ in range(3):
+        with pytest.raises(BadRequest):
+            llm.chat_completion(client, model="gpt-3.5-turbo", messages=MESSAGES)
+    assert breaker.state() == "closed"
+
+
+def concurrently(count, function):
+    """Run function(i) on count threads started together; returns results (or errors) in order"""
+    barrier = threading.Barrier(count)
+    outcomes = [None] * count
+
+    def run(i):
+        barrier.wait()
+        try:
+            outcomes[i] = function(i)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_identical_concurrent_requests_share_one_call(monkeypatch):
+    monkeypatch.setattr(llm, "single_flight", llm.SingleFlight())
+    client = slow_client(0.2)
+    # Whitespace differences in the prompts do not make a request different
+    messages = [MESSAGES, [MESSAGES[0], {"role": "user", "content": "  GLOVE\n"}]]
+
+    responses = concurrently(6, lambda i: llm.chat_completion(client, model="gpt-3.5-turbo", messages=messages[i % 2]))
+
+    assert client.chat.completions.calls == 1
+    assert all(response is responses[0] for response in responses)
+    assert llm.single_flight.stats() == {"calls": 1, "coalesced": 5}
+
+    # Once the call has finished the next identical request is sent again
+    llm.chat_completion(client, model="gpt-3.5-turbo", messages=MESSAGES)
+    assert client.chat.completions.calls == 2
+
+
+def test_different_requests_are_not_coalesced(monkeypatch):
+    monkeypatch.setattr(llm, "single_flight", llm.SingleFlight())
+    client = slow_client(0.1)
+    concurrently(4, lambda i: llm.chat_completion(
+        client, model="gpt-3.5-turbo", messages=[MESSAGES[0], {"role": "user", "content": f"GLOVE {i % 2}"}],
+        temperature=i // 2))
+    assert client.chat.completions.calls == 4
+    assert llm.single_flight.coalesced == 0
+
+
+def test_waiting_callers_get_the_error_of_the_shared_call():
+    flight = llm.SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("rate limited")
+
+    def call(i):
+        if i:
+            started.wait()
+        return flight.do("key", fail if i == 0 else lambda: "not run")
+
+    outcomes = concurrently(4, call)
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert flight.stats() == {"calls": 1, "coalesced": 3}
+    assert flight.do("key", lambda: "fresh") == ("fresh", False)
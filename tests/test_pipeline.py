@@ -0,0 +1,115 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from conftest import inventory
+from scripts.categorize import MedicalInventoryCategorizer
+from scripts.description import GPTDescriptionGenerator
+from scripts.facilitize import FacilitySuitabilityClassifier
+from scripts.pipeline import Stage, build_stages, run_stages, run_streaming
+from scripts.priority import StageRows, ValueCoverage, priority_order
+
+
+def description_stages(client, limit, reused=None):
+    generator = GPTDescriptionGenerator(client)
+    generator.request_interval = 0
+    return build_stages(
+        MedicalInventoryCategorizer(client),
+        description_generator=generator,
+        reused=reused,
+        settings={"categorization": {"pause": 0}, "descriptions": {"limit": limit}}
+    )
+
+
+def described(df):
+    return int((df["SIMPLE_DESCRIPTION"] != "").sum())
+
+
+def test_description_limit_covers_all_streamed_chunks(fake_client):
+    df = inventory([f"WIDGET MODEL {i}" for i in range(50)])
+    result = run_streaming(df, description_stages(fake_client, 12), chunk_size=10)
+    assert described(result) == 12
+    assert (result["SIMPLE_DESCRIPTION"].iloc[:12] != "").all()
+
+
+def test_description_limit_skips_reused_rows(fake_client):
+    df = inventory([f"WIDGET MODEL {i}" for i in range(30)])
+    df["SIMPLE_DESCRIPTION"] = ""
+    df.loc[:4, "SIMPLE_DESCRIPTION"] = "kept"
+    stages = description_stages(fake_client, 8, reused={"SIMPLE_DESCRIPTION": df.index[:5]})
+    result = run_streaming(df, stages, chunk_size=7)
+    assert (result["SIMPLE_DESCRIPTION"].iloc[:5] == "kept").all()
+    assert described(result.iloc[5:]) == 8
+
+
+def test_description_limit_in_a_single_run(fake_client):
+    df = inventory([f"WIDGET MODEL {i}" for i in range(20)])
+    result, _ = run_stages(df, description_stages(fake_client, 5))
+    assert described(result) == 5
+
+
+def test_staged_coverage_grows_row_by_row(fake_client):
+    df = inventory([f"WIDGET MODEL {i}" for i in range(12)], EXT_COST=[float(i + 1) for i in range(12)])
+    df = df.loc[priority_order(df, "EXT_COST")]
+    coverage = ValueCoverage(df, "EXT_COST")
+    shares = []
+
+    def rows_finished(rows):
+        coverage.add(rows)
+        shares.append(coverage.share())
+
+    generator = GPTDescriptionGenerator(fake_client)
+    generator.request_interval = 0
+    stages = build_stages(
+        MedicalInventoryCategorizer(fake_client),
+        classifier=FacilitySuitabilityClassifier(fake_client),
+        description_generator=generator,
+        reused={"Product Category": df.index[:2]},
+        settings={"categorization": {"pause": 0}, "facility": {"pause": 0}},
+        row_progress=lambda name: lambda i: finished.row_done(name, i)
+    )
+    finished = StageRows(df.index, [stage.name for stage in stages], rows_finished)
+    run_stages(df, stages, on_stage=finished.stage_done)
+
+    assert shares[-1] == 1.0
+    assert len([share for share in shares if 0 < share < 1]) >= 5
+    assert shares == sorted(shares)
+
+
+def test_independent_stages_run_in_parallel_on_their_own_columns():
+    df = pd.DataFrame({"DESCRIPTION": ["a", "b"], "NOTES": ["x", "y"], "EXT_COST": [1.0, 2.0]})
+    barrier = threading.Barrier(2, timeout=5)
+    seen = {}
+
+    def stage(name, output):
+        def run(data):
+            seen[name] = set(data.columns)
+            barrier.wait()  # both stages are running at the same time
+            data[output] = data["DESCRIPTION"].str.upper()
+            return data
+        return Stage(name, run, outputs=[output], inputs=["DESCRIPTION"])
+
+    def combine(data):
+        seen["combine"] = set(data.columns)
+        data["BOTH"] = data["UPPER"] + data["LOUD"]
+        return data
+
+    stages = [stage("upper", "UPPER"), stage("loud", "LOUD"),
+              Stage("combine", combine, outputs=["BOTH"], depends_on=["upper", "loud"], inputs=["UPPER", "LOUD"])]
+    finished = []
+    result, durations = run_stages(df, stages, on_stage=finished.append)
+
+    assert result["BOTH"].tolist() == ["AA", "BB"]
+    assert result["NOTES"].tolist() == ["x", "y"]
+    assert seen == {"upper": {"DESCRIPTION"}, "loud": {"DESCRIPTION"}, "combine": {"UPPER", "LOUD"}}
+    assert finished[-1] == "combine" and set(durations) == {"upper", "loud", "combine"}
+
+
+def test_stage_dependency_errors():
+    df = pd.DataFrame({"DESCRIPTION": ["a"]})
+    keep = lambda data: data
+    with pytest.raises(ValueError, match="unknown stages: missing"):
+        run_stages(df, [Stage("a", keep, outputs=[], depends_on=["missing"])])
+    with pytest.raises(ValueError, match="cycle"):
+        run_stages(df, [Stage("a", keep, outputs=[], depends_on=["b"]), Stage("b", keep, outputs=[], depends_on=["a"])])
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+import row_index
+from row_index import RowIndex
+
+
+def results():
+    return pd.DataFrame({
+        "ITEM_NO": [1, 2, 3, 4, 5, 6],
+        "DESCRIPTION": ["GLOVE NITRILE MEDIUM", "GLOVE LATEX SMALL", "GAUZE PAD 4X4", "Nitrile glove large",
+                        None, "SYRINGE 10ML"],
+        "Product Category": ["Lab Supplies", "Lab Supplies", "Needs Review", "Lab Supplies",
+                             "Office Supplies", None],
+        "Facility Suitability": ["Hospital", "Both", "Both", "Clinic", "Both", "Hospital"],
+        "Requires Electricity": ["No", "No", "No", "Needs Review", "No", "No"],
+    })
+
+
+@pytest.fixture(params=["fts", "like"])
+def index(request, tmp_path, monkeypatch):
+    if request.param == "like":
+        monkeypatch.setattr(row_index, "_fts5_available", lambda conn: False)
+    index = RowIndex.build(str(tmp_path / "rows.db"), results())
+    if request.param == "fts" and not index.fts:
+        pytest.skip("SQLite was built without FTS5")
+    assert index.fts == (request.param == "fts")
+    return index
+
+
+def items(page):
+    return [row[0] for row in page["rows"]]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("glove", ["1", "2", "4"]),
+    ("nitrile GLOVE", ["1", "4"]),
+    ("glo", ["1", "2", "4"]),
+    ("4x4", ["3"]),
+    ("glove gauze", []),
+    ("  --  ", ["1", "2", "3", "4", "5", "6"]),
+])
+def test_search_finds_rows_with_every_word(index, text, expected):
+    assert items(index.query(text=text)) == expected
+
+
+def test_filters_review_flag_and_search_combine(index):
+    assert items(index.query(filters={"Product Category": "Lab Supplies"})) == ["1", "2", "4"]
+    assert items(index.query(filters={"Product Category": "Lab Supplies", "Facility Suitability": "Clinic"})) == ["4"]
+    # Unknown filter columns and empty values are ignored
+    assert items(index.query(filters={"ITEM_NO": "1", "Facility Suitability": ""})) == ["1", "2", "3", "4", "5", "6"]
+    assert items(index.query(needs_review=True)) == ["3", "4"]
+    assert items(index.query(needs_review=True, text="glove")) == ["4"]
+
+
+def test_pages_and_facets(index):
+    page = index.query(page=2, per_page=4)
+    assert page["columns"] == list(results().columns)
+    assert (page["total"], page["page"], page["pages"]) == (6, 2, 2)
+    assert items(page) == ["5", "6"]
+    assert page["rows"][0][1] is None
+    # Out-of-range pages are clamped
+    assert index.query(page=9, per_page=4)["page"] == 2
+    assert index.facets() == {
+        "Product Category": ["Lab Supplies", "Needs Review", "Office Supplies"],
+        "Facility Suitability": ["Both", "Clinic", "Hospital"],
+    }
@@ -0,0 +1,87 @@
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from scripts.summary import CATEGORY_COL, DESCRIPTION_COL, ELECTRICITY_COL, FACILITY_COL, SummaryAggregator
+
+COLUMNS = [CATEGORY_COL, FACILITY_COL, ELECTRICITY_COL, DESCRIPTION_COL]
+
+
+def results(count, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "DESCRIPTION": [f"ITEM {i}" for i in range(count)],
+        CATEGORY_COL: rng.choice(["Lab Supplies", "Office Supplies", "Needs Review"], count),
+        FACILITY_COL: rng.choice(["Hospital", "Clinic", "Both"], count),
+        ELECTRICITY_COL: rng.choice(["Yes", "No"], count),
+        DESCRIPTION_COL: [f"simple {i}" for i in range(count)],
+    })
+    df.loc[::7, FACILITY_COL] = np.nan
+    return df
+
+
+def test_counts_match_a_direct_crosstab():
+    df = results(500)
+    summary = SummaryAggregator(COLUMNS, seed=1)
+    # Rows arrive both one by one and in blocks
+    summary.add_frame(df.iloc[:200])
+    for _, row in df.iloc[200:350].iterrows():
+        summary.add_row(row)
+    summary.add_frame(df.iloc[350:])
+
+    assert summary.total == len(df)
+    for column in (CATEGORY_COL, FACILITY_COL, ELECTRICITY_COL):
+        assert summary.distribution(column) == df[column].value_counts().to_dict()
+    expected = pd.crosstab(df[CATEGORY_COL], df[FACILITY_COL])
+    pd.testing.assert_frame_equal(summary.crosstab_frame(), expected, check_names=False, check_dtype=False)
+    assert summary.crosstab_frame().index.name == CATEGORY_COL
+
+
+def test_categorical_columns_count_only_labels_that_occur():
+    df = results(50)
+    df[CATEGORY_COL] = pd.Categorical(df[CATEGORY_COL], categories=["Lab Supplies", "Office Supplies", "Needs Review", "Unused"])
+    summary = SummaryAggregator(COLUMNS)
+    summary.add_frame(df)
+    assert "Unused" not in summary.distribution(CATEGORY_COL)
+    assert sum(summary.distribution(CATEGORY_COL).values()) == len(df)
+
+
+def test_concurrent_rows_are_all_counted():
+    df = results(400)
+    summary = SummaryAggregator(COLUMNS)
+    rows = [row for _, row in df.iterrows()]
+    threads = [threading.Thread(target=lambda part: [summary.add_row(row) for row in part], args=(rows[i::4],))
+               for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert summary.total == len(df)
+    assert summary.distribution(ELECTRICITY_COL) == df[ELECTRICITY_COL].value_counts().to_dict()
+
+
+def test_description_sample_is_uniform():
+    df = results(20)
+    picked = Counter()
+    for seed in range(400):
+        summary = SummaryAggregator([DESCRIPTION_COL], sample_size=5, seed=seed)
+        summary.add_frame(df.iloc[:8])
+        summary.add_frame(df.iloc[8:])
+        assert len(summary.samples) == 5
+        picked.update(original for original, _ in summary.samples)
+    # Every row is kept with probability 5/20, i.e. about 100 times in 400 runs
+    assert set(picked) == set(df["DESCRIPTION"])
+    assert all(60 < count < 140 for count in picked.values())
+
+
+def test_report_lists_counts_and_percentages():
+    df = results(20)
+    summary = SummaryAggregator(COLUMNS, seed=0)
+    summary.add_frame(df)
+    text = summary.render_text("inventory.csv", "inventory_processed.csv", 1.5, notes=["Rows reused: 0"])
+    count = int((df[ELECTRICITY_COL] == "Yes").sum())
+    assert f"Yes: {count} ({count / 20 * 100:.1f}%)" in text
+    assert "Total items processed: 20" in text and "Rows reused: 0" in text
+    assert summary.to_dict()["total"] == 20
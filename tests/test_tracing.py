@@ -0,0 +1,69 @@
+import json
+import sys
+import threading
+
+import pytest
+
+from conftest import inventory
+from scripts import main
+from scripts.tracing import Tracer
+
+
+def test_export_writes_chrome_trace_events(tmp_path):
+    tracer = Tracer(job_name="inventory.csv")
+    tracer.set_context(row=7)
+    with tracer.span("outer", rows=3) as attrs:
+        with tracer.span("llm_call", category="llm", model="gpt-4o-mini"):
+            pass
+        attrs["cached"] = 2
+    tracer.clear_context("row")
+    with pytest.raises(RuntimeError):
+        with tracer.span("failing"):
+            raise RuntimeError("boom")
+
+    def work():
+        with tracer.span("worker"):
+            pass
+
+    tracer.set_context(row=8)
+    worker = threading.Thread(target=work)
+    worker.start()
+    worker.join()
+
+    with open(tracer.export(str(tmp_path / "trace.json"))) as f:
+        trace = json.load(f)
+    assert trace["displayTimeUnit"] == "ms"
+    assert trace["otherData"] == {"job": "inventory.csv"}
+    events = {event["name"]: event for event in trace["traceEvents"]}
+    for event in events.values():
+        assert event["ph"] == "X"
+        assert set(event) == {"name", "cat", "ph", "ts", "dur", "pid", "tid", "args"}
+        assert event["ts"] >= 0 and event["dur"] >= 0
+
+    outer, call = events["outer"], events["llm_call"]
+    assert outer["cat"] == "pipeline" and call["cat"] == "llm"
+    assert outer["args"] == {"row": 7, "rows": 3, "cached": 2}
+    assert call["args"] == {"row": 7, "model": "gpt-4o-mini"}
+    # Nested spans lie inside their parent on the same thread
+    assert outer["ts"] <= call["ts"] and call["ts"] + call["dur"] <= outer["ts"] + outer["dur"]
+    assert call["tid"] == outer["tid"]
+    assert events["failing"]["args"] == {"error": "boom"}
+    # Context set on one thread does not leak into spans of another
+    assert events["worker"]["args"] == {}
+    assert events["worker"]["tid"] != outer["tid"]
+
+
+def test_trace_of_a_run_covers_every_step(tmp_path, monkeypatch, fake_client):
+    path = tmp_path / "inventory.csv"
+    inventory([f"WIDGET MODEL {i}" for i in range(6)]).to_csv(path, index=False)
+    monkeypatch.setattr(sys, "argv", ["main.py", "--input", str(path), "--trace", "--description-batch", "1"])
+    args = main.parse_arguments()
+
+    main.process_file(args, str(path), str(tmp_path / "out.csv"))
+
+    with open(tmp_path / "out_trace.json") as f:
+        trace = json.load(f)
+    names = {event["name"] for event in trace["traceEvents"]}
+    assert {"read", "stage", "llm_call", "write"} <= names
+    stages = {event["args"].get("stage") for event in trace["traceEvents"] if event["name"] == "stage"}
+    assert {"categorization", "descriptions"} <= stages
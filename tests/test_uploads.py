@@ -0,0 +1,79 @@
+import gzip
+import io
+import os
+import queue
+import zipfile
+
+import pandas as pd
+import pytest
+
+from conftest import inventory
+from uploads import UploadError, UploadSink
+
+
+@pytest.fixture
+def client(web_app, monkeypatch):
+    """Test client whose submitted jobs stay queued"""
+    monkeypatch.setattr(web_app, "job_queue", queue.Queue())
+    monkeypatch.setattr(web_app, "job_workers", [None] * web_app.app.config["JOB_WORKERS"])
+    return web_app.app.test_client()
+
+
+def submit(client, data, filename):
+    response = client.post("/api/jobs", data={"file": (io.BytesIO(data), filename)},
+                           content_type="multipart/form-data")
+    return response.status_code, response.get_json()["jobs"][0]
+
+
+def csv_bytes(rows=25):
+    return inventory([f"WIDGET, MODEL {i}\nSECOND LINE" for i in range(rows)]).to_csv(index=False).encode("utf-8")
+
+
+def saved(web_app, job):
+    return os.path.join(web_app.app.config["UPLOAD_FOLDER"], f"{job['job_id']}_{job['filename']}")
+
+
+def test_gzip_upload_is_stored_as_csv(web_app, client):
+    status, job = submit(client, gzip.compress(csv_bytes()), "stock.csv.gz")
+    assert status == 202
+    assert job["filename"] == "stock.csv" and job["rows"] == 25
+    assert len(pd.read_csv(saved(web_app, job))) == 25
+
+
+def test_zip_upload_is_stored_as_csv(web_app, client):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("stock.csv", csv_bytes(12))
+    status, job = submit(client, archive.getvalue(), "stock.zip")
+    assert status == 202
+    assert job["rows"] == 12
+    assert len(pd.read_csv(saved(web_app, job))) == 12
+
+
+def test_bad_header_is_rejected(web_app, client):
+    before = set(os.listdir(web_app.app.config["UPLOAD_FOLDER"]))
+    data = b"SKU,TEXT\n" + b"1,GLOVE\n" * 1000
+    status, job = submit(client, gzip.compress(data), "stock.csv.gz")
+    assert status == 400
+    assert "Missing required columns: ITEM_NO, DESCRIPTION, VENDOR_NAME" in job["error"]
+    assert set(os.listdir(web_app.app.config["UPLOAD_FOLDER"])) == before
+
+
+def test_sink_stops_writing_after_a_bad_header(tmp_path):
+    sink = UploadSink("stock.csv", str(tmp_path))
+    sink.write(b"SKU,TEXT\n1,GLOVE\n")
+    sink.write(b"2,GOWN\n" * 1000)
+    assert isinstance(sink.error, UploadError)
+    assert os.path.getsize(sink.path) == 0
+    with pytest.raises(UploadError):
+        sink.finish()
+    sink.close()
+    assert not os.listdir(tmp_path)
+
+
+def test_truncated_gzip_is_rejected(tmp_path):
+    sink = UploadSink("stock.csv.gz", str(tmp_path))
+    sink.write(gzip.compress(csv_bytes())[:-20])
+    with pytest.raises(UploadError):
+        sink.finish()
+    sink.close()
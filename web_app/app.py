@@ -1,12 +1,13 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, session, flash, jsonify
+from flask import Flask, Request, render_template, request, redirect, url_for, send_file, session, flash, jsonify, stream_with_context
 import os
 import pandas as pd
 import uuid
 import time
 import threading
+import mimetypes
+import queue
+import json
 from werkzeug.utils import secure_filename
-from dotenv import load_dotenv
-from openai import OpenAI
 import sys 
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -21,29 +22,191 @@ from scripts.read_csv import read_inventory_csv
 from scripts.categorize import MedicalInventoryCategorizer
 from scripts.facilitize import FacilitySuitabilityClassifier
 from scripts.description import GPTDescriptionGenerator
+from scripts.tracing import Tracer
+from scripts.cascade import ModelCascade, DEFAULT_CONFIDENCE_THRESHOLD
+from scripts.fused import FusedItemClassifier
+from scripts.incremental import apply_baseline, unchanged_rows, merge_filled
+from scripts.catalog import ItemCatalog
+from scripts.clients import get_client
+from scripts.summary import SummaryAggregator
+from scripts.pipeline import build_stages, run_stages, run_streaming
+from scripts.preview import run_preview, projection_records
+from scripts.priority import PRIORITY_COLUMNS, priority_order, ValueCoverage, StageRows
+from scripts.clusters import CLUSTER_COLUMNS, plan_clusters, skip_members, propagate_labels
+from scripts.estimate import estimate_run, render_estimate_html
+from result_store import ResultStore
+from janitor import Janitor
+from row_index import RowIndex
+from uploads import save_upload, upload_format, stored_csv_name, UploadError, UploadSink
+
+# Endpoints whose "file" uploads are inventory files
+INVENTORY_UPLOAD_ENDPOINTS = {'index', 'api_submit'}
+
+class UploadRequest(Request):
+    """
+    Request that decompresses and header-checks inventory uploads while the body
+    arrives, so a file with the wrong columns is not written out in full
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint in INVENTORY_UPLOAD_ENDPOINTS and upload_format(filename or '') is not None:
+            return UploadSink(filename, app.config['UPLOAD_FOLDER'], app.config['MAX_UNCOMPRESSED_BYTES'])
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
 
 app = Flask(__name__) 
+app.request_class = UploadRequest
 app.secret_key = os.urandom(24)
 
 UPLOAD_FOLDER = 'uploads'
 RESULTS_FOLDER = 'results'
-ALLOWED_EXTENSIONS = {'csv', 'xlsx'}
+ALLOWED_EXTENSIONS = {'csv', 'csv.gz', 'zip'}
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['RESULTS_FOLDER'] = RESULTS_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB limit
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 512)) * 1024 * 1024
+app.config['MAX_UNCOMPRESSED_BYTES'] = int(os.getenv('MAX_UNCOMPRESSED_MB', 2048)) * 1024 * 1024
+app.config['CATALOG_PATH'] = os.getenv('ITEM_CATALOG_PATH', 'item_catalog.db')
+
+# Retention: finished job state is dropped from memory after JOB_TTL, uploads and
+# results are deleted after FILE_TTL or (oldest first) while over DISK_QUOTA
+app.config['JOB_TTL_SECONDS'] = int(os.getenv('JOB_TTL_SECONDS', 6 * 60 * 60))
+app.config['FILE_TTL_SECONDS'] = int(os.getenv('FILE_TTL_SECONDS', 48 * 60 * 60))
+app.config['DISK_QUOTA_BYTES'] = int(os.getenv('DISK_QUOTA_MB', 2048)) * 1024 * 1024 or None  # 0 disables the quota
+app.config['JANITOR_INTERVAL_SECONDS'] = int(os.getenv('JANITOR_INTERVAL_SECONDS', 10 * 60))
+
+# Number of jobs processed at the same time; further jobs wait in the queue
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 4))
+
+# Index of each job's downloadable artifacts
+result_store = ResultStore(os.path.join(RESULTS_FOLDER, 'index.db'))
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Results shared between all jobs, so overlapping uploads are not classified twice
+catalog = ItemCatalog(app.config['CATALOG_PATH'])
 
 # Dictionary to store processing progress
 processing_tasks = {}
 
+# Background cleanup of old job state and files
+janitor = Janitor(
+    processing_tasks,
+    result_store,
+    [UPLOAD_FOLDER, RESULTS_FOLDER],
+    task_ttl=app.config['JOB_TTL_SECONDS'],
+    file_ttl=app.config['FILE_TTL_SECONDS'],
+    disk_quota=app.config['DISK_QUOTA_BYTES'],
+    interval=app.config['JANITOR_INTERVAL_SECONDS']
+)
+if app.config['JANITOR_INTERVAL_SECONDS'] > 0:
+    janitor.start()
+
+# Jobs waiting for a worker, and the worker threads (started on first use)
+job_queue = queue.Queue()
+job_workers = []
+job_workers_lock = threading.Lock()
+
+def job_worker():
+    """Run queued jobs one after another"""
+    while True:
+        processing_id, args = job_queue.get()
+        try:
+            processing_tasks[processing_id]['started_at'] = time.time()
+            process_background_task(processing_id, *args)
+        except KeyError:
+            pass  # Task state was removed before the job started
+        finally:
+            job_queue.task_done()
+
+def start_job(processing_id, file_path, unique_id, original_filename, options, total_items, batch_id=None):
+    """Register a job's progress state and queue it for processing"""
+    if batch_id:
+        result_store.add_to_batch(batch_id, processing_id)
+    processing_tasks[processing_id] = {
+        'total_items': total_items,
+        'completed_items': 0,
+        'status': 'Queued',
+        'current_step': 'Waiting for a free worker',
+        'completed': False,
+        'error': None,
+        'results': None,
+        'unique_id': unique_id,
+        'original_filename': original_filename,
+        'batch_id': batch_id,
+        # Files the job reads; a launched preview reads the preview's upload
+        'input_paths': [path for path in (file_path, options.get('baseline_path')) if path],
+        'submitted_at': time.time()
+    }
+    
+    with job_workers_lock:
+        while len(job_workers) < app.config['JOB_WORKERS']:
+            worker = threading.Thread(target=job_worker, name=f"job-worker-{len(job_workers)}", daemon=True)
+            worker.start()
+            job_workers.append(worker)
+    
+    job_queue.put((processing_id, (file_path, unique_id, original_filename, options)))
+
+def launch_preview(job_id, processing_id):
+    """
+    Queue the full run of a finished preview job as processing_id; its
+    results are stored under processing_id, like other API jobs.
+    Returns False if job_id is not a finished preview.
+    """
+    task = processing_tasks.get(job_id)
+    preview = task.get('preview') if task else None
+    if not preview:
+        return False
+    start_job(processing_id, preview['file_path'], processing_id, task['original_filename'],
+              dict(preview['options'], preview=0), preview['total_rows'], batch_id=task.get('batch_id'))
+    return True
+
 def allowed_files(filename):
     """Check if the file has an allowed extension."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return upload_format(filename) in ALLOWED_EXTENSIONS
+
+def job_classifiers(client, options, tracer=None):
+    """Classifiers for the stages enabled in a job's options (None for disabled stages)"""
+    use_cascade = options.get('use_cascade', True)
+    cascade_threshold = options.get('cascade_threshold', DEFAULT_CONFIDENCE_THRESHOLD)
+    categorizer = MedicalInventoryCategorizer(
+        client,
+        tracer=tracer,
+        cascade=ModelCascade.for_stage('categorization', use_cascade, cascade_threshold)
+    )
+    classifier = None
+    if not options.get('skip_facility', True):
+        classifier = FacilitySuitabilityClassifier(
+            client,
+            tracer=tracer,
+            cascade=ModelCascade.for_stage('facility', use_cascade, cascade_threshold)
+        )
+    electricity_classifier = None
+    if options.get('classify_electricity', False):
+        electricity_classifier = classifier or FacilitySuitabilityClassifier(client, tracer=tracer)
+    description_generator = None
+    if not options.get('skip_descriptions', True):
+        description_generator = GPTDescriptionGenerator(client, tracer=tracer)
+    return categorizer, classifier, electricity_classifier, description_generator
+
+def job_output_columns(classifier, electricity_classifier, description_generator):
+    """Output columns written by the enabled stages"""
+    output_columns = ["Product Category"]
+    if classifier:
+        output_columns.append("Facility Suitability")
+    if electricity_classifier:
+        output_columns.append("Requires Electricity")
+    if description_generator:
+        output_columns.append("SIMPLE_DESCRIPTION")
+    return output_columns
+
+def stage_settings(batch_size, preserve_existing):
+    """Keyword arguments of the label stages for web jobs"""
+    return {
+        'categorization': {'batch_size': batch_size, 'preserve_existing': preserve_existing,
+                           'pause': 0.1},  # Small delay to avoid rate limiting
+        'facility': {'batch_size': 10, 'pause': 0.05},
+        'electricity': {'batch_size': 10, 'pause': 0.05},
+    }
 
 def process_background_task(processing_id, file_path, unique_id, original_filename, options):
     """Background task to process data with progress tracking"""
@@ -53,189 +216,272 @@ def process_background_task(processing_id, file_path, unique_id, original_filena
         # Extract options
         preserve_existing = options.get('preserve_existing', True)
         batch_size = options.get('batch_size', 50)
-        skip_facility = options.get('skip_facility', True)
-        skip_descriptions = options.get('skip_descriptions', True)
+        fused = options.get('fused', False)
+        baseline_path = options.get('baseline_path')
+        use_catalog = options.get('use_catalog', True)
+        stream = options.get('stream', False)
+        stream_chunk_size = options.get('stream_chunk_size', 100)
+        cluster = options.get('cluster', False)
+        preview = options.get('preview', 0)
+        priority = options.get('priority')
         
         # Define file paths
         base_name = os.path.splitext(original_filename)[0]
         final_filename = f"{base_name}_processed.csv"
         final_path = os.path.join(app.config['RESULTS_FOLDER'], f"{unique_id}_{final_filename}")
         
-        # Define intermediate file paths if needed
-        categorized_output = final_path
-        facility_output = final_path
-        
-        if not skip_facility or not skip_descriptions:
-            categorized_filename = f"{base_name}_categorized.csv"
-            categorized_output = os.path.join(app.config['RESULTS_FOLDER'], f"{unique_id}_{categorized_filename}")
-        
-        if not skip_facility and not skip_descriptions:
-            facilitized_filename = f"{base_name}_facilitized.csv"
-            facility_output = os.path.join(app.config['RESULTS_FOLDER'], f"{unique_id}_{facilitized_filename}")
-        elif not skip_facility:
-            facility_output = final_path
-            
         # Track timing and process data
         processing_times = {}
         df = None
+        tracer = Tracer(job_name=original_filename)
+        # Every job shares one pooled client and its open connections
+        client = get_client()
+        
+        def stage_progress(step_name):
+            """Build a progress callback that reports item counts for one step"""
+            def callback(count, total):
+                progress_data['completed_items'] = count
+                progress_data['current_step'] = f'{step_name} ({count}/{total})'
+            return callback
         
         # 1. Read and validate the CSV file
         progress_data['status'] = 'Reading and validating CSV file'
         progress_data['current_step'] = 'Data validation'
         
         start_time = time.time()
-        df = read_inventory_csv(file_path)
+        with tracer.span("read", path=file_path):
+            df = read_inventory_csv(file_path)
         progress_data['total_items'] = len(df)
         progress_data['completed_items'] = len(df)  # Mark this step as complete
         processing_times['reading'] = time.time() - start_time
         
-        # 2. Categorize items
-        progress_data['status'] = 'Categorizing medical inventory items'
-        progress_data['current_step'] = 'Category assignment'
-        progress_data['completed_items'] = 0  # Reset for new step
+        # Most valuable rows first; progress reports the share of their total value finished
+        file_order = df.index
+        coverage = None
+        if priority:
+            df = df.loc[priority_order(df, priority)]
+            coverage = ValueCoverage(df, priority)
+            progress_data['priority'] = priority
+            progress_data['value_covered'] = 0.0
         
-        start_time = time.time()
+        def rows_finished(rows):
+            """Count finished rows towards the covered value"""
+            if coverage:
+                coverage.add(rows)
+                progress_data['value_covered'] = coverage.share()
         
-        # Custom categorizer implementation to track progress
-        categorizer = MedicalInventoryCategorizer(client)
+        # Set up the classifiers for the enabled stages
+        categorizer, classifier, electricity_classifier, description_generator = job_classifiers(client, options, tracer)
+        output_columns = job_output_columns(classifier, electricity_classifier, description_generator)
         
-        # If Product Category column doesn't exist, add it
-        if "Product Category" not in df.columns:
-            df["Product Category"] = ""
+        # Running totals for the summary, readable while the job runs
+        summary = SummaryAggregator(output_columns)
+        progress_data['summary'] = summary
+        notes = []
         
-        # Count items that need categorization
-        if preserve_existing:
-            items_to_categorize = df[df["Product Category"].isna() | (df["Product Category"] == "")].shape[0]
-        else:
-            items_to_categorize = len(df)
-            df["Product Category"] = ""
-        
-        # Process items with progress tracking
-        count = 0
-        for i in range(len(df)):
-            # Skip if category exists and we're preserving existing values
-            if preserve_existing and df.loc[i, "Product Category"] and not pd.isna(df.loc[i, "Product Category"]):
-                continue
+        # Reuse results for rows that have not changed since a previous run
+        reused = {}
+        if baseline_path:
+            progress_data['status'] = 'Matching rows against previous results'
+            progress_data['current_step'] = 'Baseline comparison'
             
-            # Get item description and other relevant fields
-            description = df.loc[i, "DESCRIPTION"] if "DESCRIPTION" in df.columns else ""
-            vendor_name = df.loc[i, "VENDOR_NAME"] if "VENDOR_NAME" in df.columns else None
-            subcategory = df.loc[i, "SUBCATEGORY"] if "SUBCATEGORY" in df.columns else None
+            start_time = time.time()
+            with tracer.span("baseline", path=baseline_path):
+                reused = apply_baseline(df, pd.read_csv(baseline_path), output_columns)
+            progress_data['reused_items'] = len(unchanged_rows(reused, output_columns))
+            notes.append(f"Unchanged items reused from previous results: {progress_data['reused_items']}")
+            processing_times['baseline'] = time.time() - start_time
+        
+        # Reuse results earlier jobs stored for the same items
+        if use_catalog:
+            progress_data['status'] = 'Looking up previously processed items'
+            progress_data['current_step'] = 'Catalog lookup'
             
-            # Categorize the item
-            category = categorizer.categorize_item(description, vendor_name, subcategory)
-            df.loc[i, "Product Category"] = category
+            start_time = time.time()
+            with tracer.span("catalog_lookup", path=app.config['CATALOG_PATH']):
+                known = catalog.lookup(df, output_columns)
+            progress_data['catalog_items'] = len(unchanged_rows(known, output_columns))
+            notes.append(f"Items found in shared catalog: {progress_data['catalog_items']}")
+            reused = merge_filled(reused, known)
+            processing_times['catalog'] = time.time() - start_time
+        
+        # Preview jobs classify a stratified sample, project the distributions and stop
+        if preview:
+            progress_data['status'] = 'Classifying a sample of items'
+            progress_data['current_step'] = f'Preview ({min(preview, len(df))} of {len(df)} items)'
             
-            count += 1
-            # Update progress
-            progress_data['completed_items'] = count
-            progress_data['current_step'] = f'Category assignment ({count}/{items_to_categorize})'
+            start_time = time.time()
+            stages = build_stages(
+                categorizer,
+                classifier=classifier,
+                electricity_classifier=electricity_classifier,
+                reused=reused,
+                settings=stage_settings(batch_size, preserve_existing)
+            )
+            with tracer.span("preview", rows=preview):
+                sample, projections = run_preview(df, preview, stages)
+            if use_catalog:
+                # The full run finds the sampled items in the catalog
+                with tracer.span("catalog_record", path=app.config['CATALOG_PATH']):
+                    catalog.record(sample, output_columns)
+            processing_times['preview'] = time.time() - start_time
             
-            if count % batch_size == 0 and count < items_to_categorize:
-                time.sleep(0.1)  # Small delay to avoid rate limiting
+            progress_data['preview'] = {
+                'sample_rows': len(sample),
+                'total_rows': len(df),
+                'projections': projection_records(projections),
+                'processing_time': sum(processing_times.values()),
+                'file_path': file_path,
+                'options': options
+            }
+            progress_data['status'] = 'Preview complete'
+            progress_data['finished_at'] = time.time()
+            progress_data['completed'] = True
+            progress_data['completed_items'] = progress_data['total_items']
+            return
         
-        # Save results
-        df.to_csv(categorized_output, index=False)
-        
-        processing_times['categorization'] = time.time() - start_time
-        
-        # Get category distribution for results page
-        category_counts = df["Product Category"].value_counts().to_dict()
-        progress_data['category_counts'] = category_counts
-        
-        # 3. Classify facility suitability (if not skipped)
-        facility_counts = {}
-        
-        if not skip_facility:
-            progress_data['status'] = 'Classifying facility suitability'
-            progress_data['current_step'] = 'Facility classification'
+        if fused:
+            # 2-4. One combined AI call per item for all enabled stages
+            progress_data['status'] = 'Classifying items (combined AI calls)'
+            progress_data['current_step'] = 'Combined classification'
             progress_data['completed_items'] = 0  # Reset for new step
             
-            start_time = time.time()
+            # Rows reused for every column are finished already; the rest are counted as they finish
+            summary.add_frame(df.loc[unchanged_rows(reused, output_columns)])
             
-            # Custom facility classification with progress tracking
-            classifier = FacilitySuitabilityClassifier(client)
+            def row_done(i):
+                summary.add_row(df.loc[i])
+                rows_finished(i)
             
-            # Process with our own progress tracking instead of using the class method
-            df = pd.read_csv(categorized_output)
+            start_time = time.time()
+            fused_classifier = FusedItemClassifier(
+                client,
+                categorizer=categorizer,
+                facility_classifier=classifier,
+                electricity_classifier=electricity_classifier,
+                description_generator=description_generator,
+                tracer=tracer
+            )
+            df = fused_classifier.process_dataframe(
+                df,
+                preserve_existing=preserve_existing,
+                batch_size=batch_size,
+                pause=0.1,  # Small delay to avoid rate limiting
+                progress_callback=stage_progress('Combined classification'),
+                skip_rows=reused,
+                row_callback=row_done
+            )
+            processing_times['combined'] = time.time() - start_time
+        else:
+            # 2-4. Enabled stages; stages that do not depend on each other run in parallel
+            stage_counts = {}
             
-            # Add facility suitability column
-            df["Facility Suitability"] = ""
+            def parallel_progress(stage_name):
+                """Progress callback for one of several concurrently running stages"""
+                def callback(count, total):
+                    stage_counts[stage_name] = (count, total)
+                    counts = list(stage_counts.items())
+                    running = [(name, done, of) for name, (done, of) in counts if done < of]
+                    fraction = sum(done / of for _, (done, of) in counts if of) / len(stages)
+                    progress_data['completed_items'] = int(fraction * progress_data['total_items'])
+                    progress_data['current_step'] = ', '.join(f'{name} ({done}/{of})' for name, done, of in running)
+                return callback
             
-            for i in range(len(df)):
-                # Get description and category
-                description = df.loc[i, "DESCRIPTION"] if "DESCRIPTION" in df.columns else ""
-                category = df.iloc[i]["Product Category"] if "Product Category" in df.columns else None
-                vendor_name = df.loc[i, "VENDOR_NAME"] if "VENDOR_NAME" in df.columns else None
-                
-                # Determine facility suitability
-                facility_type = classifier.determine_facility_suitability(description, category, vendor_name)
-                df.loc[i, "Facility Suitability"] = facility_type
-                
-                # Update progress
-                progress_data['completed_items'] = i + 1
-                progress_data['current_step'] = f'Facility classification ({i+1}/{len(df)})'
-                
-                if (i + 1) % 10 == 0:
-                    time.sleep(0.05)  # Small delay
+            # Near-duplicate items skip the label stages and copy their representative's labels afterwards
+            clusters = pd.Series(dtype=object)
+            cluster_targets = {}
+            if cluster and not stream:
+                progress_data['status'] = 'Grouping near-identical items'
+                cluster_columns = [column for column in CLUSTER_COLUMNS if column in output_columns]
+                with tracer.span("cluster", rows=len(df)):
+                    clusters = plan_clusters(df, cluster_columns, reused)
+                cluster_targets = skip_members(reused, clusters, cluster_columns)
+                progress_data['clustered_items'] = len(clusters)
             
-            # Save processed data
-            df.to_csv(facility_output, index=False)
+            def row_progress(stage_name):
+                """Per-row callback for a stage, feeding the value coverage"""
+                if coverage and not stream:
+                    return lambda i: finished_rows.row_done(stage_name, i)
             
-            processing_times['facility'] = time.time() - start_time
+            stages = build_stages(
+                categorizer,
+                classifier=classifier,
+                electricity_classifier=electricity_classifier,
+                description_generator=description_generator,
+                reused=reused,
+                settings=stage_settings(batch_size, preserve_existing),
+                progress=None if stream else parallel_progress,
+                row_progress=row_progress
+            )
+            # A row counts towards the covered value once every stage is done with it
+            finished_rows = StageRows(df.index, [stage.name for stage in stages], rows_finished) if coverage and not stream else None
             
-            # Get facility distribution
-            facility_counts = df["Facility Suitability"].value_counts().to_dict()
-            progress_data['facility_counts'] = facility_counts
-        
-        # 4. Generate simple descriptions (if not skipped)
-        if not skip_descriptions:
-            progress_data['status'] = 'Generating simple descriptions'
-            progress_data['current_step'] = 'Description generation'
+            progress_data['status'] = 'Classifying items'
+            progress_data['current_step'] = ', '.join(stage.name for stage in stages)
             progress_data['completed_items'] = 0  # Reset for new step
             
             start_time = time.time()
-            
-            description_generator = GPTDescriptionGenerator()
-            
-            # Get the input file based on previous steps
-            input_for_desc = facility_output if not skip_facility else categorized_output
-            
-            # Load data from the appropriate input file
-            df = pd.read_csv(input_for_desc)
-            
-            # Add simple description column
-            df['SIMPLE_DESCRIPTION'] = ""
-            
-            # Process each row with progress updates
-            for idx, row in enumerate(df.iterrows()):
-                index, item_data = row
-                gpt_desc = description_generator.generate_description(item_data.to_dict())
-                df.loc[index, 'SIMPLE_DESCRIPTION'] = gpt_desc
+            if stream:
+                # Finished rows can be downloaded from the partial output while the job runs
+                partial_path = os.path.join(app.config['RESULTS_FOLDER'], f"{unique_id}_{base_name}_partial.csv")
+                progress_data['stage_counts'] = {stage.name: 0 for stage in stages}
+                progress_data['partial_rows'] = 0
                 
-                # Update progress
-                progress_data['completed_items'] = idx + 1
-                progress_data['current_step'] = f'Description generation ({idx+1}/{len(df)})'
+                def save_chunk(chunk):
+                    first = progress_data['partial_rows'] == 0
+                    chunk.to_csv(partial_path, mode='w' if first else 'a', header=first, index=False)
+                    if first:
+                        result_store.register(unique_id, 'partial', partial_path, f"{base_name}_partial.csv")
+                    progress_data['partial_rows'] += len(chunk)
+                    progress_data['completed_items'] = progress_data['partial_rows']
+                    summary.add_frame(chunk)
+                    rows_finished(chunk.index)
                 
-                if (idx + 1) % 10 == 0:
-                    time.sleep(0.05)  # Small delay
-            
-            # Save results
+                def stream_progress(counts):
+                    progress_data['stage_counts'] = counts
+                    progress_data['current_step'] = ', '.join(f'{name} ({done}/{len(df)})' for name, done in counts.items())
+                
+                df = run_streaming(df, stages, chunk_size=stream_chunk_size, on_chunk=save_chunk,
+                                   on_progress=stream_progress)
+            else:
+                df, _ = run_stages(df, stages, on_stage=finished_rows.stage_done if finished_rows else None)
+                if len(clusters):
+                    filled = propagate_labels(df, clusters, cluster_targets)
+                    notes.append(f"Items labelled from a near-duplicate representative: {len(set().union(*filled.values()))}")
+                summary.add_frame(df)
+            processing_times['stages'] = time.time() - start_time
+        
+        # AI answers shared by items whose descriptions differ only in spelling
+        reused_answers = categorizer.reused_answers + (classifier.reused_answers if classifier else 0)
+        if reused_answers:
+            notes.append(f"AI answers reused for items with the same canonical description: {reused_answers}")
+        
+        if priority:
+            df = df.loc[file_order]
+            notes.append(f"Rows processed by descending {priority}")
+        
+        # Save results
+        with tracer.span("write", path=final_path):
             df.to_csv(final_path, index=False)
-            
-            processing_times['descriptions'] = time.time() - start_time
-        
-        # Make sure the final file exists
-        if skip_descriptions and skip_facility:
-            # If we only did categorization, rename the output file to the final path
-            if os.path.exists(categorized_output) and categorized_output != final_path:
-                os.rename(categorized_output, final_path)
-                df = pd.read_csv(final_path)
-        elif skip_descriptions and not skip_facility:
-            # If we did categorization and facility but no descriptions
-            if os.path.exists(facility_output) and facility_output != final_path:
-                os.rename(facility_output, final_path)
-                df = pd.read_csv(final_path)
+        with tracer.span("catalog_record", path=app.config['CATALOG_PATH']):
+            catalog.record(df, output_columns)
+        if stream and os.path.exists(partial_path):
+            # The complete output replaces the partial one
+            os.remove(partial_path)
+        
+        # Indexed copy of the output for the results browser
+        progress_data['status'] = 'Indexing results'
+        rows_filename = f"{base_name}_rows.db"
+        rows_path = os.path.join(app.config['RESULTS_FOLDER'], f"{unique_id}_{rows_filename}")
+        with tracer.span("row_index", path=rows_path):
+            if os.path.exists(rows_path):
+                os.remove(rows_path)
+            RowIndex.build(rows_path, df)
+        
+        # Get distributions for results page
+        category_counts = summary.distribution("Product Category")
+        facility_counts = summary.distribution("Facility Suitability")
+        electricity_counts = summary.distribution("Requires Electricity")
         
         # Calculate total processing time
         total_time = sum(processing_times.values())
@@ -246,65 +492,24 @@ def process_background_task(processing_id, file_path, unique_id, original_filena
         
         summary_filename = f"{base_name}_summary.txt"
         summary_path = os.path.join(app.config['RESULTS_FOLDER'], f"{unique_id}_{summary_filename}")
+        summary_json_filename = f"{base_name}_summary.json"
+        summary_json_path = os.path.join(app.config['RESULTS_FOLDER'], f"{unique_id}_{summary_json_filename}")
         
-        # Create the summary report
-        with open(summary_path, 'w') as f:
-            f.write("Medical Inventory Processing Summary\n")
-            f.write("==================================\n\n")
-            
-            f.write(f"Input file: {original_filename}\n")
-            f.write(f"Output file: {final_filename}\n")
-            f.write(f"Processing time: {total_time:.2f} seconds\n\n")
-            
-            f.write(f"Total items processed: {len(df)}\n\n")
-            
-            # Product Category distribution
-            f.write("Product Category Distribution:\n")
-            f.write("----------------------------\n")
-            for category, count in category_counts.items():
-                percentage = (count / len(df)) * 100
-                f.write(f"{category}: {count} ({percentage:.1f}%)\n")
-            
-            # Facility Suitability distribution (if available)
-            if not skip_facility and "Facility Suitability" in df.columns:
-                f.write("\nFacility Suitability Distribution:\n")
-                f.write("--------------------------------\n")
-                for facility, count in facility_counts.items():
-                    percentage = (count / len(df)) * 100
-                    f.write(f"{facility}: {count} ({percentage:.1f}%)\n")
-            
-            # Cross-tabulation of Category and Facility Suitability
-            if not skip_facility and "Facility Suitability" in df.columns:
-                f.write("\nCategory by Facility Cross-tabulation:\n")
-                f.write("---------------------------------\n")
-                cross_tab = pd.crosstab(df["Product Category"], df["Facility Suitability"])
-                f.write(cross_tab.to_string())
-                
-            # Sample of Simple Descriptions (if available)
-            if not skip_descriptions and "SIMPLE_DESCRIPTION" in df.columns:
-                f.write("\nSample of Simple Descriptions:\n")
-                f.write("----------------------------\n")
-                # Get 10 random samples of item descriptions
-                samples = df.sample(min(10, len(df)))
-                for _, row in samples.iterrows():
-                    original = row["DESCRIPTION"]
-                    simple = row["SIMPLE_DESCRIPTION"]
-                    f.write(f"Original: {original}\n")
-                    f.write(f"Simple  : {simple}\n\n")
-        
-        # Clean up intermediate files
-        intermediate_files = []
-        if categorized_output != final_path and os.path.exists(categorized_output):
-            intermediate_files.append(categorized_output)
-        if facility_output != final_path and facility_output != categorized_output and os.path.exists(facility_output):
-            intermediate_files.append(facility_output)
-        
-        for file_path in intermediate_files:
-            try:
-                os.remove(file_path)
-                print(f"Removed intermediate file: {file_path}")
-            except Exception as e:
-                print(f"Error removing file {file_path}: {str(e)}")
+        with tracer.span("summary", path=summary_path):
+            summary.write_text(summary_path, original_filename, final_filename, total_time, notes)
+            summary.write_json(summary_json_path, input_file=original_filename, output_file=final_filename,
+                               processing_time=total_time)
+        
+        # Export the job trace next to the other artifacts
+        trace_filename = f"{base_name}_trace.json"
+        trace_path = os.path.join(app.config['RESULTS_FOLDER'], f"{unique_id}_{trace_filename}")
+        tracer.export(trace_path)
+        
+        result_store.register(unique_id, 'data', final_path, final_filename)
+        result_store.register(unique_id, 'summary', summary_path, summary_filename)
+        result_store.register(unique_id, 'summary_json', summary_json_path, summary_json_filename)
+        result_store.register(unique_id, 'trace', trace_path, trace_filename)
+        result_store.register(unique_id, 'rows', rows_path, rows_filename)
         
         # Store results data for the results page
         progress_data['results'] = {
@@ -312,15 +517,20 @@ def process_background_task(processing_id, file_path, unique_id, original_filena
             'output_filename': final_filename,
             'summary_path': normalize_path(summary_path),
             'summary_filename': summary_filename,
+            'trace_path': normalize_path(trace_path),
+            'trace_filename': trace_filename,
             'total_processed': len(df),
+            'generate_descriptions': 'SIMPLE_DESCRIPTION' in df.columns,
             'category_counts': category_counts,
             'facility_counts': facility_counts,
+            'electricity_counts': electricity_counts,
             'processing_time': total_time
         }
 
         
         # Mark processing as complete
         progress_data['status'] = 'Processing complete'
+        progress_data['finished_at'] = time.time()
         progress_data['completed'] = True
         progress_data['completed_items'] = progress_data['total_items']
         
@@ -329,8 +539,16 @@ def process_background_task(processing_id, file_path, unique_id, original_filena
         traceback.print_exc()
         progress_data['error'] = str(e)
         progress_data['status'] = f'Error: {str(e)}'
+        progress_data['finished_at'] = time.time()
         progress_data['completed'] = True
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    """Uploads over MAX_CONTENT_LENGTH"""
+    flash(f"File is too large. The limit is {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB; "
+          "compress it as .csv.gz or .zip to upload more.")
+    return redirect(url_for('index'))
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     """Main page with file upload form"""
@@ -349,26 +567,52 @@ def index():
         if file and allowed_files(file.filename):
             # generate unique file name to avoid collisions
             unique_id = str(uuid.uuid4())
-            original_filename = secure_filename(file.filename)
+            # compressed uploads are stored as the CSV inside them
+            original_filename = stored_csv_name(secure_filename(file.filename))
             filename = f"{unique_id}_{original_filename}"
 
-            # save uploaded file
+            # decompressed and header-checked while the upload arrived; store it and count rows
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+            try:
+                columns, row_count = save_upload(file, file_path, app.config['MAX_UNCOMPRESSED_BYTES'])
+            except UploadError as e:
+                flash(str(e))
+                return redirect(request.url)
+            print(f"Saved upload {filename}: {row_count} rows, {len(columns)} columns")
 
             # store info in session to access in next step
             session['file_path'] = file_path
             session['original_filename'] = original_filename
             session['unique_id'] = unique_id
+            session['row_count'] = row_count
 
             return redirect(url_for('configure'))
         
         else:
-            flash('Invalid file type. Only CSV and Excel files are allowed.')
+            flash('Invalid file type. Only CSV files (optionally as .csv.gz or .zip) are allowed.')
             return redirect(request.url)
             
     return render_template('index.html')
 
+def configure_options(form):
+    """Processing options from the configure form"""
+    return {
+        'preserve_existing': 'preserve_existing' in form,
+        'batch_size': int(form.get('batch_size', 50)),
+        'skip_facility': 'classify_facility' not in form,
+        'skip_descriptions': 'generate_descriptions' not in form,
+        'use_cascade': 'use_cascade' in form,
+        'cascade_threshold': float(form.get('cascade_threshold', DEFAULT_CONFIDENCE_THRESHOLD)),
+        'fused': 'fused' in form,
+        'classify_electricity': 'classify_electricity' in form,
+        'baseline_path': None,
+        'use_catalog': 'use_catalog' in form,
+        'stream': 'stream' in form,
+        'cluster': 'cluster' in form,
+        'preview': int(form.get('preview_size', 200)) if 'preview' in form else 0,
+        'priority': form.get('priority') or None
+    }
+
 @app.route('/configure', methods=['GET', 'POST'])
 def configure():
     """Configure processing options"""
@@ -378,16 +622,24 @@ def configure():
         
     if request.method == 'POST':
         # Collect configuration options
-        preserve_existing = 'preserve_existing' in request.form
-        batch_size = int(request.form.get('batch_size', 50))
-        skip_facility = 'classify_facility' not in request.form
-        skip_descriptions = 'generate_descriptions' not in request.form
+        options = configure_options(request.form)
+        
+        # Optional previous output to reuse results for unchanged rows
+        baseline_file = request.files.get('baseline_file')
+        if baseline_file and baseline_file.filename:
+            if not baseline_file.filename.lower().endswith('.csv'):
+                flash('Previous results must be a processed CSV file.')
+                return redirect(url_for('configure'))
+            options['baseline_path'] = os.path.join(
+                app.config['UPLOAD_FOLDER'],
+                f"{session['unique_id']}_baseline_{secure_filename(baseline_file.filename)}"
+            )
+            baseline_file.save(options['baseline_path'])
+            session['baseline_path'] = options['baseline_path']
         
         # Store config in session
-        session['preserve_existing'] = preserve_existing
-        session['batch_size'] = batch_size
-        session['skip_facility'] = skip_facility
-        session['skip_descriptions'] = skip_descriptions
+        for name in ('preserve_existing', 'batch_size', 'skip_facility', 'skip_descriptions', 'use_cascade'):
+            session[name] = options[name]
         
         # Generate a processing ID for tracking
         processing_id = str(uuid.uuid4())
@@ -398,50 +650,23 @@ def configure():
         unique_id = session['unique_id']
         original_filename = session['original_filename']
         
-        # Initialize progress tracking
-        try:
-            df = pd.read_csv(file_path)
-            total_items = len(df)
-        except:
-            total_items = 100  # Default if we can't read the file
-            
-        # Set up progress tracking
-        processing_tasks[processing_id] = {
-            'total_items': total_items,
-            'completed_items': 0,
-            'status': 'Initializing',
-            'current_step': 'Starting processing',
-            'completed': False,
-            'error': None,
-            'results': None
-        }
-        
-        # Setup options for the background task
-        options = {
-            'preserve_existing': preserve_existing,
-            'batch_size': batch_size,
-            'skip_facility': skip_facility,
-            'skip_descriptions': skip_descriptions
-        }
+        # Rows were counted during upload
+        total_items = session.get('row_count', 100)
         
-        # Start background processing
-        thread = threading.Thread(
-            target=process_background_task,
-            args=(processing_id, file_path, unique_id, original_filename, options)
-        )
-        thread.daemon = True
-        thread.start()
+        # Queue background processing
+        start_job(processing_id, file_path, unique_id, original_filename, options, total_items)
         
         # Redirect to the processing page
         return redirect(url_for('processing'))
     
-    # Preview the CSV for configuration
+    # Preview the CSV for configuration; only the first rows are needed
     try:
-        df = pd.read_csv(session['file_path'])
+        df = pd.read_csv(session['file_path'], nrows=5)
         # Check if category column exists
         has_category = 'Product Category' in df.columns
         has_facility = 'Facility Suitability' in df.columns
         has_descriptions = 'SIMPLE_DESCRIPTION' in df.columns
+        has_electricity = 'Requires Electricity' in df.columns
         
         # Get column names and sample rows for preview
         columns = df.columns.tolist()
@@ -453,11 +678,71 @@ def configure():
                                has_category=has_category,
                                has_facility=has_facility,
                                has_descriptions=has_descriptions,
+                               has_electricity=has_electricity,
+                               cascade_threshold=DEFAULT_CONFIDENCE_THRESHOLD,
+                               priority_columns=[column for column in PRIORITY_COLUMNS if column in columns],
                                filename=session['original_filename'])
     except Exception as e:
         flash(f'Error reading CSV file: {str(e)}')
         return redirect(url_for('index'))
 
+@app.route('/estimate', methods=['POST'])
+def estimate():
+    """
+    Pre-flight estimate for the uploaded file with the options on the configure
+    page: items per step sent to AI, tokens per model and projected time, as
+    JSON. No AI requests are made and the catalog is only read.
+    """
+    if 'file_path' not in session:
+        return jsonify({'error': 'No file uploaded. Please upload a file first.'}), 400
+    try:
+        options = configure_options(request.form)
+        df = read_inventory_csv(session['file_path'])
+        if options['priority']:
+            df = df.loc[priority_order(df, options['priority'])]
+        
+        # Estimating sends no requests, so the classifiers get no client
+        categorizer, classifier, electricity_classifier, description_generator = job_classifiers(None, options)
+        output_columns = job_output_columns(classifier, electricity_classifier, description_generator)
+        
+        reused = {}
+        baseline_file = request.files.get('baseline_file')
+        if baseline_file and baseline_file.filename:
+            reused = apply_baseline(df, pd.read_csv(baseline_file), output_columns)
+        if options['use_catalog']:
+            reused = merge_filled(reused, catalog.lookup(df, output_columns))
+        if options['cluster'] and not options['stream'] and not options['fused']:
+            cluster_columns = [column for column in CLUSTER_COLUMNS if column in output_columns]
+            skip_members(reused, plan_clusters(df, cluster_columns, reused), cluster_columns)
+        
+        fused = None
+        if options['fused']:
+            fused = FusedItemClassifier(
+                None,
+                categorizer=categorizer,
+                facility_classifier=classifier,
+                electricity_classifier=electricity_classifier,
+                description_generator=description_generator
+            )
+        settings = stage_settings(options['batch_size'], options['preserve_existing'])
+        settings['fused'] = {'batch_size': options['batch_size'], 'preserve_existing': options['preserve_existing'],
+                             'pause': 0.1}
+        result = estimate_run(
+            df,
+            categorizer,
+            classifier=classifier,
+            electricity_classifier=electricity_classifier,
+            description_generator=description_generator,
+            reused=reused,
+            settings=settings,
+            fused=fused
+        )
+    except Exception as e:
+        return jsonify({'error': f'Could not estimate this job: {e}'}), 400
+    
+    result['html'] = render_estimate_html(result)
+    return jsonify(result)
+
 @app.route('/processing')
 def processing():
     """Show processing progress with a progress bar"""
@@ -495,6 +780,7 @@ def progress(processing_id):
         })
     
     progress_data = processing_tasks[processing_id]
+    summary = progress_data.get('summary')
     
     # If processing is complete and successful, store results in session
     if progress_data.get('completed', False) and not progress_data.get('error') and progress_data.get('results'):
@@ -505,10 +791,13 @@ def progress(processing_id):
         session['output_filename'] = results['output_filename']
         session['summary_path'] = normalize_path(results['summary_path'])
         session['summary_filename'] = results['summary_filename']
+        session['trace_path'] = normalize_path(results['trace_path'])
+        session['trace_filename'] = results['trace_filename']
         
         # Store other results for display
         session['category_counts'] = results['category_counts']
         session['facility_counts'] = results.get('facility_counts', {})
+        session['electricity_counts'] = results.get('electricity_counts', {})
         session['total_processed'] = results['total_processed']
         session['processing_time'] = results['processing_time']
     
@@ -519,7 +808,12 @@ def progress(processing_id):
         'status': progress_data.get('status', 'Processing'),
         'current_step': progress_data.get('current_step', ''),
         'completed': progress_data.get('completed', False),
-        'error': progress_data.get('error')
+        'error': progress_data.get('error'),
+        'live_summary': summary.render_html() if summary else '',
+        'stage_counts': progress_data.get('stage_counts', {}),
+        'partial_rows': progress_data.get('partial_rows', 0),
+        'priority': progress_data.get('priority'),
+        'value_covered': progress_data.get('value_covered')
     })
 
 @app.route('/process')
@@ -545,6 +839,16 @@ def results():
         processing_id = session['processing_id']
         progress_data = processing_tasks[processing_id]
         
+        # Finished previews show the projected distributions and offer the full run
+        preview = progress_data.get('preview')
+        if progress_data.get('completed', False) and preview:
+            return render_template('preview.html',
+                                original_filename=session['original_filename'],
+                                sample_rows=preview['sample_rows'],
+                                total_rows=preview['total_rows'],
+                                projections=preview['projections'],
+                                processing_time=preview['processing_time'])
+        
         if progress_data.get('completed', False) and progress_data.get('results'):
             results = progress_data['results']
             
@@ -555,9 +859,12 @@ def results():
                                 category_counts=results['category_counts'],
                                 facility_counts=results.get('facility_counts', {}),
                                 classify_facility=len(results.get('facility_counts', {})) > 0,
-                                generate_descriptions='SIMPLE_DESCRIPTION' in pd.read_csv(results['output_path']).columns,
+                                electricity_counts=results.get('electricity_counts', {}),
+                                generate_descriptions=results.get('generate_descriptions', False),
                                 processing_time=results['processing_time'],
-                                summary_filename=results['summary_filename'])
+                                summary_filename=results['summary_filename'],
+                                has_trace=os.path.exists(results['trace_path']),
+                                has_browser=result_store.get(session['unique_id'], 'rows') is not None)
     
     # If we don't have a processing task but have session data (for backward compatibility)
     if 'output_path' in session and os.path.exists(session['output_path']):
@@ -579,6 +886,14 @@ def results():
                 facility_counts = df["Facility Suitability"].value_counts().to_dict()
             else:
                 facility_counts = {}
+            
+            # Same for the electricity requirement distribution
+            if 'electricity_counts' in session:
+                electricity_counts = session['electricity_counts']
+            elif 'Requires Electricity' in df.columns:
+                electricity_counts = df["Requires Electricity"].value_counts().to_dict()
+            else:
+                electricity_counts = {}
                 
             return render_template('results.html',
                                 original_filename=session.get('original_filename', 'Unknown file'),
@@ -587,9 +902,12 @@ def results():
                                 category_counts=category_counts,
                                 facility_counts=facility_counts,
                                 classify_facility=classify_facility,
+                                electricity_counts=electricity_counts,
                                 generate_descriptions=generate_descriptions,
                                 processing_time=session.get('processing_time', 0),
-                                summary_filename=session.get('summary_filename', 'summary.txt'))
+                                summary_filename=session.get('summary_filename', 'summary.txt'),
+                                has_trace='trace_path' in session and os.path.exists(session['trace_path']),
+                                has_browser=result_store.get(session.get('unique_id'), 'rows') is not None)
         except Exception as e:
             flash(f'Error loading results: {str(e)}')
             return redirect(url_for('index'))
@@ -598,79 +916,93 @@ def results():
     flash('No processing results available')
     return redirect(url_for('index'))
 
+def open_row_index(job_id):
+    """RowIndex of a finished job, or None if it has none"""
+    artifact = result_store.get(job_id, 'rows')
+    return RowIndex(artifact['path']) if artifact else None
+
+def row_query(index, values):
+    """Run a results browser query from request arguments"""
+    return index.query(
+        filters={'Product Category': values.get('category'), 'Facility Suitability': values.get('facility')},
+        needs_review=values.get('review', '').lower() in ('1', 'true', 'yes', 'on'),
+        text=values.get('q'),
+        page=values.get('page', 1, type=int),
+        per_page=values.get('per_page', 50, type=int)
+    )
+
+@app.route('/preview/launch', methods=['POST'])
+def launch_full_job():
+    """Start the full job for the preview shown on the results page"""
+    processing_id = str(uuid.uuid4())
+    if not launch_preview(session.get('processing_id'), processing_id):
+        flash('No finished preview to continue')
+        return redirect(url_for('index'))
+    session['processing_id'] = processing_id
+    session['unique_id'] = processing_id
+    return redirect(url_for('processing'))
+
+@app.route('/results/rows')
+def browse_results():
+    """Page through the processed rows with filters and description search"""
+    index = open_row_index(session.get('unique_id'))
+    if index is None:
+        flash('No processed rows to browse')
+        return redirect(url_for('index'))
+    
+    result = row_query(index, request.args)
+    return render_template('browse.html',
+                           output_filename=session.get('output_filename', ''),
+                           facets=index.facets(),
+                           args=request.args,
+                           **result)
+
 @app.route('/download/<file_type>')
 def download(file_type):
-    """Download the processed file or summary report"""
+    """Download the processed file, summary report or trace"""
+    if file_type not in ('data', 'summary', 'summary_json', 'trace', 'partial'):
+        flash('Invalid download type')
+        return redirect(url_for('index'))
+    
     try:
-        if file_type == 'data':
-            if 'output_path' not in session:
-                flash('No processed file available for download')
-                return redirect(url_for('index'))
-            
-            # Get the path from session
-            output_path = session['output_path']
-            output_filename = session['output_filename']
-            
-            # Try different path variations to find the file
-            possible_paths = [
-                output_path,  # Original path
-                normalize_path(output_path),  # Normalized version
-                os.path.join(app.config['RESULTS_FOLDER'], os.path.basename(output_path))  # Just the filename in results folder
-            ]
-            
-            # Try each path
-            for path in possible_paths:
-                if os.path.exists(path):
-                    return send_file(path, as_attachment=True, download_name=output_filename)
-            
-            # Additional recovery attempt - look for any file with matching unique_id
-            if 'unique_id' in session:
-                unique_id = session['unique_id']
-                for filename in os.listdir(app.config['RESULTS_FOLDER']):
-                    if unique_id in filename and filename.endswith('_processed.csv'):
-                        found_path = os.path.join(app.config['RESULTS_FOLDER'], filename)
-                        return send_file(found_path, as_attachment=True, download_name=output_filename)
-            
-            # If we get here, file not found
-            flash('File not found. It may have been deleted, moved, or not properly saved during processing.')
-            return redirect(url_for('index'))
-            
-        elif file_type == 'summary':
-            if 'summary_path' not in session:
-                flash('No summary report available for download')
-                return redirect(url_for('index'))
-            
-            summary_path = session['summary_path']
-            summary_filename = session['summary_filename']
-            
-            possible_paths = [
-                summary_path,
-                normalize_path(summary_path),
-                os.path.join(app.config['RESULTS_FOLDER'], os.path.basename(summary_path))
-            ]
-            
-            for path in possible_paths:
-                if os.path.exists(path):
-                    return send_file(path, as_attachment=True, download_name=summary_filename)
-            
-            # Additional recovery attempt for summary file
-            if 'unique_id' in session:
-                unique_id = session['unique_id']
-                for filename in os.listdir(app.config['RESULTS_FOLDER']):
-                    if unique_id in filename and filename.endswith('_summary.txt'):
-                        found_path = os.path.join(app.config['RESULTS_FOLDER'], filename)
-                        return send_file(found_path, as_attachment=True, download_name=summary_filename)
-            
-            flash('Summary file not found. It may have been deleted, moved, or not properly saved during processing.')
-            return redirect(url_for('index'))
-        
-        else:
-            flash('Invalid download type')
-            return redirect(url_for('index'))
-            
+        response = send_artifact(session.get('unique_id'), file_type)
     except Exception as e:
         flash(f'Error downloading file: {str(e)}')
         return redirect(url_for('index'))
+    if response is None:
+        flash('File not found. It may have been deleted, moved, or not properly saved during processing.')
+        return redirect(url_for('index'))
+    return response
+
+def send_artifact(job_id, kind):
+    """
+    Response sending a job artifact, or None if it does not exist. Text files are
+    sent compressed when the client accepts it; ETag and Range requests are
+    supported so interrupted downloads can resume.
+    """
+    artifact = result_store.get(job_id, kind)
+    if artifact is None:
+        return None
+    
+    path = artifact['path']
+    mimetype = mimetypes.guess_type(artifact['download_name'])[0] or 'application/octet-stream'
+    accepted = [encoding for encoding, quality in request.accept_encodings if quality > 0]
+    encoding = result_store.choose_encoding(path, accepted)
+    if encoding:
+        path = result_store.encoded_path(path, encoding)
+    
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=artifact['download_name'],
+        conditional=True,
+        etag=True
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 @app.route('/cleanup', methods=['POST'])
 def cleanup():
@@ -682,17 +1014,17 @@ def cleanup():
         except:
             pass
     
-    # Clean up output file
-    if 'output_path' in session and os.path.exists(session['output_path']):
+    # Clean up result files and their compressed copies
+    if 'unique_id' in session:
         try:
-            os.remove(session['output_path'])
+            result_store.remove(session['unique_id'])
         except:
             pass
     
-    # Clean up summary file
-    if 'summary_path' in session and os.path.exists(session['summary_path']):
+    # Clean up baseline file
+    if 'baseline_path' in session and os.path.exists(session['baseline_path']):
         try:
-            os.remove(session['summary_path'])
+            os.remove(session['baseline_path'])
         except:
             pass
     
@@ -706,5 +1038,210 @@ def cleanup():
     flash('Files cleaned up successfully')
     return redirect(url_for('index'))
 
+# JSON API for scripted submission. Jobs are addressed by id instead of the
+# session cookie, so one client can run many jobs at once.
+
+API_ARTIFACTS = ('data', 'summary', 'summary_json', 'trace', 'partial')
+
+def api_options(values):
+    """Processing options from an API request, with the configure page defaults"""
+    def flag(name, default):
+        value = values.get(name, default)
+        if isinstance(value, str):
+            return value.lower() in ('1', 'true', 'yes', 'on')
+        return bool(value)
+    
+    return {
+        'preserve_existing': flag('preserve_existing', True),
+        'batch_size': int(values.get('batch_size', 50)),
+        'skip_facility': not flag('classify_facility', False),
+        'skip_descriptions': not flag('generate_descriptions', False),
+        'use_cascade': flag('use_cascade', True),
+        'cascade_threshold': float(values.get('cascade_threshold', DEFAULT_CONFIDENCE_THRESHOLD)),
+        'fused': flag('fused', False),
+        'classify_electricity': flag('classify_electricity', False),
+        'baseline_path': None,
+        'use_catalog': flag('use_catalog', True),
+        'stream': flag('stream', False),
+        'stream_chunk_size': int(values.get('stream_chunk_size', 100)),
+        'cluster': flag('cluster', False),
+        'preview': int(values.get('preview', 0)),
+        'priority': values.get('priority') or None
+    }
+
+def job_status(job_id):
+    """Status of a job as JSON-serializable data, or None if unknown"""
+    task = processing_tasks.get(job_id)
+    if task is None:
+        # Job state may have been evicted while its results are still on disk
+        artifacts = result_store.artifacts(job_id)
+        if not artifacts:
+            return None
+        return {
+            'job_id': job_id,
+            'status': 'Processing complete',
+            'completed': True,
+            'error': None,
+            'artifacts': {kind: url_for('api_artifact', job_id=job_id, kind=kind) for kind in artifacts}
+        }
+    
+    status = {
+        'job_id': job_id,
+        'batch_id': task.get('batch_id'),
+        'filename': task.get('original_filename'),
+        'status': task.get('status'),
+        'current_step': task.get('current_step'),
+        'completed_items': task.get('completed_items', 0),
+        'total_items': task.get('total_items'),
+        'completed': task.get('completed', False),
+        'error': task.get('error')
+    }
+    if task.get('priority'):
+        status['priority'] = task['priority']
+        status['value_covered'] = task.get('value_covered')
+    summary = task.get('summary')
+    if summary:
+        status['summary'] = summary.to_dict()
+    preview = task.get('preview')
+    if preview:
+        status['preview'] = {key: preview[key] for key in ('sample_rows', 'total_rows', 'projections')}
+        status['launch_url'] = url_for('api_launch', job_id=job_id)
+    results = task.get('results')
+    if results:
+        status['processing_time'] = results['processing_time']
+        status['artifacts'] = {kind: url_for('api_artifact', job_id=job_id, kind=kind)
+                               for kind in result_store.artifacts(job_id)}
+    return status
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit():
+    """
+    Queue one job per uploaded file (multipart field "file", repeatable).
+    Options go in an "options" field as a JSON object, e.g.
+    {"classify_facility": true, "generate_descriptions": false}.
+    """
+    files = [file for file in request.files.getlist('file') if file.filename]
+    if not files:
+        return jsonify({'error': 'No files uploaded; send one or more "file" fields.'}), 400
+    
+    try:
+        options = api_options(json.loads(request.form.get('options') or '{}'))
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': f'Invalid options: {e}'}), 400
+    
+    batch_id = str(uuid.uuid4())
+    jobs = []
+    for file in files:
+        if not allowed_files(file.filename):
+            jobs.append({'filename': file.filename, 'error': 'Only .csv, .csv.gz and .zip files are allowed.'})
+            continue
+        
+        job_id = str(uuid.uuid4())
+        original_filename = stored_csv_name(secure_filename(file.filename))
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{original_filename}")
+        try:
+            _, row_count = save_upload(file, file_path, app.config['MAX_UNCOMPRESSED_BYTES'])
+        except UploadError as e:
+            jobs.append({'filename': file.filename, 'error': str(e)})
+            continue
+        
+        start_job(job_id, file_path, job_id, original_filename, dict(options), row_count, batch_id=batch_id)
+        jobs.append({
+            'job_id': job_id,
+            'filename': original_filename,
+            'rows': row_count,
+            'status_url': url_for('api_job', job_id=job_id),
+            'events_url': url_for('api_job_events', job_id=job_id)
+        })
+    
+    queued = [job for job in jobs if 'job_id' in job]
+    body = {'batch_id': batch_id if queued else None, 'jobs': jobs}
+    if queued:
+        body['batch_url'] = url_for('api_batch', batch_id=batch_id)
+    return jsonify(body), 202 if queued else 400
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    """Current status of a job"""
+    status = job_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/launch', methods=['POST'])
+def api_launch(job_id):
+    """Queue the full run of a finished preview job as a new job"""
+    new_job_id = str(uuid.uuid4())
+    if not launch_preview(job_id, new_job_id):
+        return jsonify({'error': 'Job is not a finished preview'}), 409
+    return jsonify({
+        'job_id': new_job_id,
+        'status_url': url_for('api_job', job_id=new_job_id),
+        'events_url': url_for('api_job_events', job_id=new_job_id)
+    }), 202
+
+@app.route('/api/jobs/<job_id>/events')
+def api_job_events(job_id):
+    """Server-sent events with the job status, once per second until it completes"""
+    if job_status(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def events():
+        while True:
+            status = job_status(job_id)
+            if status is None:
+                return
+            yield f"data: {json.dumps(status, default=str)}\n\n"
+            if status['completed']:
+                return
+            time.sleep(1)
+    
+    return app.response_class(stream_with_context(events()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/jobs/<job_id>/artifacts/<kind>')
+def api_artifact(job_id, kind):
+    """Download a job artifact: data, summary, summary_json or trace"""
+    if kind not in API_ARTIFACTS:
+        return jsonify({'error': f'Unknown artifact; use one of {", ".join(API_ARTIFACTS)}'}), 404
+    response = send_artifact(job_id, kind)
+    if response is None:
+        return jsonify({'error': 'Artifact not found'}), 404
+    return response
+
+@app.route('/api/jobs/<job_id>/rows')
+def api_rows(job_id):
+    """
+    One page of a finished job's rows. Query arguments: category, facility,
+    review (only rows needing review), q (description search), page, per_page.
+    """
+    index = open_row_index(job_id)
+    if index is None:
+        return jsonify({'error': 'Job has no processed rows'}), 404
+    result = row_query(index, request.args)
+    result['rows'] = [dict(zip(result['columns'], row)) for row in result['rows']]
+    return jsonify(result)
+
+@app.route('/api/batches/<batch_id>')
+def api_batch(batch_id):
+    """
+    Status of every job submitted in one request. Jobs whose state and results
+    the janitor has removed are listed as expired.
+    """
+    job_ids = result_store.batch_jobs(batch_id)
+    if not job_ids:
+        return jsonify({'error': 'Batch not found'}), 404
+    jobs = [job_status(job_id) or {'job_id': job_id, 'status': 'expired', 'completed': True, 'error': None}
+            for job_id in job_ids]
+    return jsonify({
+        'batch_id': batch_id,
+        'completed': all(job['completed'] for job in jobs),
+        'jobs': jobs
+    })
+
+@app.route('/janitor')
+def janitor_status():
+    """Retention settings and how much the janitor has reclaimed, as JSON"""
+    return jsonify(janitor.status())
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
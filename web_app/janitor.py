@@ -0,0 +1,153 @@
+import os
+import re
+import threading
+import time
+
+# Uploads and results are named "<job uuid>_<original name>..."
+JOB_FILE_PATTERN = re.compile(r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})_")
+
+
+class Janitor:
+    """
+    Background sweeper for a long-running server. Evicts finished job state from
+    memory after task_ttl seconds, deletes a job's uploads and results after
+    file_ttl seconds, and deletes the oldest jobs' files while the folders use
+    more than disk_quota bytes. Files of jobs that are still running are never
+    touched.
+    """
+
+    def __init__(self, tasks, result_store, folders, task_ttl, file_ttl, disk_quota=None, interval=600):
+        self.tasks = tasks
+        self.result_store = result_store
+        self.folders = list(folders)
+        self.task_ttl = task_ttl
+        self.file_ttl = file_ttl
+        self.disk_quota = disk_quota
+        self.interval = interval
+        self._lock = threading.Lock()
+
+        # Cumulative counters, reported by status()
+        self.totals = {'sweeps': 0, 'evicted_tasks': 0, 'deleted_jobs': 0, 'deleted_files': 0, 'reclaimed_bytes': 0}
+        self.last_sweep = None
+
+    def start(self):
+        """Run sweep() every interval seconds on a daemon thread"""
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Janitor sweep failed: {e}")
+
+        thread = threading.Thread(target=loop, name="janitor", daemon=True)
+        thread.start()
+        return thread
+
+    def _active_jobs(self):
+        """
+        Job ids whose files are still needed: unfinished jobs and the jobs whose
+        uploads they read (a full run launched from a preview reads the preview's file)
+        """
+        active = set()
+        for task in list(self.tasks.values()):
+            if task.get('completed'):
+                continue
+            active.add(task.get('unique_id'))
+            for path in task.get('input_paths', []):
+                match = JOB_FILE_PATTERN.match(os.path.basename(path))
+                if match:
+                    active.add(match.group(1))
+        return active
+
+    def _job_files(self):
+        """{job id: [(path, size, mtime)]} for every job file in the managed folders"""
+        jobs = {}
+        for folder in self.folders:
+            if not os.path.isdir(folder):
+                continue
+            for entry in os.scandir(folder):
+                match = JOB_FILE_PATTERN.match(entry.name)
+                if not match or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                jobs.setdefault(match.group(1), []).append((entry.path, stat.st_size, stat.st_mtime))
+        return jobs
+
+    def _delete_job(self, job_id, files):
+        """Delete all files of a job and drop it from the result index. Returns bytes freed."""
+        freed = 0
+        count = 0
+        for path, size, _ in files:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                freed += size
+                count += 1
+        freed += self.result_store.remove(job_id)
+        self.totals['deleted_files'] += count
+        self.totals['deleted_jobs'] += 1
+        return freed
+
+    def sweep(self, now=None):
+        """Run one eviction pass and return what it reclaimed"""
+        now = now or time.time()
+        with self._lock:
+            # 1. Job state of finished jobs
+            evicted = 0
+            for processing_id, task in list(self.tasks.items()):
+                finished_at = task.get('finished_at')
+                if task.get('completed') and finished_at and now - finished_at > self.task_ttl:
+                    self.tasks.pop(processing_id, None)
+                    evicted += 1
+
+            active = self._active_jobs()
+            jobs = {job_id: files for job_id, files in self._job_files().items() if job_id not in active}
+
+            # 2. Expired uploads and results
+            reclaimed = 0
+            deleted_jobs = 0
+            for job_id, files in list(jobs.items()):
+                if now - max(mtime for _, _, mtime in files) > self.file_ttl:
+                    reclaimed += self._delete_job(job_id, jobs.pop(job_id))
+                    deleted_jobs += 1
+
+            # 3. Oldest jobs first while over the disk quota
+            if self.disk_quota is not None:
+                used = sum(size for files in jobs.values() for _, size, _ in files)
+                for job_id, files in sorted(jobs.items(), key=lambda item: max(mtime for _, _, mtime in item[1])):
+                    if used <= self.disk_quota:
+                        break
+                    freed = self._delete_job(job_id, files)
+                    used -= freed
+                    reclaimed += freed
+                    deleted_jobs += 1
+
+            self.totals['sweeps'] += 1
+            self.totals['evicted_tasks'] += evicted
+            self.totals['reclaimed_bytes'] += reclaimed
+            self.last_sweep = {
+                'time': now,
+                'evicted_tasks': evicted,
+                'deleted_jobs': deleted_jobs,
+                'reclaimed_bytes': reclaimed,
+            }
+
+        if evicted or deleted_jobs:
+            print(f"Janitor: evicted {evicted} finished jobs from memory, deleted files of {deleted_jobs} jobs, "
+                  f"reclaimed {reclaimed / (1024 * 1024):.1f} MB")
+        return self.last_sweep
+
+    def status(self):
+        """Settings, cumulative counters and the result of the last sweep"""
+        return {
+            'task_ttl': self.task_ttl,
+            'file_ttl': self.file_ttl,
+            'disk_quota': self.disk_quota,
+            'interval': self.interval,
+            'tracked_tasks': len(self.tasks),
+            'totals': dict(self.totals),
+            'last_sweep': self.last_sweep,
+        }
@@ -0,0 +1,138 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Artifacts smaller than this are sent as they are
+MIN_COMPRESS_BYTES = 1024
+
+# Content types that compress well
+COMPRESSIBLE_EXTENSIONS = {'.csv', '.txt', '.json'}
+
+# Encoding suffixes of cached compressed copies, preferred first
+ENCODINGS = {'zstd': '.zst', 'gzip': '.gz'} if zstandard else {'gzip': '.gz'}
+
+
+class ResultStore:
+    """
+    Index of the artifacts each job produced (job id -> kind -> file), so downloads
+    are a primary-key lookup instead of a scan of the results folder. Also keeps
+    compressed copies of large text artifacts for clients that accept them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    job_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    download_name TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, kind)
+                )
+            """)
+            # Jobs submitted together, kept after their state and files are gone
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS batch_jobs (
+                    batch_id TEXT NOT NULL,
+                    job_id TEXT NOT NULL,
+                    PRIMARY KEY (batch_id, job_id)
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def register(self, job_id, kind, path, download_name):
+        """Record an artifact (e.g. kind "data", "summary", "trace") for a job"""
+        path = os.path.abspath(path)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, path, download_name, os.path.getsize(path), time.time())
+            )
+
+    def get(self, job_id, kind):
+        """Artifact record as a dict, or None if unknown or deleted from disk"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT path, download_name, size, created_at FROM artifacts WHERE job_id = ? AND kind = ?",
+                (job_id, kind)
+            ).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            return None
+        return {'path': row[0], 'download_name': row[1], 'size': row[2], 'created_at': row[3]}
+
+    def artifacts(self, job_id):
+        """All artifact paths of a job keyed by kind"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT kind, path FROM artifacts WHERE job_id = ?", (job_id,)).fetchall()
+        return dict(rows)
+
+    def add_to_batch(self, batch_id, job_id):
+        """Record that job_id was submitted as part of batch_id"""
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO batch_jobs VALUES (?, ?)", (batch_id, job_id))
+
+    def batch_jobs(self, batch_id):
+        """Job ids of a batch in submission order"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT job_id FROM batch_jobs WHERE batch_id = ? ORDER BY rowid", (batch_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def remove(self, job_id):
+        """Delete a job's artifacts and their compressed copies. Returns bytes freed."""
+        freed = 0
+        for path in self.artifacts(job_id).values():
+            for candidate in [path] + [path + suffix for suffix in ('.gz', '.zst')]:
+                if os.path.exists(candidate):
+                    freed += os.path.getsize(candidate)
+                    os.remove(candidate)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM artifacts WHERE job_id = ?", (job_id,))
+        return freed
+
+    def choose_encoding(self, path, accepted):
+        """
+        Best content encoding for sending path to a client that accepts the given
+        encodings, or None to send the file as it is
+        """
+        if os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return None
+        if os.path.getsize(path) < MIN_COMPRESS_BYTES:
+            return None
+        for encoding in ENCODINGS:
+            if encoding in accepted:
+                return encoding
+        return None
+
+    def encoded_path(self, path, encoding):
+        """
+        Path of the compressed copy of an artifact, created on first use. The copy
+        is written to a temporary file first so concurrent downloads never see a
+        partial file.
+        """
+        encoded = path + ENCODINGS[encoding]
+        if os.path.exists(encoded) and os.path.getmtime(encoded) >= os.path.getmtime(path):
+            return encoded
+
+        partial = f"{encoded}.{os.getpid()}.{time.time_ns()}.part"
+        with open(path, 'rb') as src:
+            if encoding == 'zstd':
+                with open(partial, 'wb') as dst:
+                    zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+            else:
+                with gzip.open(partial, 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst)
+        os.replace(partial, encoded)
+        return encoded
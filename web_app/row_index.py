@@ -0,0 +1,131 @@
+import math
+import re
+import sqlite3
+
+# Columns that can be filtered on, and the values that mark a row for review
+FILTER_COLUMNS = ["Product Category", "Facility Suitability"]
+REVIEW_COLUMNS = ["Product Category", "Facility Suitability", "Requires Electricity"]
+REVIEW_VALUE = "Needs Review"
+SEARCH_COLUMN = "DESCRIPTION"
+
+INSERT_CHUNK_SIZE = 10000
+MAX_PER_PAGE = 500
+
+
+class RowIndex:
+    """
+    Read-only SQLite copy of a job's output for browsing it page by page. The
+    filter columns and a needs-review flag are indexed and DESCRIPTION has a
+    full-text index (plain LIKE matching where SQLite lacks FTS5), so a page
+    of a large output is found without reading the whole file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            self.columns = [name for _, name in conn.execute("SELECT position, name FROM columns ORDER BY position")]
+            self.fts = conn.execute("SELECT value FROM meta WHERE key = 'fts'").fetchone()[0] == "1"
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @classmethod
+    def build(cls, path, df):
+        """Write df to a new index database at path and return it opened"""
+        columns = [str(column) for column in df.columns]
+        names = [f"c{position}" for position in range(len(columns))]
+
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE columns (position INTEGER PRIMARY KEY, name TEXT)")
+            conn.executemany("INSERT INTO columns VALUES (?, ?)", enumerate(columns))
+            conn.execute(f"CREATE TABLE rows (id INTEGER PRIMARY KEY, review INTEGER NOT NULL, "
+                         f"{', '.join(f'{name} TEXT' for name in names)})")
+
+            placeholders = ", ".join("?" * (len(names) + 1))
+            for start in range(0, len(df), INSERT_CHUNK_SIZE):
+                chunk = df.iloc[start:start + INSERT_CHUNK_SIZE].astype(object)
+                chunk = chunk.where(chunk.notna(), None)
+                values = chunk.to_numpy().tolist()
+                flags = (chunk[[column for column in REVIEW_COLUMNS if column in columns]] == REVIEW_VALUE).any(axis=1)
+                conn.executemany(f"INSERT INTO rows (review, {', '.join(names)}) VALUES ({placeholders})",
+                                 ([int(flag)] + [None if value is None else str(value) for value in row]
+                                  for flag, row in zip(flags.tolist(), values)))
+
+            conn.execute("CREATE INDEX rows_review ON rows (review)")
+            for column in FILTER_COLUMNS:
+                if column in columns:
+                    name = names[columns.index(column)]
+                    conn.execute(f"CREATE INDEX rows_{name} ON rows ({name})")
+
+            fts = SEARCH_COLUMN in columns and _fts5_available(conn)
+            if fts:
+                name = names[columns.index(SEARCH_COLUMN)]
+                conn.execute("CREATE VIRTUAL TABLE description_fts USING fts5(description, content='')")
+                conn.execute(f"INSERT INTO description_fts (rowid, description) SELECT id, {name} FROM rows")
+            conn.execute("INSERT INTO meta VALUES ('fts', ?)", ("1" if fts else "0",))
+            conn.commit()
+        finally:
+            conn.close()
+        return cls(path)
+
+    def _column(self, column):
+        return f"c{self.columns.index(column)}"
+
+    def facets(self):
+        """Distinct values of each filter column, for filter drop-downs"""
+        facets = {}
+        with self._connect() as conn:
+            for column in FILTER_COLUMNS:
+                if column in self.columns:
+                    name = self._column(column)
+                    facets[column] = [value for (value,) in conn.execute(
+                        f"SELECT DISTINCT {name} FROM rows WHERE {name} IS NOT NULL ORDER BY {name}")]
+        return facets
+
+    def query(self, filters=None, needs_review=False, text=None, page=1, per_page=50):
+        """
+        One page of rows matching every filter ({column: value}), the review flag
+        and the search text. Returns {'columns', 'rows', 'total', 'page', 'pages'}.
+        """
+        where, params = [], []
+        for column, value in (filters or {}).items():
+            if column in FILTER_COLUMNS and column in self.columns and value:
+                where.append(f"{self._column(column)} = ?")
+                params.append(value)
+        if needs_review:
+            where.append("review = 1")
+        words = re.findall(r"\w+", text or "")
+        if words and SEARCH_COLUMN in self.columns:
+            if self.fts:
+                # Every word must appear, the last one may be incomplete
+                match = " ".join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+                where.append("id IN (SELECT rowid FROM description_fts WHERE description_fts MATCH ?)")
+                params.append(match.strip())
+            else:
+                for word in words:
+                    where.append(f"{self._column(SEARCH_COLUMN)} LIKE ?")
+                    params.append(f"%{word}%")
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+        per_page = max(1, min(int(per_page), MAX_PER_PAGE))
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM rows {clause}", params).fetchone()[0]
+            pages = max(1, math.ceil(total / per_page))
+            page = max(1, min(int(page), pages))
+            names = ", ".join(f"c{position}" for position in range(len(self.columns)))
+            rows = conn.execute(f"SELECT {names} FROM rows {clause} ORDER BY id LIMIT ? OFFSET ?",
+                                params + [per_page, (page - 1) * per_page]).fetchall()
+        return {'columns': self.columns, 'rows': rows, 'total': total, 'page': page, 'pages': pages}
+
+
+def _fts5_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
@@ -0,0 +1,252 @@
+import csv
+import gzip
+import io
+import os
+import tempfile
+import zipfile
+import zlib
+
+# Columns every inventory file must have (same as scripts/read_csv.py)
+REQUIRED_COLUMNS = ["ITEM_NO", "DESCRIPTION", "VENDOR_NAME"]
+
+CHUNK_SIZE = 1024 * 1024
+
+# Longest header line accepted before the first line break arrives
+MAX_HEADER_BYTES = 64 * 1024
+
+
+class UploadError(ValueError):
+    """The uploaded file is not a usable inventory CSV"""
+
+
+class _CopyingReader(io.RawIOBase):
+    """Readable stream that writes everything read from source to sink"""
+
+    def __init__(self, source, sink, max_bytes=None):
+        self.source = source
+        self.sink = sink
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.source.read(len(buffer))
+        if not data:
+            return 0
+        self.bytes_read += len(data)
+        if self.max_bytes is not None and self.bytes_read > self.max_bytes:
+            raise UploadError(f"Uncompressed file is larger than {self.max_bytes // (1024 * 1024)} MB.")
+        self.sink.write(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def upload_format(filename):
+    """"csv.gz", "zip", "csv" or None for an unsupported file name"""
+    name = filename.lower()
+    if name.endswith(".csv.gz"):
+        return "csv.gz"
+    if name.endswith(".zip"):
+        return "zip"
+    if name.endswith(".csv"):
+        return "csv"
+    return None
+
+
+def stored_csv_name(filename):
+    """Name of the plain CSV an upload is saved as ("stock.csv.gz" -> "stock.csv")"""
+    for suffix in (".csv.gz", ".zip"):
+        if filename.lower().endswith(suffix):
+            return filename[:-len(suffix)] + ".csv"
+    return filename
+
+
+def _open_csv(stream, kind):
+    """Binary stream of the CSV content inside an upload"""
+    if kind == "csv.gz":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if kind == "zip":
+        try:
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile:
+            raise UploadError("The ZIP file is damaged or not a ZIP file.")
+        members = [info for info in archive.infolist()
+                   if info.filename.lower().endswith(".csv") and not info.filename.startswith("__MACOSX")]
+        if len(members) != 1:
+            raise UploadError("The ZIP file must contain exactly one CSV file.")
+        return archive.open(members[0])
+    return stream
+
+
+def check_header(line):
+    """Column names of a CSV header line (bytes); UploadError if required ones are missing"""
+    header = next(csv.reader([line.decode("utf-8-sig").rstrip("\r\n")]), None)
+    if not header or not any(column.strip() for column in header):
+        raise UploadError("The file is empty.")
+    columns = [column.strip() for column in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise UploadError(f"Missing required columns: {', '.join(missing)}")
+    return columns
+
+
+class UploadSink:
+    """
+    File werkzeug writes an uploaded file into while the request body arrives
+    (the web app's request class returns one as the file stream). A .csv or .csv.gz upload is decompressed into a
+    temporary CSV as its chunks arrive and the header is checked on the first
+    line; after a bad header the rest of the body is discarded, not written.
+    ZIP archives keep their directory at the end, so they are spooled as they
+    are and unpacked by save_upload.
+    """
+
+    def __init__(self, filename, folder, max_bytes=None):
+        self.kind = upload_format(filename or "")
+        self.max_bytes = max_bytes
+        self.columns = None
+        self.error = None
+        self.bytes_written = 0
+        self._head = b""
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if self.kind == "csv.gz" else None
+        fd, self.path = tempfile.mkstemp(suffix=".part", dir=folder)
+        self.file = os.fdopen(fd, "w+b")
+
+    def write(self, data):
+        if self.error is None:
+            try:
+                self._write(bytes(data))
+            except (UploadError, zlib.error, UnicodeDecodeError, csv.Error) as e:
+                self._fail(e)
+        return len(data)
+
+    def _fail(self, e):
+        self.error = e if isinstance(e, UploadError) else UploadError(f"Could not read the uploaded file: {e}")
+        self.file.truncate(0)
+
+    def _decompress(self, data):
+        out = self._decompressor.decompress(data)
+        # Concatenated gzip members, as gzip.GzipFile reads them
+        while self._decompressor.eof and self._decompressor.unused_data:
+            rest = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            out += self._decompressor.decompress(rest)
+        return out
+
+    def _write(self, data):
+        if self.kind == "zip":
+            self.file.write(data)
+            return
+        if self._decompressor:
+            data = self._decompress(data)
+        self.bytes_written += len(data)
+        if self.max_bytes is not None and self.bytes_written > self.max_bytes:
+            raise UploadError(f"Uncompressed file is larger than {self.max_bytes // (1024 * 1024)} MB.")
+        if self.columns is None:
+            self._head += data
+            if b"\n" in self._head:
+                self.columns = check_header(self._head.split(b"\n", 1)[0])
+            elif len(self._head) > MAX_HEADER_BYTES:
+                raise UploadError("The header line is too long.")
+        self.file.write(data)
+
+    def finish(self):
+        """Called once the upload is complete; raises the first problem found"""
+        if self.error is None and self.kind != "zip":
+            try:
+                if self._decompressor and not self._decompressor.eof:
+                    raise UploadError("Could not read the uploaded file: the gzip stream is truncated.")
+                if self.columns is None:
+                    self.columns = check_header(self._head)
+            except (UploadError, UnicodeDecodeError, csv.Error) as e:
+                self._fail(e)
+        if self.error is not None:
+            raise self.error
+        self.file.flush()
+
+    # File interface werkzeug's FileStorage uses
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def readline(self, size=-1):
+        return self.file.readline(size)
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _count_rows(path):
+    """Data rows of a saved CSV, with the csv module so quoted newlines are handled"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return sum(1 for row in reader if row)
+
+
+def _save_streamed(sink, path, max_bytes):
+    """save_upload for a file already decompressed and checked by an UploadSink"""
+    sink.finish()
+    if sink.kind == "zip":
+        # The archive could only be opened once complete
+        sink.seek(0)
+        return _save_stream(sink.file, "zip", path, max_bytes)
+    sink.file.close()
+    os.replace(sink.path, path)
+    try:
+        return sink.columns, _count_rows(path)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        os.remove(path)
+        raise UploadError(f"Could not read the uploaded file: {e}")
+
+
+def save_upload(file, path, max_bytes=None):
+    """
+    Write an uploaded .csv, .csv.gz or .zip to path as a plain CSV and return
+    (columns, row_count). Uploads received into an UploadSink were already
+    decompressed and header-checked while the request body arrived; other file
+    objects are decompressed chunk by chunk here, the header checked on the
+    first chunk so a file with the wrong columns fails before the rest is written.
+    """
+    kind = upload_format(file.filename)
+    if kind is None:
+        raise UploadError("Only .csv, .csv.gz and .zip files are allowed.")
+    if isinstance(file.stream, UploadSink):
+        return _save_streamed(file.stream, path, max_bytes)
+    return _save_stream(file.stream, kind, path, max_bytes)
+
+
+def _save_stream(stream, kind, path, max_bytes):
+    """Decompress, check and count a readable upload stream into path"""
+    try:
+        with open(path, "wb") as out:
+            source = _open_csv(stream, kind)
+            copying = _CopyingReader(source, out, max_bytes)
+            text = io.TextIOWrapper(io.BufferedReader(copying, CHUNK_SIZE), encoding="utf-8-sig", newline="")
+            reader = csv.reader(text)
+
+            header = next(reader, None)
+            if not header:
+                raise UploadError("The file is empty.")
+            columns = [column.strip() for column in header]
+            missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+            if missing:
+                raise UploadError(f"Missing required columns: {', '.join(missing)}")
+
+            row_count = sum(1 for row in reader if row)
+    except (UploadError, OSError, EOFError, UnicodeDecodeError, csv.Error, zipfile.BadZipFile) as e:
+        if os.path.exists(path):
+            os.remove(path)
+        if isinstance(e, UploadError):
+            raise
+        raise UploadError(f"Could not read the uploaded file: {e}")
+
+    return columns, row_count